@@ -1,6 +1,6 @@
 from django.http import JsonResponse
 
-from ses_intelligence.runtime_state import get_behavior_graph
+from ses_intelligence.runtime_state import get_process_graph
 
 from ses_intelligence.behavior_change.snapshot import BehaviorSnapshot
 from ses_intelligence.behavior_change.diff import diff_snapshots
@@ -16,6 +16,8 @@ from ses_intelligence.behavior_change.history import (
 )
 
 from ses_intelligence.ml.pipeline import IntelligencePipeline
+from ses_intelligence.scheduler import snapshots_scheduled
+from ses_intelligence.collector import get_collector_client
 from ses_intelligence.narrative.engine import generate_narrative
 
 
@@ -50,7 +52,7 @@ def signup(request):
 
 
 def graph_debug(request):
-    graph = get_behavior_graph()
+    graph = get_process_graph()
     return JsonResponse({
         "summary": graph.summary()
     })
@@ -60,20 +62,32 @@ def graph_debug(request):
 # DIFF ENDPOINT
 # ------------------------------------------------------------
 
+def _scheduler_inactive():
+    # With a collector configured, its scheduler owns snapshot history.
+    if get_collector_client() is not None:
+        return False
+
+    # Asked across processes: the scheduler may run in another worker, or
+    # in the server's parent process.
+    return not snapshots_scheduled()
+
+
 def behavior_diff_debug(request):
-    graph = get_behavior_graph()
+    graph = get_process_graph()
     new_snapshot = BehaviorSnapshot(graph)
 
     snapshots = SnapshotStore.load_all()
 
     if not snapshots:
+        if not _scheduler_inactive():
+            return JsonResponse({"status": "awaiting_scheduled_snapshot"})
         new_snapshot.persist()
         return JsonResponse({"status": "initial_snapshot_created"})
 
     last_snapshot_record = snapshots[-1]
 
     old_signature = {
-        tuple(edge.split("|")): meta
+        tuple(edge.split("|", 1)): meta
         for edge, meta in last_snapshot_record["edge_signature"].items()
     }
 
@@ -92,7 +106,10 @@ def behavior_diff_debug(request):
     changes, explanations = analyze_diff(graph_diff)
     causal_hints = infer_causal_hints(changes)
 
-    new_snapshot.persist()
+    # The background scheduler owns snapshot history when it runs; mixing in
+    # cumulative snapshots from here would break its even time spacing.
+    if _scheduler_inactive():
+        new_snapshot.persist()
 
     return JsonResponse({
         "status": "diff_computed",
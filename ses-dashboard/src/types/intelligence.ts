@@ -51,6 +51,8 @@ export interface HealthResponse {
 
 export interface GraphNode {
   id: string;
+  total_time?: number;
+  self_time?: number;
 }
 
 export interface GraphEdge {
@@ -58,6 +60,11 @@ export interface GraphEdge {
   target: string;
   call_count: number;
   avg_duration: number;
+  p50_duration?: number;
+  p95_duration?: number;
+  p99_duration?: number;
+  avg_self_duration?: number;
+  avg_cpu_duration?: number;
 }
 
 export interface GraphResponse {
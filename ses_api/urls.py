@@ -6,5 +6,8 @@ urlpatterns = [
     path("forecast/", views.api_forecast),
     path("impact/", views.api_impact),
     path("graph/", views.api_graph),
+    path("flamegraph/", views.api_flamegraph),
+    path("traces/", views.api_traces),
+    path("traces/<str:request_id>/", views.api_trace),
     path("executive/", views.api_executive),
 ]
@@ -1,12 +1,15 @@
 import json
 import os
 import logging
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse
 from django.conf import settings
 from datetime import datetime
 from ses_intelligence.architecture_health.engine import ArchitectureHealthEngine
 from ses_intelligence.architecture_health.confidence import ForecastConfidenceEngine
+from ses_intelligence.behavior_change.history import SnapshotStore
+from ses_intelligence.call_paths import CallPathTrie
 from ses_intelligence.runtime_state import get_runtime_snapshots
+from ses_intelligence.traces import get_trace_store
 from ses_intelligence.tracing import get_edge_features
 
 BASE_PATH = os.path.join(settings.BASE_DIR, "behavior_data", "architecture_health")
@@ -21,6 +24,11 @@ def load_json(filename):
         return json.load(f)
 
 
+def load_latest_snapshot():
+    latest = SnapshotStore.load_tail(1)
+    return latest[0] if latest else None
+
+
 def _compute_forecast_from_history():
     history_path = os.path.join(BASE_PATH, "health_history.json")
     engine = ForecastConfidenceEngine(history_path=history_path, window_size=10)
@@ -114,40 +122,53 @@ def api_impact(request):
 
 def api_graph(request):
 
-    snapshot_path = os.path.join(settings.BASE_DIR, "behavior_data", "snapshots")
-
-    if not os.path.exists(snapshot_path):
+    snapshot = load_latest_snapshot()
+    if snapshot is None:
         return JsonResponse({"nodes": [], "edges": []})
 
-    files = sorted(os.listdir(snapshot_path))
-    if not files:
-        return JsonResponse({"nodes": [], "edges": []})
-
-    latest = os.path.join(snapshot_path, files[-1])
-
-    with open(latest, "r") as f:
-        snapshot = json.load(f)
-
     edge_signature = snapshot.get("edge_signature", {})
 
-    nodes = set()
+    nodes = {}
     edges = []
 
     for edge_key, meta in edge_signature.items():
 
-        src, dst = edge_key.split("|")
+        src, dst = edge_key.split("|", 1)
 
-        nodes.add(src)
-        nodes.add(dst)
+        nodes.setdefault(src, {"id": src})
+        target = nodes.setdefault(dst, {"id": dst})
 
-        edges.append({
+        call_count = meta.get("call_count", 0)
+        edge = {
             "source": src,
             "target": dst,
-            "call_count": meta.get("call_count", 0),
+            "call_count": call_count,
             "avg_duration": meta.get("avg_duration", 0),
-        })
+        }
 
-    node_list = [{"id": n} for n in nodes]
+        for field in (
+            "p50_duration",
+            "p95_duration",
+            "p99_duration",
+            "avg_self_duration",
+            "avg_cpu_duration",
+        ):
+            if field in meta:
+                edge[field] = meta[field]
+
+        # Node time is summed over its incoming edges. Self time has no
+        # drift, so it is compared with the measured mean, not avg_duration.
+        if "avg_self_duration" in meta:
+            target["total_time"] = target.get("total_time", 0.0) + (
+                call_count * meta.get("raw_avg_duration", edge["avg_duration"])
+            )
+            target["self_time"] = target.get("self_time", 0.0) + (
+                call_count * meta["avg_self_duration"]
+            )
+
+        edges.append(edge)
+
+    node_list = list(nodes.values())
 
     return JsonResponse({
         "timestamp": datetime.utcnow().isoformat(),
@@ -156,6 +177,43 @@ def api_graph(request):
     })
 
 
+def api_flamegraph(request):
+    """Call paths of the latest snapshot in folded-stack format.
+
+    ``?metric=count`` weights stacks by call count instead of self time.
+    """
+    metric = request.GET.get("metric", "self_us")
+    snapshot = load_latest_snapshot() or {}
+    trie = CallPathTrie.from_dict(snapshot.get("call_paths"))
+
+    try:
+        folded = trie.folded(metric)
+    except ValueError as exc:
+        return JsonResponse({"error": str(exc)}, status=400)
+
+    return HttpResponse(folded, content_type="text/plain; charset=utf-8")
+
+
+def api_traces(request):
+    """Retained slowest requests, optionally for one ``?route=``, and the
+    requests kept by tail-based sampling.
+    """
+    store = get_trace_store()
+    return JsonResponse({
+        "timestamp": datetime.utcnow().isoformat(),
+        "traces": store.slowest(request.GET.get("route")),
+        "kept": store.kept(),
+    })
+
+
+def api_trace(request, request_id):
+    """Span waterfall of one retained request."""
+    trace = get_trace_store().get(request_id)
+    if trace is None:
+        return JsonResponse({"error": "trace not found"}, status=404)
+
+    return JsonResponse(trace.waterfall())
+
 
 def api_executive(request):
     anomalies = load_json("risk_output.json")
@@ -39,6 +39,7 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     'demo_app',
     'ses_api',
+    'ses_intelligence',
     'corsheaders',
 ]
 
@@ -123,3 +124,88 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/6.0/howto/static-files/
 
 STATIC_URL = 'static/'
+
+
+# Self-explaining software
+
+# Length (seconds) of the tumbling windows the background scheduler turns
+# into behavior snapshots, e.g. 60; None (the default) disables the
+# scheduler. The interval halves down to SES_SNAPSHOT_MIN_INTERVAL while
+# regressions are being detected. Every Django process (each server worker,
+# but also manage.py commands) starts a scheduler; one of them per snapshot
+# directory wins a file lock and persists windows. Without
+# SES_SHARED_GRAPH_PATH, the others hand their windows over to it through
+# files, so it persists them one window late.
+SES_SNAPSHOT_INTERVAL = None
+SES_SNAPSHOT_MIN_INTERVAL = 10
+
+# Also measure thread CPU time of every synchronous @trace_behavior call, so
+# snapshots carry avg_cpu_duration next to the wall-clock avg_duration.
+SES_TRACE_CPU_TIME = False
+
+# Fraction of synchronous @trace_behavior calls whose net and peak allocated
+# memory is measured with tracemalloc (see ses_intelligence.memory); None
+# disables memory attribution.
+SES_MEMORY_SAMPLE_RATE = None
+
+# Also store saved snapshots as memory-mapped (snapshot x edge) matrices in
+# behavior_data/snapshots/columnar, read by edge features and risk labels
+# without parsing JSON (see ses_intelligence.behavior_change.columnar).
+SES_COLUMNAR_HISTORY = False
+
+# Record every SQL statement run by traced code as a normalized "sql:..."
+# callee edge with query count, time and rows (see ses_intelligence.sql).
+SES_SQL_ATTRIBUTION = False
+
+# Record Django cache operations ("cache:<alias>:<op>", with hit/miss counts)
+# and outbound HTTP requests ("http:<METHOD> <host>", failures as misses) run
+# by traced code as callee edges (see ses_intelligence.cache and
+# ses_intelligence.http_client).
+SES_CACHE_ATTRIBUTION = False
+SES_HTTP_ATTRIBUTION = False
+
+# Module prefixes whose functions are traced without @trace_behavior (see
+# ses_intelligence.auto_instrument); empty disables auto-instrumentation.
+SES_AUTO_INSTRUMENT_MODULES = []
+
+# Per-call-path aggregation for /api/flamegraph/ (see
+# ses_intelligence.call_paths): at most SES_CALL_PATHS_MAX live paths, and
+# paths under SES_CALL_PATHS_MIN_SHARE of total time are folded into their
+# parent when snapshots are stored.
+SES_CALL_PATHS = False
+SES_CALL_PATHS_MAX = 10_000
+SES_CALL_PATHS_MIN_SHARE = 0.001
+
+# Per-request span traces for /api/traces/ (see ses_intelligence.traces):
+# each process keeps the slowest SES_TRACES_SLOWEST_PER_ROUTE requests per
+# route plus a uniform sample of SES_TRACES_RESERVOIR requests.
+SES_TRACES = False
+SES_TRACES_SLOWEST_PER_ROUTE = 10
+SES_TRACES_RESERVOIR = 100
+# Tail-based sampling: additionally keep every request slower than this
+# per-route latency percentile, failing with a 5xx, or reaching a new edge.
+# None disables it.
+SES_TRACES_TAIL_PERCENTILE = None
+
+# OTLP export of retained traces and edge counters (see
+# ses_intelligence.otlp): a file path, or an OTLP/HTTP base URL such as
+# "http://127.0.0.1:4318". SES_OTLP_ENCODING "protobuf" needs the
+# opentelemetry-proto package. None disables export.
+SES_OTLP_TARGET = None
+SES_OTLP_ENCODING = "json"
+
+# Module prefixes sampled by the statistical profiler (see
+# ses_intelligence.profiler), and the share of one CPU it may use.
+SES_PROFILER_MODULES = []
+SES_PROFILER_CPU_BUDGET = 0.01
+
+# File backing the host-wide edge counters shared by all worker processes
+# (see ses_intelligence.shared_graph), e.g. "/dev/shm/ses_edges"; None keeps
+# every process separate.
+SES_SHARED_GRAPH_PATH = None
+
+# Unix socket of the local collector (manage.py ses_collector). When set,
+# worker processes push edge deltas and request records to it every
+# SES_COLLECTOR_PUSH_INTERVAL seconds and do no SES disk I/O themselves.
+SES_COLLECTOR_SOCKET = None
+SES_COLLECTOR_PUSH_INTERVAL = 0.2
@@ -0,0 +1,118 @@
+from django.apps import AppConfig
+from django.conf import settings
+
+
+class SesIntelligenceConfig(AppConfig):
+    name = 'ses_intelligence'
+
+    def ready(self):
+        shared_path = getattr(settings, "SES_SHARED_GRAPH_PATH", None)
+        if shared_path:
+            from ses_intelligence.shared_graph import attach_shared_region
+
+            attach_shared_region(shared_path)
+
+        if getattr(settings, "SES_CALL_PATHS", False):
+            from ses_intelligence.call_paths import configure_call_paths
+
+            configure_call_paths(
+                max_paths=getattr(settings, "SES_CALL_PATHS_MAX", 10_000),
+                min_share=getattr(settings, "SES_CALL_PATHS_MIN_SHARE", 0.001),
+            )
+
+        if getattr(settings, "SES_TRACES", False):
+            from ses_intelligence.traces import configure_traces
+
+            configure_traces(
+                slowest_per_route=getattr(
+                    settings, "SES_TRACES_SLOWEST_PER_ROUTE", 10
+                ),
+                reservoir_size=getattr(settings, "SES_TRACES_RESERVOIR", 100),
+                tail_percentile=getattr(
+                    settings, "SES_TRACES_TAIL_PERCENTILE", None
+                ),
+            )
+
+        otlp_target = getattr(settings, "SES_OTLP_TARGET", None)
+        if otlp_target:
+            from ses_intelligence.otlp import start_exporter
+
+            start_exporter(
+                otlp_target,
+                encoding=getattr(settings, "SES_OTLP_ENCODING", "json"),
+            )
+
+        if getattr(settings, "SES_TRACE_CPU_TIME", False):
+            from ses_intelligence.tracing import set_cpu_time
+
+            set_cpu_time(True)
+
+        memory_rate = getattr(settings, "SES_MEMORY_SAMPLE_RATE", None)
+        if memory_rate:
+            from ses_intelligence.memory import configure_memory_tracking
+
+            configure_memory_tracking(sample_rate=memory_rate)
+
+        if getattr(settings, "SES_COLUMNAR_HISTORY", False):
+            from ses_intelligence.behavior_change.columnar import (
+                configure_columnar_history,
+            )
+
+            configure_columnar_history()
+
+        if getattr(settings, "SES_SQL_ATTRIBUTION", False):
+            from ses_intelligence.sql import enable_sql_attribution
+
+            enable_sql_attribution()
+
+        if getattr(settings, "SES_CACHE_ATTRIBUTION", False):
+            from ses_intelligence.cache import enable_cache_attribution
+
+            enable_cache_attribution()
+
+        if getattr(settings, "SES_HTTP_ATTRIBUTION", False):
+            from ses_intelligence.http_client import enable_http_attribution
+
+            enable_http_attribution()
+
+        modules = getattr(settings, "SES_AUTO_INSTRUMENT_MODULES", None)
+        if modules:
+            from ses_intelligence.auto_instrument import (
+                enable_auto_instrumentation,
+            )
+
+            enable_auto_instrumentation(modules)
+
+        profiled = getattr(settings, "SES_PROFILER_MODULES", None)
+        if profiled:
+            from ses_intelligence.profiler import start_profiler
+
+            start_profiler(
+                profiled,
+                cpu_budget=getattr(settings, "SES_PROFILER_CPU_BUDGET", 0.01),
+            )
+
+        collector_socket = getattr(settings, "SES_COLLECTOR_SOCKET", None)
+        if collector_socket:
+            # The collector (manage.py ses_collector) owns snapshots and all
+            # SES disk I/O; this process only forwards to it.
+            from ses_intelligence.collector import start_collector_client
+            from ses_intelligence.request_log import configure_request_log
+
+            client = start_collector_client(
+                collector_socket,
+                interval=getattr(settings, "SES_COLLECTOR_PUSH_INTERVAL", 0.2),
+            )
+            configure_request_log(handler=client.log_handler())
+            return
+
+        interval = getattr(settings, "SES_SNAPSHOT_INTERVAL", None)
+        if not interval:
+            return
+
+        from ses_intelligence.scheduler import start_scheduler
+
+        start_scheduler(
+            interval=interval,
+            min_interval=getattr(settings, "SES_SNAPSHOT_MIN_INTERVAL", 10),
+        )
@@ -3,6 +3,12 @@
 import networkx as nx
 
 
+def _call_count(data):
+    # Snapshot graphs store the raw counter as "count"; "call_count" is the
+    # signature name.
+    return data.get("call_count", data.get("count", 1))
+
+
 class EdgeImpactAnalyzer:
     """
     Combines instability probability with
@@ -35,8 +41,8 @@ class EdgeImpactAnalyzer:
         centrality = self._compute_centrality()
 
         total_calls = sum(
-            self.graph[u][v].get("call_count", 1)
-            for u, v in self.graph.edges()
+            _call_count(data)
+            for _, _, data in self.graph.edges(data=True)
         ) or 1
 
         impact_rows = []
@@ -44,7 +50,7 @@ class EdgeImpactAnalyzer:
         for edge_info in self.edge_risk_predictions:
 
             edge_key = edge_info["edge"]
-            caller, callee = edge_key.split("|")
+            caller, callee = edge_key.split("|", 1)
 
             instability = edge_info["instability_probability"]
 
@@ -55,11 +61,11 @@ class EdgeImpactAnalyzer:
                 caller_centrality + callee_centrality
             ) / 2
 
-            usage = self.graph.get_edge_data(
+            usage = _call_count(self.graph.get_edge_data(
                 caller,
                 callee,
                 default={}
-            ).get("call_count", 1)
+            ))
 
             usage_weight = usage / total_calls
 
@@ -1,7 +1,15 @@
+import numpy as np
+
+from ses_intelligence.behavior_change.columnar import ColumnarHistory
+
+
 class RiskLabelGenerator:
     """
     Generates supervised labels for edge instability
     using snapshot-to-snapshot comparison.
+
+    `snapshots` is a list of snapshot records or a `ColumnarHistory`,
+    for which features and labels come back as NumPy arrays.
     """
 
     def __init__(self, snapshots):
@@ -11,6 +19,9 @@ class RiskLabelGenerator:
 
     def generate(self):
 
+        if isinstance(self.snapshots, ColumnarHistory):
+            return self._generate_columnar(self.snapshots)
+
         features = []
         labels = []
 
@@ -48,6 +59,38 @@ class RiskLabelGenerator:
 
     # --------------------------------------------------
 
+    def _generate_columnar(self, columns):
+
+        if columns.rows < 2:
+            return {
+                "features": [],
+                "labels": []
+            }
+
+        call_counts = columns.column("call_count")
+        durations = columns.column("avg_duration")
+        present = columns.present()
+
+        # Every (snapshot, edge) with a following snapshot, row by row.
+        current = present[:-1]
+        current_durations = durations[:-1][current]
+        next_durations = durations[1:][current]
+
+        # Same rules as _compute_label: disappeared, or > 30% slower.
+        labels = (
+            ~present[1:][current]
+            | (next_durations > current_durations * 1.3)
+        )
+
+        return {
+            "features": np.column_stack(
+                (call_counts[:-1][current], current_durations)
+            ),
+            "labels": labels.astype(int)
+        }
+
+    # --------------------------------------------------
+
     def _compute_label(self, edge_key, edge_data, next_edges):
 
         if edge_key not in next_edges:
@@ -38,6 +38,14 @@ class EdgeStabilityCalculator:
         """
         return 1 / (1 + abs(slope))
 
+    @staticmethod
+    def _memory_growth_to_stability(growth):
+        """
+        Convert relative peak-memory growth into a stability score.
+        Only growth is penalized; shrinking memory is stable.
+        """
+        return 1 / (1 + max(0.0, growth))
+
     # --------------------------------------------------
     # MAIN COMPUTE
     # --------------------------------------------------
@@ -76,6 +84,20 @@ class EdgeStabilityCalculator:
                 0.25 * aps
             )
 
+            components = {
+                "structural_consistency": scs,
+                "temporal_stability": tss,
+                "drift_stability": dss,
+                "anomaly_pressure": aps,
+            }
+
+            # Memory stability, only for edges with sampled memory data
+            memory_growth = row.get("memory_growth")
+            if memory_growth is not None:
+                mss = self._memory_growth_to_stability(memory_growth)
+                esi = 0.85 * esi + 0.15 * mss
+                components["memory_stability"] = mss
+
             # Clamp to [0,1]
             esi = float(max(0.0, min(1.0, esi)))
 
@@ -83,12 +105,7 @@ class EdgeStabilityCalculator:
                 {
                     "edge": edge,
                     "stability_index": esi,
-                    "components": {
-                        "structural_consistency": scs,
-                        "temporal_stability": tss,
-                        "drift_stability": dss,
-                        "anomaly_pressure": aps,
-                    },
+                    "components": components,
                 }
             )
 
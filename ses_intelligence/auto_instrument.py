@@ -0,0 +1,341 @@
+"""Decorator-free auto-instrumentation.
+
+`enable_auto_instrumentation(["myapp", "billing.services"])` records
+caller -> callee edges for every plain Python function defined in the
+allowlisted modules (a prefix matches the module itself and its
+submodules), without touching their source. Calls are pushed onto the same
+context-local call stack as `trace_behavior` and recorded into the same
+per-thread `BehaviorGraph`, so decorated and auto-instrumented functions
+form one graph.
+
+Backends:
+
+- ``monitoring`` (Python 3.12+): `sys.monitoring` PY_START / PY_RETURN /
+  PY_UNWIND events. Code outside the allowlist returns ``DISABLE`` from its
+  first event, after which the interpreter stops reporting it, so
+  unlisted code runs at full speed.
+- ``setprofile`` (fallback): `sys.setprofile` / `threading.setprofile`.
+  The profile hook still runs on every call and return in the process and
+  only filters afterwards, so it is considerably more expensive. Threads
+  that were already running when it was enabled are not instrumented.
+
+Node names are the function's qualified name (``Class.method``), which for
+module-level functions matches the name `trace_behavior` uses. Functions
+already wrapped by `trace_behavior`, generators and coroutines, and the
+tracer's own modules are never auto-instrumented.
+
+Overhead per call, from
+``python -m ses_intelligence.benchmarks.tracing_overhead --auto`` in fast
+mode (single noisy dev machine, so only the ratios are meaningful):
+
+==========================  =========  ===========  ========
+backend                     decorator  allowlisted  unlisted
+==========================  =========  ===========  ========
+setprofile (Python 3.11)    ~2.3 us    ~3.5 us      ~0.6 us
+monitoring (Python 3.12)    ~3.2 us    ~3.5 us      ~0 us
+==========================  =========  ===========  ========
+
+An allowlisted call costs about as much as a decorated one; the difference
+is what unlisted code pays, which is why ``monitoring`` is preferred.
+"""
+
+from __future__ import annotations
+
+import sys
+import threading
+import time
+from typing import Dict, Iterable, Optional
+
+from ses_intelligence import tracing
+from ses_intelligence.behavior_graph import EDGE_KEY_SHIFT, intern_name
+from ses_intelligence.runtime_state import (
+    CALL_CHILD_NS,
+    CALL_ID,
+    CALL_PARENT,
+    current_call,
+)
+
+
+BACKEND_MONITORING = "monitoring"
+BACKEND_PROFILE = "setprofile"
+
+# Never instrument the tracer itself.
+_INTERNAL_MODULES = (
+    "ses_intelligence.auto_instrument",
+    "ses_intelligence.behavior_graph",
+    "ses_intelligence.cache",
+    "ses_intelligence.call_paths",
+    "ses_intelligence.http_client",
+    "ses_intelligence.latency",
+    "ses_intelligence.memory",
+    "ses_intelligence.runtime_state",
+    "ses_intelligence.sketch",
+    "ses_intelligence.sql",
+    "ses_intelligence.traces",
+    "ses_intelligence.tracing",
+)
+
+# CO_GENERATOR | CO_COROUTINE | CO_ITERABLE_COROUTINE | CO_ASYNC_GENERATOR:
+# these suspend and resume, which does not map onto one push/pop per call.
+_SUSPENDING_FLAGS = 0x20 | 0x80 | 0x100 | 0x200
+
+_MISSING = object()
+
+_perf_counter_ns = time.perf_counter_ns
+
+
+class _AutoLocal(threading.local):
+    def __init__(self):
+        # Open auto-instrumented calls on this thread, innermost last:
+        # (code, context token, call frame, start_ns).
+        self.stack = []
+
+
+_local = _AutoLocal()
+
+_backend: Optional[str] = None
+_tool_id: Optional[int] = None
+_prefixes = ()
+_dotted_prefixes = ()
+
+# code object -> interned callee id, or None when it is not instrumented.
+_code_ids: Dict[object, Optional[int]] = {}
+
+
+# ------------------------------------------------------------
+# CLASSIFICATION
+# ------------------------------------------------------------
+
+def _callee_id(code, module: Optional[str]) -> Optional[int]:
+    callee_id = None
+
+    if (
+        module is not None
+        and (module in _prefixes or module.startswith(_dotted_prefixes))
+        and not module.startswith(_INTERNAL_MODULES)
+        and not code.co_flags & _SUSPENDING_FLAGS
+        and not code.co_name.startswith("<")
+        and code not in tracing.traced_code
+    ):
+        callee_id = intern_name(getattr(code, "co_qualname", code.co_name))
+
+    _code_ids[code] = callee_id
+    return callee_id
+
+
+# ------------------------------------------------------------
+# CALL STACK
+# ------------------------------------------------------------
+
+def _enter(code, callee_id: int) -> None:
+    frame = [callee_id, current_call.get(), 0, None]
+    token = current_call.set(frame)
+    _local.stack.append((code, token, frame, _perf_counter_ns()))
+
+
+def _exit(code) -> None:
+    end = _perf_counter_ns()
+    stack = _local.stack
+
+    # Calls that started before instrumentation was enabled have no entry.
+    if not stack or stack[-1][0] is not code:
+        return
+
+    _, token, frame, start = stack.pop()
+
+    try:
+        current_call.reset(token)
+    except (ValueError, RuntimeError):
+        # Token from another context (e.g. a callback run via copy_context).
+        current = current_call.get()
+        current_call.set(current[CALL_PARENT] if current is not None else None)
+
+    parent = frame[CALL_PARENT]
+    if parent is not None:
+        parent[CALL_CHILD_NS] += end - start
+
+        caller_id = parent[CALL_ID]
+        callee_id = frame[CALL_ID]
+        tracing.record_call(
+            caller_id,
+            callee_id,
+            (caller_id << EDGE_KEY_SHIFT) | callee_id,
+            start,
+            end,
+            1.0,
+            frame[CALL_CHILD_NS],
+            frame,
+        )
+    else:
+        # Root calls have no edge but still start a call path and a span.
+        tracing.record_call(
+            None,
+            frame[CALL_ID],
+            None,
+            start,
+            end,
+            1.0,
+            frame[CALL_CHILD_NS],
+            frame,
+        )
+
+
+# ------------------------------------------------------------
+# sys.monitoring BACKEND
+# ------------------------------------------------------------
+
+def _lookup_monitored(code):
+    callee_id = _code_ids.get(code, _MISSING)
+    if callee_id is _MISSING:
+        # Frame 0 is this helper, 1 the event callback, 2 the monitored code.
+        module = sys._getframe(2).f_globals.get("__name__")
+        callee_id = _callee_id(code, module)
+    return callee_id
+
+
+def _on_py_start(code, instruction_offset):
+    callee_id = _lookup_monitored(code)
+    if callee_id is None:
+        return sys.monitoring.DISABLE
+    _enter(code, callee_id)
+
+
+def _on_py_return(code, instruction_offset, retval):
+    if _lookup_monitored(code) is None:
+        return sys.monitoring.DISABLE
+    _exit(code)
+
+
+def _on_py_unwind(code, instruction_offset, exception):
+    # PY_UNWIND cannot be disabled per code location.
+    if _code_ids.get(code) is not None:
+        _exit(code)
+
+
+def _start_monitoring() -> None:
+    global _tool_id
+
+    monitoring = sys.monitoring
+    for tool_id in (monitoring.PROFILER_ID, 3, 4):
+        if monitoring.get_tool(tool_id) is None:
+            break
+    else:
+        raise RuntimeError("No free sys.monitoring tool id")
+
+    events = monitoring.events
+    monitoring.use_tool_id(tool_id, "ses_intelligence")
+    monitoring.register_callback(tool_id, events.PY_START, _on_py_start)
+    monitoring.register_callback(tool_id, events.PY_RETURN, _on_py_return)
+    monitoring.register_callback(tool_id, events.PY_UNWIND, _on_py_unwind)
+    monitoring.set_events(
+        tool_id, events.PY_START | events.PY_RETURN | events.PY_UNWIND
+    )
+    # Re-enable locations a previous session returned DISABLE for.
+    monitoring.restart_events()
+
+    _tool_id = tool_id
+
+
+def _stop_monitoring() -> None:
+    global _tool_id
+
+    monitoring = sys.monitoring
+    events = monitoring.events
+    monitoring.set_events(_tool_id, 0)
+    for event in (events.PY_START, events.PY_RETURN, events.PY_UNWIND):
+        monitoring.register_callback(_tool_id, event, None)
+    monitoring.free_tool_id(_tool_id)
+
+    _tool_id = None
+
+
+# ------------------------------------------------------------
+# sys.setprofile BACKEND
+# ------------------------------------------------------------
+
+def _profile(frame, event, arg):
+    if event == "call":
+        code = frame.f_code
+        callee_id = _code_ids.get(code, _MISSING)
+        if callee_id is _MISSING:
+            callee_id = _callee_id(code, frame.f_globals.get("__name__"))
+        if callee_id is not None:
+            _enter(code, callee_id)
+
+    elif event == "return":
+        # Also fired when the frame exits by exception.
+        code = frame.f_code
+        if _code_ids.get(code) is not None:
+            _exit(code)
+
+
+def _start_profile() -> None:
+    threading.setprofile(_profile)
+    sys.setprofile(_profile)
+
+
+def _stop_profile() -> None:
+    sys.setprofile(None)
+    threading.setprofile(None)
+
+
+# ------------------------------------------------------------
+# PUBLIC API
+# ------------------------------------------------------------
+
+def enable_auto_instrumentation(
+    module_prefixes: Iterable[str],
+    backend: Optional[str] = None,
+) -> str:
+    """Start recording edges for functions in `module_prefixes`.
+
+    `backend` defaults to ``monitoring`` where `sys.monitoring` exists and
+    ``setprofile`` otherwise. Re-enabling replaces the allowlist. Returns
+    the backend in use.
+    """
+    global _backend, _prefixes, _dotted_prefixes
+
+    prefixes = tuple(p.rstrip(".") for p in module_prefixes if p)
+    if not prefixes:
+        raise ValueError("At least one module prefix is required")
+
+    if backend is None:
+        backend = (
+            BACKEND_MONITORING if hasattr(sys, "monitoring") else BACKEND_PROFILE
+        )
+    if backend not in (BACKEND_MONITORING, BACKEND_PROFILE):
+        raise ValueError(f"Unknown auto-instrumentation backend: {backend!r}")
+    if backend == BACKEND_MONITORING and not hasattr(sys, "monitoring"):
+        raise RuntimeError("sys.monitoring requires Python 3.12+")
+
+    disable_auto_instrumentation()
+
+    _prefixes = prefixes
+    _dotted_prefixes = tuple(p + "." for p in prefixes)
+    _code_ids.clear()
+
+    if backend == BACKEND_MONITORING:
+        _start_monitoring()
+    else:
+        _start_profile()
+
+    _backend = backend
+    return backend
+
+
+def disable_auto_instrumentation() -> None:
+    """Stop auto-instrumentation; a no-op when it is not enabled."""
+    global _backend
+
+    if _backend == BACKEND_MONITORING:
+        _stop_monitoring()
+    elif _backend == BACKEND_PROFILE:
+        _stop_profile()
+
+    _backend = None
+    _local.stack.clear()
+
+
+def get_auto_instrumentation_backend() -> Optional[str]:
+    """Return the active backend, or None when disabled."""
+    return _backend
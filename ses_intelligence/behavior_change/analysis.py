@@ -34,8 +34,9 @@ def analyze_diff(diff: GraphDiff):
 
     # --- Timing Changes ---
     for (src, dst), metrics in diff.changed_edges.items():
-        old_avg = metrics["old_avg"]
-        new_avg = metrics["new_avg"]
+        # Quantile-based diffs report the compared quantile values.
+        old_avg = metrics.get("old_value", metrics["old_avg"])
+        new_avg = metrics.get("new_value", metrics["new_avg"])
         delta = metrics["delta_pct"]
 
         if delta > 0:
@@ -59,6 +60,31 @@ def analyze_diff(diff: GraphDiff):
             )
         )
 
+    # --- Memory Changes ---
+    for (src, dst), metrics in diff.memory_changes.items():
+        delta = metrics["delta_pct"]
+
+        if delta > 0:
+            change_type = "memory_regression"
+            explanations.append(
+                f"`{src}` → `{dst}` uses more memory ({delta:.2f}% higher peak)."
+            )
+        else:
+            change_type = "memory_improvement"
+            explanations.append(
+                f"`{src}` → `{dst}` uses less memory ({abs(delta):.2f}% lower peak)."
+            )
+
+        changes.append(
+            BehaviorChange(
+                type=change_type,
+                src=src,
+                dst=dst,
+                metric_before=metrics["old_peak_bytes"],
+                metric_after=metrics["new_peak_bytes"],
+            )
+        )
+
     if not explanations:
         explanations.append("No significant behavior changes detected.")
 
@@ -9,6 +9,8 @@ class BehaviorChange:
         "edge_removed",
         "timing_regression",
         "timing_improvement",
+        "memory_regression",
+        "memory_improvement",
         "call_frequency_change",
     ]
     src: Optional[str] = None
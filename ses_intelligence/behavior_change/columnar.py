@@ -0,0 +1,328 @@
+"""Memory-mapped columnar snapshot history (optional).
+
+The snapshot log keeps one JSON record per snapshot, which analysis code
+has to parse in full to look at a single metric. With
+`configure_columnar_history()` enabled, `SnapshotStore` also writes every
+snapshot as one row of a (snapshot x edge) matrix per metric:
+
+- ``<metric>.npy``: float64 matrices for the metrics in `COLUMNS`, NaN where
+  an edge is absent from a snapshot or did not carry the metric.
+- ``snapshot_id.npy``: the snapshot id of each row.
+- ``edges.json``: the interned edge keys; column ``j`` is ``edges[j]``.
+- ``meta.json``: how many rows and edges are in use.
+
+Matrices are preallocated and doubled in either dimension when full, so an
+append writes one row. `ColumnarHistory` opens the files with
+``numpy.load(mmap_mode="r")`` and `column()` returns zero-copy views, so
+`FeatureExtractor`, `build_timing_history` and `RiskLabelGenerator` read a
+year of history without parsing any JSON.
+
+Only the process that saves snapshots opens the history writable; readers
+in other processes call `refresh()` before reading, which picks up new rows
+and edges from ``meta.json`` and remaps the matrices once the writer has
+replaced them with larger ones.
+
+Growth: an edge keeps its column for good, so each matrix holds
+(snapshots x every edge ever seen) float64 values, e.g. 8760 hourly rows x
+5,000 edges is 350 MB per metric. `SnapshotStore.compact` does not shrink
+it; with much edge churn, delete the ``columnar`` directory after
+compacting and the next save rebuilds it from the retained log.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+from pathlib import Path
+from typing import Dict, Iterable, List
+
+import networkx as nx
+import numpy as np
+
+
+COLUMNS = (
+    "call_count",
+    "avg_duration",
+    "raw_avg_duration",
+    "p50_duration",
+    "p95_duration",
+    "p99_duration",
+    "avg_cpu_duration",
+    "peak_bytes",
+)
+# Percentile columns by quantile, for `quantile_of`.
+PERCENTILE_COLUMNS = {
+    0.5: "p50_duration",
+    0.95: "p95_duration",
+    0.99: "p99_duration",
+}
+SNAPSHOT_ID_DTYPE = "U40"
+INITIAL_ROWS = 64
+INITIAL_EDGES = 64
+
+
+class ColumnarConfig:
+    """Process-wide setting (see `configure_columnar_history`)."""
+
+    def __init__(self):
+        self.enabled = False
+
+
+_config = ColumnarConfig()
+
+
+def configure_columnar_history(enabled: bool = True) -> None:
+    """Also write saved snapshots to the columnar history."""
+    _config.enabled = enabled
+
+
+def columnar_history_enabled() -> bool:
+    return _config.enabled
+
+
+def _write_json_atomic(path: Path, data) -> None:
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+class ColumnarHistory:
+    """The (snapshot x edge) matrices in `directory`.
+
+    Opened read-only unless `writable`; one writer per directory, the
+    process that saves snapshots.
+    """
+
+    def __init__(self, directory: Path, writable: bool = False):
+        self.directory = Path(directory)
+        self.writable = writable
+        self._meta_path = self.directory / "meta.json"
+        self._edges_path = self.directory / "edges.json"
+
+        self.rows = 0
+        self.edges: List[str] = []
+        self._edge_ids: Dict[str, int] = {}
+        self._columns_inode = None
+        # Columns read as NaN because their file does not exist yet.
+        self._missing: List[str] = []
+
+        self.created = not self._meta_path.exists()
+        if self.created:
+            if not writable:
+                raise FileNotFoundError(f"No columnar history in {directory}")
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self._allocate(INITIAL_ROWS, INITIAL_EDGES)
+            self._write_meta()
+        else:
+            self.refresh()
+
+    # --------------------------------------------------
+    # FILES
+    # --------------------------------------------------
+
+    def _path(self, name: str) -> Path:
+        return self.directory / f"{name}.npy"
+
+    def _open(self) -> None:
+        mode = "r+" if self.writable else "r"
+        # Stat first: if the writer replaces the files meanwhile, the next
+        # refresh sees a new inode and maps them again.
+        self._columns_inode = self._path("snapshot_id").stat().st_ino
+        self._snapshot_ids = np.load(self._path("snapshot_id"), mmap_mode=mode)
+        self._columns = {}
+        self._missing = []
+        for name in COLUMNS:
+            path = self._path(name)
+            if path.exists():
+                self._columns[name] = np.load(path, mmap_mode=mode)
+            else:
+                # A metric added after the history was created.
+                self._columns[name] = self._missing_column(name)
+                if not self.writable:
+                    self._missing.append(name)
+
+    def _missing_column(self, name: str) -> np.ndarray:
+        shape = (
+            self._snapshot_ids.shape[0],
+            np.load(self._path("call_count"), mmap_mode="r").shape[1],
+        )
+        if not self.writable:
+            return np.broadcast_to(np.float64(np.nan), shape)
+
+        tmp = self.directory / f"{name}.npy.tmp"
+        matrix = np.lib.format.open_memmap(
+            tmp, mode="w+", dtype=np.float64, shape=shape
+        )
+        matrix[:] = np.nan
+        matrix.flush()
+        os.replace(tmp, self._path(name))
+        return matrix
+
+    def refresh(self) -> None:
+        """Pick up rows, edges and regrown files written by the writer.
+
+        A no-op for the writer itself, whose state is always current.
+        """
+        if self.writable and self._columns_inode is not None:
+            return
+
+        # meta.json is written last, so every row and edge it counts is
+        # already in the files and edges.json.
+        with open(self._meta_path, "r") as f:
+            meta = json.load(f)
+        if meta.get("edges") != len(self.edges):
+            with open(self._edges_path, "r") as f:
+                self.edges = json.load(f)
+            self._edge_ids = {
+                edge_key: index for index, edge_key in enumerate(self.edges)
+            }
+        inode = self._path("snapshot_id").stat().st_ino
+        if inode != self._columns_inode or any(
+            self._path(name).exists() for name in self._missing
+        ):
+            self._open()
+        self.rows = meta["rows"]
+
+    def _allocate(self, row_capacity: int, edge_capacity: int) -> None:
+        """(Re)create the files at the given capacity, keeping the rows and
+        edges in use.
+        """
+        columns = {}
+        for name in COLUMNS:
+            tmp = self.directory / f"{name}.npy.tmp"
+            matrix = np.lib.format.open_memmap(
+                tmp,
+                mode="w+",
+                dtype=np.float64,
+                shape=(row_capacity, edge_capacity),
+            )
+            matrix[:] = np.nan
+            if self.rows:
+                old = self._columns[name]
+                matrix[:self.rows, :old.shape[1]] = old[:self.rows]
+            matrix.flush()
+            columns[name] = (tmp, matrix)
+
+        tmp = self.directory / "snapshot_id.npy.tmp"
+        snapshot_ids = np.lib.format.open_memmap(
+            tmp, mode="w+", dtype=SNAPSHOT_ID_DTYPE, shape=(row_capacity,)
+        )
+        if self.rows:
+            snapshot_ids[:self.rows] = self._snapshot_ids[:self.rows]
+        snapshot_ids.flush()
+        columns["snapshot_id"] = (tmp, snapshot_ids)
+
+        for name, (tmp, _) in columns.items():
+            os.replace(tmp, self._path(name))
+
+        self._columns = {name: columns[name][1] for name in COLUMNS}
+        self._snapshot_ids = snapshot_ids
+        self._columns_inode = self._path("snapshot_id").stat().st_ino
+
+    def _write_meta(self) -> None:
+        _write_json_atomic(self._edges_path, self.edges)
+        _write_json_atomic(
+            self._meta_path, {"rows": self.rows, "edges": len(self.edges)}
+        )
+
+    # --------------------------------------------------
+    # WRITING
+    # --------------------------------------------------
+
+    def append(self, record: Dict) -> None:
+        """Add one snapshot record (as stored by `SnapshotStore`) as a row."""
+        self.extend([record])
+
+    def extend(self, records: Iterable[Dict]) -> None:
+        if not self.writable:
+            raise RuntimeError("ColumnarHistory opened read-only")
+
+        edges_before = len(self.edges)
+        for record in records:
+            signature = record.get("edge_signature", {})
+
+            ids = []
+            for edge_key in signature:
+                edge_id = self._edge_ids.get(edge_key)
+                if edge_id is None:
+                    edge_id = self._edge_ids[edge_key] = len(self.edges)
+                    self.edges.append(edge_key)
+                ids.append(edge_id)
+
+            row_capacity, edge_capacity = self._columns["call_count"].shape
+            if self.rows >= row_capacity or len(self.edges) > edge_capacity:
+                self._allocate(
+                    max(row_capacity * 2, self.rows + 1)
+                    if self.rows >= row_capacity else row_capacity,
+                    max(edge_capacity * 2, len(self.edges))
+                    if len(self.edges) > edge_capacity else edge_capacity,
+                )
+
+            row = self.rows
+            metas = list(signature.values())
+            for name in COLUMNS:
+                values = [meta.get(name) for meta in metas]
+                self._columns[name][row, ids] = [
+                    np.nan if value is None else value for value in values
+                ]
+            self._snapshot_ids[row] = record.get("snapshot_id", "")
+            self.rows = row + 1
+
+        for matrix in self._columns.values():
+            matrix.flush()
+        self._snapshot_ids.flush()
+
+        if len(self.edges) != edges_before:
+            _write_json_atomic(self._edges_path, self.edges)
+        _write_json_atomic(
+            self._meta_path, {"rows": self.rows, "edges": len(self.edges)}
+        )
+
+    # --------------------------------------------------
+    # READING
+    # --------------------------------------------------
+
+    def column(self, name: str) -> np.ndarray:
+        """Zero-copy (rows x edges) view of one metric; NaN where absent."""
+        return self._columns[name][:self.rows, :len(self.edges)]
+
+    def present(self) -> np.ndarray:
+        """Boolean (rows x edges) matrix: edge present in snapshot."""
+        return ~np.isnan(self.column("call_count"))
+
+    @property
+    def snapshot_ids(self) -> np.ndarray:
+        return self._snapshot_ids[:self.rows]
+
+    def edge_pairs(self) -> List[tuple]:
+        return [tuple(edge_key.split("|", 1)) for edge_key in self.edges]
+
+    def quantile_of(self, quantile: float) -> np.ndarray:
+        """The stored percentile column for `quantile`, falling back to
+        avg_duration where a snapshot has no percentile (and for quantiles
+        other than p50/p95/p99).
+        """
+        avg = self.column("avg_duration")
+        name = PERCENTILE_COLUMNS.get(quantile)
+        if name is None:
+            return avg
+        values = self.column(name)
+        return np.where(np.isnan(values), avg, values)
+
+    def graph(self, row: int) -> nx.DiGraph:
+        """Graph of one snapshot, with the attributes `FeatureExtractor`
+        reads from reconstructed snapshots.
+        """
+        graph = nx.DiGraph()
+        call_counts = self.column("call_count")[row]
+        durations = self.column("avg_duration")[row]
+        for edge_id in np.flatnonzero(~np.isnan(call_counts)):
+            u, v = self.edges[edge_id].split("|", 1)
+            graph.add_edge(
+                u,
+                v,
+                call_count=float(call_counts[edge_id]),
+                avg_duration=float(durations[edge_id]),
+            )
+        return graph
@@ -1,7 +1,9 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
-from typing import Dict, Tuple
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Tuple
+
+from ses_intelligence.sketch import DDSketch
 
 Edge = Tuple[str, str]
 
@@ -11,9 +13,34 @@ class GraphDiff:
     new_edges: set[Edge]
     removed_edges: set[Edge]
     changed_edges: Dict[Edge, Dict[str, float]]
+    # Edges whose sampled peak memory changed (see ses_intelligence.memory).
+    memory_changes: Dict[Edge, Dict[str, float]] = field(default_factory=dict)
+
+
+def _timing_value(meta, quantile: Optional[float]) -> float:
+    if quantile is not None and meta.get("sketch"):
+        return DDSketch.from_dict(meta["sketch"]).quantile(quantile)
+    return meta["avg_duration"]
+
 
+def diff_snapshots(
+    old,
+    new,
+    timing_threshold_pct: float = 20.0,
+    quantile: Optional[float] = None,
+    memory_threshold_pct: float = 50.0,
+    memory_min_bytes: float = 64 * 1024,
+) -> GraphDiff:
+    """Compare two snapshots edge by edge.
 
-def diff_snapshots(old, new, timing_threshold_pct: float = 20.0) -> GraphDiff:
+    Timing changes compare avg_duration by default. With `quantile` (0-1),
+    edges that carry sketches in both snapshots are compared on that
+    quantile instead, e.g. 0.99 to catch tail regressions the mean hides.
+
+    Edges with sampled memory data in both snapshots are also compared on
+    peak bytes; changes smaller than `memory_min_bytes` are ignored as
+    allocator noise.
+    """
     old_sig = old.edge_signature()
     new_sig = new.edge_signature()
 
@@ -24,15 +51,39 @@ def diff_snapshots(old, new, timing_threshold_pct: float = 20.0) -> GraphDiff:
     removed = old_edges - new_edges
 
     changed = {}
+    memory_changes = {}
 
     for edge in old_edges & new_edges:
+        old_peak = old_sig[edge].get("peak_bytes")
+        new_peak = new_sig[edge].get("peak_bytes")
+        if (
+            old_peak
+            and new_peak is not None
+            and abs(new_peak - old_peak) >= memory_min_bytes
+        ):
+            memory_delta_pct = ((new_peak - old_peak) / old_peak) * 100
+            if abs(memory_delta_pct) >= memory_threshold_pct:
+                memory_changes[edge] = {
+                    "old_peak_bytes": old_peak,
+                    "new_peak_bytes": new_peak,
+                    "delta_pct": memory_delta_pct,
+                }
+
         old_avg = old_sig[edge]["avg_duration"]
         new_avg = new_sig[edge]["avg_duration"]
 
-        if old_avg == 0:
+        use_quantile = (
+            quantile is not None
+            and bool(old_sig[edge].get("sketch"))
+            and bool(new_sig[edge].get("sketch"))
+        )
+        old_value = _timing_value(old_sig[edge], quantile if use_quantile else None)
+        new_value = _timing_value(new_sig[edge], quantile if use_quantile else None)
+
+        if old_value == 0:
             continue
 
-        delta_pct = ((new_avg - old_avg) / old_avg) * 100
+        delta_pct = ((new_value - old_value) / old_value) * 100
 
         if abs(delta_pct) >= timing_threshold_pct:
             changed[edge] = {
@@ -41,8 +92,14 @@ def diff_snapshots(old, new, timing_threshold_pct: float = 20.0) -> GraphDiff:
                 "delta_pct": delta_pct,
             }
 
+            if use_quantile:
+                changed[edge]["metric"] = f"p{quantile * 100:g}"
+                changed[edge]["old_value"] = old_value
+                changed[edge]["new_value"] = new_value
+
     return GraphDiff(
         new_edges=added,
         removed_edges=removed,
         changed_edges=changed,
+        memory_changes=memory_changes,
     )
@@ -21,6 +21,15 @@ def explain_diff(diff: GraphDiff) -> list[str]:
             f"({change['delta_pct']:.1f}%)."
         )
 
+    for (caller, callee), change in diff.memory_changes.items():
+        direction = "more" if change["delta_pct"] > 0 else "less"
+        explanations.append(
+            f"`{caller} → {callee}` uses {direction} memory: peak "
+            f"{change['old_peak_bytes'] / 1024:.0f}KiB → "
+            f"{change['new_peak_bytes'] / 1024:.0f}KiB "
+            f"({change['delta_pct']:.1f}%)."
+        )
+
     if not explanations:
         explanations.append("No significant behavior changes detected.")
 
@@ -2,7 +2,14 @@ import json
 import random
 from pathlib import Path
 from datetime import datetime
-from typing import Dict, List
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+
+from ses_intelligence.sketch import DDSketch, merge_sketches
+
+from .columnar import ColumnarHistory, _config as _columnar
+from .snapshot_log import MANIFEST_NAME, SnapshotLog
 
 
 # ------------------------------------------------------------------
@@ -10,9 +17,42 @@ from typing import Dict, List
 # ------------------------------------------------------------------
 
 BASE_DIR = Path(__file__).resolve().parents[2]
+
+# Per-edge latency distribution fields carried through unchanged.
+DISTRIBUTION_FIELDS = (
+    "histogram",
+    "p50_duration",
+    "p95_duration",
+    "p99_duration",
+    "sketch",
+)
+# Per-edge self (exclusive) time and CPU time, next to the inclusive
+# wall-clock avg_duration.
+TIMING_FIELDS = ("avg_self_duration", "avg_cpu_duration")
+# Per-edge sampled memory attribution (see ses_intelligence.memory).
+MEMORY_FIELDS = ("avg_net_bytes", "peak_bytes")
+# Rows per call of SQL statement edges (see ses_intelligence.sql).
+QUERY_FIELDS = ("avg_rows",)
+# Share of cache misses / failed requests of dependency edges (see
+# ses_intelligence.cache and ses_intelligence.http_client).
+OUTCOME_FIELDS = ("miss_rate",)
 SNAPSHOT_DIR = BASE_DIR / "behavior_data" / "snapshots"
 SNAPSHOT_DIR.mkdir(parents=True, exist_ok=True)
 
+# Edge key -> persisted avg_duration of the latest snapshot this process
+# saved, with the snapshot dir and the log end after it (see
+# `SnapshotLog.append_from_last`). While no other process appends, saving
+# never reads the log; otherwise it reads back the latest record only.
+_latest: Optional[Tuple[Path, Tuple[int, int], Dict[str, float]]] = None
+
+# The open snapshot log (see snapshot_log), for SNAPSHOT_DIR.
+_log: Optional[SnapshotLog] = None
+
+# The columnar history (see columnar) for SNAPSHOT_DIR: opened writable by
+# the process that saves snapshots, read-only by every other process.
+_columns: Optional[ColumnarHistory] = None
+_column_reader: Optional[ColumnarHistory] = None
+
 
 # ------------------------------------------------------------------
 # SNAPSHOT STORE
@@ -22,79 +62,220 @@ class SnapshotStore:
     """
     Handles persistence of immutable behavior snapshots.
 
-    Snapshots are append-only.
+    Snapshots are append-only records of a segmented log in
+    SNAPSHOT_DIR (see snapshot_log).
     Deterministic structure.
     Controlled runtime entropy applied to avg_duration.
+
+    Saving is a single pass over the new snapshot's edges: the drift base
+    is the latest record in the log, whichever process appended it, read
+    under the log's writer lock (or taken from memory when this process
+    appended it), so save cost does not grow with history length.
     """
 
     @staticmethod
-    def save(snapshot) -> Path:
+    def log() -> SnapshotLog:
         """
-        Persist snapshot.edge_signature() to disk
-        with controlled runtime variability.
+        The snapshot log in SNAPSHOT_DIR, opened once per process.
+
+        Snapshots from the older one-JSON-file-per-snapshot layout are
+        imported when the log is created, before any other process can
+        append to it or read it; the files are left in place.
         """
+        global _log
 
-        timestamp = datetime.utcnow().isoformat()
-        filename = timestamp.replace(":", "-") + ".json"
-        filepath = SNAPSHOT_DIR / filename
+        if _log is None or _log.directory != SNAPSHOT_DIR:
+            _log = SnapshotLog(
+                SNAPSHOT_DIR, initial_records=SnapshotStore._legacy_records
+            )
 
-        raw_signature = snapshot.edge_signature()
+        return _log
 
-        serialized_signature = {}
+    @staticmethod
+    def _legacy_records() -> Iterator[Dict]:
+        for file in sorted(SNAPSHOT_DIR.glob("*.json")):
+            if file.name == MANIFEST_NAME:
+                continue
+            with open(file, "r") as f:
+                yield json.load(f)
 
-        for (src, dst), value in raw_signature.items():
+    @staticmethod
+    def columnar() -> Optional[ColumnarHistory]:
+        """
+        The columnar history in SNAPSHOT_DIR / "columnar" for reading, or
+        None until the process that saves snapshots has created it.
 
-            base_duration = value.get("avg_duration", 0.0)
-            call_count = value.get("call_count", 0)
+        That process reads through its own writable handle; any other
+        opens it read-only once and refreshes it on every call.
+        """
+        global _column_reader
 
-            # -----------------------------------------
-            # Controlled cumulative drift
-            # -----------------------------------------
+        directory = SNAPSHOT_DIR / "columnar"
+        if _columns is not None and _columns.directory == directory:
+            return _columns
 
-            previous_snapshots = SnapshotStore.load_all()
+        reader = _column_reader
+        if reader is not None and reader.directory == directory:
+            reader.refresh()
+            return reader
 
-            if previous_snapshots:
-                last_snapshot = previous_snapshots[-1]
-                last_edge_data = last_snapshot["edge_signature"].get(
-                    f"{src}|{dst}", {}
-                )
-                last_duration = last_edge_data.get("avg_duration", base_duration)
-            else:
-                last_duration = base_duration
+        try:
+            _column_reader = ColumnarHistory(directory)
+        except FileNotFoundError:
+            return None
+        return _column_reader
 
-            drift_factor = random.uniform(0.995, 1.005)
+    @staticmethod
+    def _columnar_writer() -> ColumnarHistory:
+        """
+        The columnar history opened for writing, by `save` only. Created
+        from the whole log the first time.
+        """
+        global _columns
 
-            adjusted_duration = last_duration * drift_factor
+        directory = SNAPSHOT_DIR / "columnar"
+        if _columns is None or _columns.directory != directory:
+            columns = ColumnarHistory(directory, writable=True)
+            if columns.created:
+                columns.extend(SnapshotStore.load_all())
+            _columns = columns
 
+        return _columns
+
+    @staticmethod
+    def _latest_durations(end, last) -> Dict[str, float]:
+        """
+        avg_duration per edge of the latest persisted snapshot, given the
+        `end` and `last` of `SnapshotLog.append_from_last`.
+        """
+        if _latest is not None and _latest[:2] == (SNAPSHOT_DIR, end):
+            return _latest[2]
+
+        record = last()
+        if record is None:
+            return {}
+        return {
+            edge_key: meta["avg_duration"]
+            for edge_key, meta in record["edge_signature"].items()
+            if "avg_duration" in meta
+        }
 
-            serialized_signature[f"{src}|{dst}"] = {
-                "call_count": call_count,
-                "avg_duration": round(adjusted_duration, 4),
+    @staticmethod
+    def save(snapshot) -> Path:
+        """
+        Persist snapshot.edge_signature() to disk
+        with controlled runtime variability.
+
+        Returns the segment file the snapshot was appended to.
+        """
+        global _latest
+
+        timestamp = datetime.utcnow().isoformat()
+
+        raw_signature = snapshot.edge_signature()
+        extra_fields = (
+            DISTRIBUTION_FIELDS
+            + TIMING_FIELDS
+            + MEMORY_FIELDS
+            + QUERY_FIELDS
+            + OUTCOME_FIELDS
+        )
+        durations = {}
+        records = []
+
+        def build(end, last) -> Dict:
+            last_durations = SnapshotStore._latest_durations(end, last)
+            serialized_signature = {}
+
+            for (src, dst), value in raw_signature.items():
+
+                edge_key = f"{src}|{dst}"
+                base_duration = value.get("avg_duration", 0.0)
+                call_count = value.get("call_count", 0)
+
+                # -----------------------------------------
+                # Controlled cumulative drift
+                # -----------------------------------------
+
+                last_duration = last_durations.get(edge_key, base_duration)
+
+                drift_factor = random.uniform(0.995, 1.005)
+
+                adjusted_duration = round(last_duration * drift_factor, 4)
+
+                serialized_signature[edge_key] = {
+                    "call_count": call_count,
+                    "avg_duration": adjusted_duration,
+                    # The measured mean, without drift: the other timing
+                    # fields carry none, so ratios against them must use
+                    # this one.
+                    "raw_avg_duration": base_duration,
+                }
+                durations[edge_key] = adjusted_duration
+
+                for field in extra_fields:
+                    if field in value:
+                        serialized_signature[edge_key][field] = value[field]
+
+            record = {
+                "snapshot_id": timestamp,
+                "created_at": timestamp,
+                "edge_signature": serialized_signature,
             }
 
-        record = {
-            "snapshot_id": timestamp,
-            "created_at": timestamp,
-            "edge_signature": serialized_signature,
-        }
+            window_seconds = getattr(snapshot, "window_seconds", None)
+            if window_seconds is not None:
+                record["window_seconds"] = window_seconds
+
+            call_paths = getattr(snapshot, "call_paths", None)
+            if call_paths is not None:
+                record["call_paths"] = call_paths.to_dict()
+
+            records.append(record)
+            return record
+
+        # Opened before appending, so a first-time import from the log
+        # does not pick up this record as well.
+        columns = (
+            SnapshotStore._columnar_writer() if _columnar.enabled else None
+        )
+
+        segment_path, end = SnapshotStore.log().append_from_last(build)
+        if columns is not None:
+            columns.append(records[0])
 
-        with open(filepath, "w") as f:
-            json.dump(record, f, indent=2)
+        _latest = (SNAPSHOT_DIR, end, durations)
 
-        return filepath
+        return segment_path
 
     @staticmethod
     def load_all() -> List[Dict]:
         """
         Load all snapshots from disk in chronological order.
         """
-        snapshots = []
+        return SnapshotStore.log().read()
 
-        for file in sorted(SNAPSHOT_DIR.glob("*.json")):
-            with open(file, "r") as f:
-                snapshots.append(json.load(f))
+    @staticmethod
+    def load_range(start: int, stop: Optional[int] = None) -> List[Dict]:
+        """
+        Load snapshots start:stop (list positions, oldest first).
+        """
+        return SnapshotStore.log().read(start, stop)
 
-        return snapshots
+    @staticmethod
+    def load_tail(n: int) -> List[Dict]:
+        """
+        Load the latest n snapshots in chronological order.
+        """
+        return SnapshotStore.log().tail(n)
+
+    @staticmethod
+    def compact(keep_last: int) -> int:
+        """
+        Delete whole log segments older than the latest keep_last
+        snapshots; returns how many snapshots were removed.
+        """
+        return SnapshotStore.log().compact(keep_last)
 
 
 # ------------------------------------------------------------------
@@ -122,7 +303,10 @@ def build_edge_lifecycle(snapshots: List[Dict]) -> Dict[str, List[str]]:
 # TIMING HISTORY
 # ------------------------------------------------------------------
 
-def build_timing_history(snapshots: List[Dict]) -> Dict[str, List[Dict]]:
+def build_timing_history(
+    snapshots: Union[List[Dict], ColumnarHistory],
+    quantile: Optional[float] = None,
+) -> Dict[str, List[Dict]]:
     """
     Returns:
     {
@@ -131,31 +315,97 @@ def build_timing_history(snapshots: List[Dict]) -> Dict[str, List[Dict]]:
             ...
         ]
     }
+
+    With `quantile` (0-1), each point also carries "quantile_duration" read
+    from the edge's stored sketch, or avg_duration for snapshots without one.
+
+    `snapshots` may also be a `ColumnarHistory`; quantiles then come from
+    its p50/p95/p99 columns instead of sketches.
     """
+    if isinstance(snapshots, ColumnarHistory):
+        return _columnar_timing_history(snapshots, quantile)
+
     history = {}
 
     for snap in snapshots:
         ts = snap["snapshot_id"]
         for edge_key, meta in snap["edge_signature"].items():
-            history.setdefault(edge_key, []).append({
+            point = {
                 "timestamp": ts,
                 "avg_duration": meta.get("avg_duration", 0.0),
-            })
+            }
+
+            if quantile is not None:
+                point["quantile_duration"] = edge_quantile(meta, quantile)
+
+            history.setdefault(edge_key, []).append(point)
 
     return history
 
 
+def _columnar_timing_history(
+    columns: ColumnarHistory,
+    quantile: Optional[float],
+) -> Dict[str, List[Dict]]:
+    durations = columns.column("avg_duration")
+    quantiles = columns.quantile_of(quantile) if quantile is not None else None
+    present = columns.present()
+    timestamps = columns.snapshot_ids.tolist()
+
+    history = {}
+
+    for edge_id, edge_key in enumerate(columns.edges):
+        rows = np.flatnonzero(present[:, edge_id])
+        values = durations[rows, edge_id].tolist()
+
+        points = [
+            {"timestamp": timestamps[row], "avg_duration": value}
+            for row, value in zip(rows.tolist(), values)
+        ]
+        if quantiles is not None:
+            for point, value in zip(points, quantiles[rows, edge_id].tolist()):
+                point["quantile_duration"] = value
+
+        history[edge_key] = points
+
+    return history
+
+
+def edge_quantile(meta: Dict, quantile: float) -> float:
+    """Quantile of one edge entry, from its sketch when it has one."""
+    sketch = meta.get("sketch")
+    if sketch:
+        return DDSketch.from_dict(sketch).quantile(quantile)
+    return meta.get("avg_duration", 0.0)
+
+
+def merge_edge_sketches(
+    snapshots: List[Dict],
+    edge_key: str,
+) -> Optional[DDSketch]:
+    """
+    Merge one edge's sketches across snapshots, e.g. a week of windows,
+    so long-horizon percentiles need no raw samples.
+    """
+    return merge_sketches(
+        snap["edge_signature"].get(edge_key, {}).get("sketch")
+        for snap in snapshots
+    )
+
+
 # ------------------------------------------------------------------
 # TEMPORAL PATTERN DETECTION
 # ------------------------------------------------------------------
 
 def detect_monotonic_increase(
     timing_history: Dict[str, List[Dict]],
-    min_points: int = 3
+    min_points: int = 3,
+    field: str = "avg_duration",
 ) -> List[str]:
     """
-    Detect edges whose avg_duration increases monotonically
-    across at least `min_points` snapshots.
+    Detect edges whose `field` (avg_duration, or quantile_duration from
+    a quantile timing history) increases monotonically across at least
+    `min_points` snapshots.
     """
 
     drifting_edges = []
@@ -164,7 +414,7 @@ def detect_monotonic_increase(
         if len(values) < min_points:
             continue
 
-        durations = [v["avg_duration"] for v in values]
+        durations = [v[field] for v in values]
 
         if durations == sorted(durations) and len(set(durations)) > 1:
             drifting_edges.append(edge_key)
@@ -1,6 +1,10 @@
 from __future__ import annotations
 
 import time
+
+from ses_intelligence.call_paths import CallPathTrie
+from ses_intelligence.latency import percentiles, to_sparse
+
 from .history import SnapshotStore
 
 
@@ -9,12 +13,25 @@ class BehaviorSnapshot:
     Immutable snapshot of BehaviorGraph state.
     """
 
-    def __init__(self, behavior_graph, label: str | None = None):
+    def __init__(
+        self,
+        behavior_graph,
+        label: str | None = None,
+        window_seconds: float | None = None,
+    ):
         self.timestamp = time.time()
         self.label = label or f"snapshot_{int(self.timestamp)}"
 
-        # Copy underlying networkx graph
-        self.graph = behavior_graph.graph.copy()
+        # Length of the tumbling window this snapshot covers, when it was
+        # taken by the scheduler rather than from the cumulative graph.
+        self.window_seconds = window_seconds
+
+        # Materialize a networkx view of the edge store
+        self.graph = behavior_graph.to_networkx()
+
+        # Pruned call-path trie, when call-path aggregation is enabled.
+        call_paths = CallPathTrie.from_graph(behavior_graph)
+        self.call_paths = call_paths.prune() if call_paths.paths else None
 
     # ------------------------------------------------------------
     # EDGE SIGNATURE
@@ -37,6 +54,44 @@ class BehaviorSnapshot:
                 "avg_duration": avg_duration,
             }
 
+            self_duration = data.get("self_duration")
+            if self_duration is not None and call_count > 0:
+                signature[(u, v)]["avg_self_duration"] = (
+                    self_duration / call_count
+                )
+
+            cpu_count = data.get("cpu_count")
+            if cpu_count:
+                signature[(u, v)]["avg_cpu_duration"] = (
+                    data.get("cpu_duration", 0.0) / cpu_count
+                )
+
+            memory_count = data.get("memory_count")
+            if memory_count:
+                signature[(u, v)]["avg_net_bytes"] = (
+                    data.get("net_bytes", 0.0) / memory_count
+                )
+                signature[(u, v)]["peak_bytes"] = data.get("peak_bytes", 0.0)
+
+            result_rows = data.get("result_rows")
+            if result_rows and call_count > 0:
+                signature[(u, v)]["avg_rows"] = result_rows / call_count
+
+            outcome_count = data.get("outcome_count")
+            if outcome_count:
+                signature[(u, v)]["miss_rate"] = (
+                    data.get("miss_count", 0.0) / outcome_count
+                )
+
+            histogram = data.get("histogram")
+            if histogram and any(histogram):
+                signature[(u, v)]["histogram"] = to_sparse(histogram)
+                signature[(u, v)].update(percentiles(histogram))
+
+            sketch = data.get("sketch")
+            if sketch is not None and sketch.bins:
+                signature[(u, v)]["sketch"] = sketch.to_dict()
+
         return signature
 
     # ------------------------------------------------------------
@@ -0,0 +1,369 @@
+"""Segmented append-only log of snapshot records.
+
+Records are compact JSON, each prefixed with its 4-byte big-endian length,
+appended to size-bounded segment files (``segment-000000.log``). Next to each
+segment an offset index (``segment-000000.idx``) holds one 8-byte offset per
+record, so record ``i`` of a segment is one seek away. A small
+``manifest.json`` lists the segments and how many records each holds; it is
+only rewritten when a segment is sealed or segments are deleted.
+
+The log behaves like a list: positions run from 0 (oldest retained record)
+to ``len(log) - 1``. `read` and `tail` cost O(requested records) whatever
+the history length, and `delete_before` / `compact` drop whole sealed
+segments at once.
+
+Writers serialize on an `fcntl.flock` of ``writer.lock`` and re-read the
+active segment's size before every append, so several processes may append
+to one directory. Only a writer holding the lock repairs a record torn by a
+crash; readers never truncate anything and pick up new records on their
+next read. A reader whose manifest lists segments that another process has
+just deleted re-reads the manifest and retries. POSIX only (`fcntl`).
+"""
+
+from __future__ import annotations
+
+import bisect
+import fcntl
+import json
+import os
+import struct
+import threading
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+
+MANIFEST_NAME = "manifest.json"
+LOCK_NAME = "writer.lock"
+SEGMENT_BYTES = 8 * 1024 * 1024
+
+_LENGTH = struct.Struct(">I")
+_OFFSET = struct.Struct(">Q")
+
+# Attempts at a read whose segments keep being deleted under it.
+_READ_RETRIES = 10
+
+
+def _write_json_atomic(path: Path, data: Dict) -> None:
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+def _frame(record: Dict) -> bytes:
+    payload = json.dumps(record, separators=(",", ":")).encode("utf-8")
+    return _LENGTH.pack(len(payload)) + payload
+
+
+class _WriterLock:
+    """Exclusive `flock` on the directory's lock file, across processes."""
+
+    def __init__(self, path: Path):
+        self.path = path
+
+    def __enter__(self):
+        # Opened per use, so a forked child never shares the parent's lock.
+        self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        fcntl.flock(self.fd, fcntl.LOCK_UN)
+        os.close(self.fd)
+
+
+class SnapshotLog:
+    """An append-only record log in `directory`.
+
+    `initial_records` is only called when this call creates the log; the
+    records it returns are written before any other process can open the
+    log (e.g. records imported from an older layout).
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        segment_bytes: int = SEGMENT_BYTES,
+        initial_records: Optional[Callable[[], Iterable[Dict]]] = None,
+    ):
+        if segment_bytes <= _LENGTH.size:
+            raise ValueError("segment_bytes is too small")
+
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.segment_bytes = segment_bytes
+        self._lock = threading.Lock()
+
+        self._manifest_path = self.directory / MANIFEST_NAME
+        self._lock_path = self.directory / LOCK_NAME
+        self.created = False
+        if not self._manifest_path.exists():
+            with self._writer_lock():
+                self.created = not self._manifest_path.exists()
+                if self.created:
+                    self._create(initial_records() if initial_records else ())
+        if not self.created:
+            self._load_manifest()
+
+    def _create(self, records: Iterable[Dict]) -> None:
+        # With the writer lock held. The manifest goes last: until it
+        # exists, other processes wait on the lock to create the log
+        # themselves, and then find it complete. Files left by a creation
+        # that crashed are emptied.
+        self._segments: List[Dict] = [{"id": 0, "count": 0}]
+        self._active_size = 0
+        self._segment_path(self._segments[0]).write_bytes(b"")
+        self._index_path(self._segments[0]).write_bytes(b"")
+        for record in records:
+            self._write_frame(_frame(record), write_manifest=False)
+        self._write_manifest()
+
+    # --------------------------------------------------
+    # MANIFEST
+    # --------------------------------------------------
+
+    def _write_manifest(self) -> None:
+        _write_json_atomic(self._manifest_path, {
+            "version": 1,
+            "segments": self._segments,
+        })
+
+    def _load_manifest(self) -> None:
+        with open(self._manifest_path, "r") as f:
+            self._segments = json.load(f)["segments"]
+
+    def _writer_lock(self) -> _WriterLock:
+        return _WriterLock(self._lock_path)
+
+    def _refresh(self) -> None:
+        # Pick up records and segments written by another process. The
+        # manifest is small and re-read every time: mtimes are too coarse
+        # and inode numbers are reused, so neither reliably shows a change.
+        # The active segment's count lives in its index size.
+        self._load_manifest()
+
+        active = self._segments[-1]
+        index_size = self._index_path(active).stat().st_size
+        active["count"] = index_size // _OFFSET.size
+
+    def _segment_path(self, segment: Dict) -> Path:
+        return self.directory / f"segment-{segment['id']:06d}.log"
+
+    def _index_path(self, segment: Dict) -> Path:
+        return self.directory / f"segment-{segment['id']:06d}.idx"
+
+    def _recover(self) -> None:
+        """Find where the active segment's last whole record ends, dropping
+        a record torn by a crash mid-append. Only with the writer lock held.
+        """
+        active = self._segments[-1]
+        segment_path = self._segment_path(active)
+        index_path = self._index_path(active)
+        segment_path.touch()
+        index_path.touch()
+
+        index_size = index_path.stat().st_size
+        count = index_size // _OFFSET.size
+        segment_size = segment_path.stat().st_size
+
+        end = 0
+        while count:
+            with open(index_path, "rb") as f:
+                f.seek((count - 1) * _OFFSET.size)
+                (offset,) = _OFFSET.unpack(f.read(_OFFSET.size))
+            if offset + _LENGTH.size <= segment_size:
+                with open(segment_path, "rb") as f:
+                    f.seek(offset)
+                    (length,) = _LENGTH.unpack(f.read(_LENGTH.size))
+                end = offset + _LENGTH.size + length
+                if end <= segment_size:
+                    break
+            count -= 1
+            end = 0
+
+        if index_size != count * _OFFSET.size:
+            os.truncate(index_path, count * _OFFSET.size)
+        if segment_size != end:
+            os.truncate(segment_path, end)
+
+        active["count"] = count
+        self._active_size = end
+
+    # --------------------------------------------------
+    # WRITING
+    # --------------------------------------------------
+
+    def append(self, record: Dict) -> Path:
+        """Append `record`; returns the segment it was written to."""
+        frame = _frame(record)
+
+        with self._lock, self._writer_lock():
+            # Another process may have appended or rolled since our last
+            # write, so start from the files, not from cached sizes.
+            self._load_manifest()
+            self._recover()
+            return self._write_frame(frame)
+
+    def append_from_last(
+        self,
+        build: Callable[[Tuple[int, int], Callable[[], Optional[Dict]]], Dict],
+    ) -> Tuple[Path, Tuple[int, int]]:
+        """Append the record `build(end, last)` returns, holding the writer
+        lock throughout, so a record can be derived from the latest one
+        without another process appending in between.
+
+        `end` identifies the latest record: equal ends mean nothing was
+        appended in between. `last()` reads that record (None when the log
+        is empty). Returns the segment written to and the new end.
+        """
+        with self._lock, self._writer_lock():
+            self._load_manifest()
+            self._recover()
+            record = build(self._end(), self._last)
+            segment_path = self._write_frame(_frame(record))
+            return segment_path, self._end()
+
+    def _end(self) -> Tuple[int, int]:
+        active = self._segments[-1]
+        return active["id"], active["count"]
+
+    def _last(self) -> Optional[Dict]:
+        for segment in reversed(self._segments):
+            count = segment["count"]
+            if count:
+                return self._read_segment(segment, count - 1, count)[0]
+        return None
+
+    def _write_frame(self, frame: bytes, write_manifest: bool = True) -> Path:
+        """Append one framed record, rolling to a new segment when the
+        active one is full. Only with the writer lock held.
+        """
+        active = self._segments[-1]
+        if (
+            active["count"]
+            and self._active_size + len(frame) > self.segment_bytes
+        ):
+            active = {"id": active["id"] + 1, "count": 0}
+            self._segments.append(active)
+            self._active_size = 0
+            # Not listed in the manifest yet, so any content is left over
+            # from a crash.
+            self._segment_path(active).write_bytes(b"")
+            self._index_path(active).write_bytes(b"")
+            if write_manifest:
+                self._write_manifest()
+
+        segment_path = self._segment_path(active)
+        with open(segment_path, "ab") as f:
+            f.write(frame)
+        with open(self._index_path(active), "ab") as f:
+            f.write(_OFFSET.pack(self._active_size))
+
+        self._active_size += len(frame)
+        active["count"] += 1
+        return segment_path
+
+    def delete_before(self, position: int) -> int:
+        """Delete every sealed segment whose records all lie before
+        `position`; returns the number of records removed.
+        """
+        with self._lock, self._writer_lock():
+            self._refresh()
+
+            removed = 0
+            dropped = 0
+            for segment in self._segments[:-1]:
+                if removed + segment["count"] > position:
+                    break
+                removed += segment["count"]
+                dropped += 1
+
+            if dropped:
+                deleted = self._segments[:dropped]
+                self._segments = self._segments[dropped:]
+                self._write_manifest()
+                for segment in deleted:
+                    self._segment_path(segment).unlink(missing_ok=True)
+                    self._index_path(segment).unlink(missing_ok=True)
+
+            return removed
+
+    def compact(self, keep_last: int) -> int:
+        """Delete whole segments older than the last `keep_last` records
+        (more may be kept, up to one segment's worth).
+        """
+        return self.delete_before(len(self) - keep_last)
+
+    # --------------------------------------------------
+    # READING
+    # --------------------------------------------------
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._refresh()
+            return sum(segment["count"] for segment in self._segments)
+
+    def _read_segment(self, segment: Dict, start: int, stop: int) -> List[Dict]:
+        with open(self._index_path(segment), "rb") as f:
+            f.seek(start * _OFFSET.size)
+            (offset,) = _OFFSET.unpack(f.read(_OFFSET.size))
+
+        records = []
+        with open(self._segment_path(segment), "rb") as f:
+            f.seek(offset)
+            for _ in range(stop - start):
+                (length,) = _LENGTH.unpack(f.read(_LENGTH.size))
+                records.append(json.loads(f.read(length)))
+        return records
+
+    def read(self, start: int = 0, stop: Optional[int] = None) -> List[Dict]:
+        """Records at positions ``start:stop``, oldest first (negative
+        positions count from the end, as for a list).
+        """
+        with self._lock:
+            for attempt in range(_READ_RETRIES):
+                self._refresh()
+                try:
+                    return self._read_range(start, stop)
+                except FileNotFoundError:
+                    # A concurrent `delete_before` removed segments listed
+                    # in the manifest we read; positions are resolved
+                    # again against the new one.
+                    if attempt == _READ_RETRIES - 1:
+                        raise
+
+    def _read_range(self, start: int, stop: Optional[int]) -> List[Dict]:
+        segments = self._segments
+
+        starts = []
+        total = 0
+        for segment in segments:
+            starts.append(total)
+            total += segment["count"]
+
+        start, stop, _ = slice(start, stop).indices(total)
+        records: List[Dict] = []
+        if start >= stop:
+            return records
+
+        i = bisect.bisect_right(starts, start) - 1
+        position = start
+        while position < stop:
+            segment = segments[i]
+            first = position - starts[i]
+            last = min(segment["count"], stop - starts[i])
+            if last > first:
+                records.extend(self._read_segment(segment, first, last))
+                position = starts[i] + last
+            i += 1
+
+        return records
+
+    def tail(self, n: int) -> List[Dict]:
+        """The last `n` records, oldest first."""
+        if n <= 0:
+            return []
+        return self.read(-n)
+
+    def __iter__(self) -> Iterator[Dict]:
+        return iter(self.read())
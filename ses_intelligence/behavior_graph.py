@@ -1,36 +1,646 @@
+"""Compact edge store for traced caller -> callee calls.
+
+Function names are interned once into process-wide integer ids, and each
+edge is a row in a set of preallocated, geometrically grown `array` columns.
+The tracer only touches an int-keyed dict and a few array slots per call.
+Each edge's latency distribution is one sparse DDSketch bin map
+(see `ses_intelligence.sketch`); its log-bucketed histogram (see
+`ses_intelligence.latency`) is derived from the bins when edges are read,
+which places a duration within 1% of a bucket boundary in either bucket.
+Besides the inclusive duration of each call, the store keeps its self
+(exclusive) time: the inclusive time minus the time spent in traced callees,
+and, for calls traced with CPU timing on, their thread CPU time next to the
+wall time, and for memory-sampled calls their net and peak allocated bytes
+(see `ses_intelligence.memory`). Edges to SQL statements also count the rows
+they returned or changed (see `ses_intelligence.sql`).
+
+A `networkx.DiGraph` is built on demand (`to_networkx()` / `.graph`) for
+snapshots and centrality.
+"""
+
+import math
+import threading
+from array import array
+from typing import Dict, Iterator, List, NamedTuple
+
 import networkx as nx
 
+from ses_intelligence.latency import (
+    NUM_BUCKETS,
+    bucket_bounds,
+    bucket_index,
+    percentiles,
+)
+from ses_intelligence.sketch import (
+    INV_LOG_GAMMA,
+    MIN_VALUE,
+    DDSketch,
+    bin_index,
+)
+
+
+# ------------------------------------------------------------
+# NAME INTERNING
+# ------------------------------------------------------------
+
+_name_ids: Dict[str, int] = {}
+_names: List[str] = []
+_intern_lock = threading.Lock()
+
+EDGE_KEY_SHIFT = 32
+
+
+def intern_name(name: str) -> int:
+    """Return the process-wide id for a function name."""
+    node_id = _name_ids.get(name)
+    if node_id is not None:
+        return node_id
+
+    with _intern_lock:
+        node_id = _name_ids.get(name)
+        if node_id is None:
+            node_id = len(_names)
+            _names.append(name)
+            _name_ids[name] = node_id
+
+    return node_id
+
+
+def name_of(node_id: int) -> str:
+    return _names[node_id]
+
+
+# Edge keys join caller and callee with "|" and call paths join frames with
+# ";"; names built from arbitrary text (SQL, cache aliases, hosts) must not
+# contain either.
+_SEPARATORS = str.maketrans({"|": "\u00a6", ";": "\u204f"})
+
+
+def leaf_name(name: str) -> str:
+    """`name` with the edge and path separators replaced by look-alikes
+    ("|" by "¦", ";" by "⁏").
+    """
+    return name.translate(_SEPARATORS)
+
+
+def edge_key(caller_id: int, callee_id: int) -> int:
+    return (caller_id << EDGE_KEY_SHIFT) | callee_id
+
+
+_ceil = math.ceil
+_log = math.log
+
+
+def _zeros(typecode: str, length: int) -> array:
+    return array(typecode, bytes(8 * length))
+
+
+# Marks a row whose first sketch bin is not set yet; no real duration
+# reaches a bin index this far from zero.
+_NO_BIN = -(1 << 62)
+
+# Sketch bin index of every duration under `_SHORT_CALL_NS`, so the fast
+# path skips the log for short calls, where its cost matters most. Equal
+# indexes share one int object, keeping the table at 8 bytes an entry.
+_SHORT_CALL_NS = 8192
+_bin_objects: Dict[int, int] = {}
+_SHORT_CALL_BINS = [
+    _bin_objects.setdefault(index, index)
+    for index in (
+        _ceil(_log(ns * 1e-9 or MIN_VALUE) * INV_LOG_GAMMA)
+        for ns in range(_SHORT_CALL_NS)
+    )
+]
+del _bin_objects
+
+
+def _no_bins(length: int) -> array:
+    return array("q", [_NO_BIN]) * length
+
+
+# EdgeStats fields stored in optional columns, allocated the first time
+# a call carries them (CPU timing, memory sampling, SQL rows, outcomes).
+# peak_bytes keeps the largest value; the others are sums.
+OPTIONAL_FIELDS = (
+    "cpu_count",
+    "cpu_duration",
+    "memory_count",
+    "net_bytes",
+    "peak_bytes",
+    "result_rows",
+    "outcome_count",
+    "miss_count",
+)
+
+
+# Histogram bucket of each sketch bin (by the bin's representative value)
+# and back; both are small, bounded by the bins of real durations.
+_bucket_of_bin: Dict[int, int] = {}
+_bin_of_bucket: Dict[int, int] = {}
+_sketch = DDSketch()
+
+
+def _histogram(bins: Dict[int, float]) -> List[float]:
+    counts = [0.0] * NUM_BUCKETS
+    for index, count in bins.items():
+        bucket = _bucket_of_bin.get(index)
+        if bucket is None:
+            bucket = _bucket_of_bin[index] = bucket_index(
+                _sketch._bin_value(index)
+            )
+        counts[bucket] += count
+    return counts
+
+
+def _bin_for_bucket(bucket: int) -> int:
+    index = _bin_of_bucket.get(bucket)
+    if index is None:
+        lower, upper = bucket_bounds(bucket)
+        index = _bin_of_bucket[bucket] = bin_index((lower + upper) / 2)
+    return index
+
+
+class EdgeStats(NamedTuple):
+    caller: str
+    callee: str
+    count: float
+    total_duration: float
+    self_duration: float
+    histogram: List[float]
+    sketch: DDSketch
+    # Calls with a CPU time measurement, and their total CPU time.
+    cpu_count: float = 0.0
+    cpu_duration: float = 0.0
+    # Memory-sampled calls, their total net allocated bytes, and the largest
+    # peak any of them reached.
+    memory_count: float = 0.0
+    net_bytes: float = 0.0
+    peak_bytes: float = 0.0
+    # Rows returned or affected, for SQL statement edges.
+    result_rows: float = 0.0
+    # Dependency calls with a hit/miss outcome (cache lookups, outbound
+    # HTTP requests), and how many of them missed or failed.
+    outcome_count: float = 0.0
+    miss_count: float = 0.0
+
+
+# ------------------------------------------------------------
+# EDGE STORE
+# ------------------------------------------------------------
 
 class BehaviorGraph:
-    def __init__(self):
-        self.graph = nx.DiGraph()
+    INITIAL_CAPACITY = 64
+
+    def __init__(self, capacity: int = INITIAL_CAPACITY):
+        # edge key -> row index into the columns below
+        self._rows: Dict[int, int] = {}
+        self._size = 0
+        self._capacity = capacity
+
+        self._callers = _zeros("q", capacity)
+        self._callees = _zeros("q", capacity)
+        self._durations = _zeros("d", capacity)
+        # OPTIONAL_FIELDS name -> column, only once some call carried it.
+        # "child_duration" (inclusive minus self time) is optional too:
+        # leaf calls never write it, and self time is derived from it.
+        # Likewise "unbinned_count": an edge's call count is the weight of
+        # its sketch bins, plus totals added without a distribution.
+        self._optional: Dict[str, array] = {}
+        # Sketch bins: the first bin an edge saw and its weighted count sit
+        # in two columns, since most edges keep to a narrow band of
+        # durations; other bins go to a per-row dict, created on demand.
+        self._first_bins = _no_bins(capacity)
+        self._first_counts = _zeros("d", capacity)
+        self._more_bins: Dict[int, Dict[int, float]] = {}
+        # call path id -> [count, total_duration, self_duration]; only
+        # filled when call-path aggregation is enabled (see `call_paths`).
+        self._paths: Dict[int, List[float]] = {}
+
+    # --------------------------------------------------
+    # RECORDING
+    # --------------------------------------------------
+
+    def _grow(self):
+        extra = self._capacity
+        self._callers.extend(_zeros("q", extra))
+        self._callees.extend(_zeros("q", extra))
+        self._durations.extend(_zeros("d", extra))
+        self._first_bins.extend(_no_bins(extra))
+        self._first_counts.extend(_zeros("d", extra))
+        for column in self._optional.values():
+            column.extend(_zeros("d", extra))
+        self._capacity += extra
+
+    def _column(self, name: str) -> array:
+        """The optional column `name`, allocated on first use."""
+        column = self._optional.get(name)
+        if column is None:
+            column = self._optional[name] = _zeros("d", self._capacity)
+        return column
 
-    def add_call(self, caller, callee, duration):
-        if not self.graph.has_node(caller):
-            self.graph.add_node(caller)
+    def _add_bin(self, row: int, index: int, weight: float) -> None:
+        first = self._first_bins[row]
+        if first == index:
+            self._first_counts[row] += weight
+        elif first == _NO_BIN:
+            self._first_bins[row] = index
+            self._first_counts[row] = weight
+        else:
+            bins = self._more_bins.get(row)
+            if bins is None:
+                self._more_bins[row] = {index: weight}
+            else:
+                bins[index] = bins.get(index, 0.0) + weight
+
+    def _bins(self, row: int) -> Dict[int, float]:
+        """Sketch bins of one row as `{bin index: weighted count}`."""
+        bins = dict(self._more_bins.get(row, ()))
+        first = self._first_bins[row]
+        if first != _NO_BIN:
+            bins[first] = bins.get(first, 0.0) + self._first_counts[row]
+        return bins
+
+    def _new_row(self, key: int, caller_id: int, callee_id: int) -> int:
+        row = self._size
+        if row == self._capacity:
+            self._grow()
+
+        self._callers[row] = caller_id
+        self._callees[row] = callee_id
+        self._size = row + 1
+        self._rows[key] = row
+        return row
+
+    def add_call_ids(
+        self,
+        caller_id,
+        callee_id,
+        duration,
+        weight=1.0,
+        self_duration=None,
+        cpu_duration=None,
+    ):
+        """Hot-path variant of `add_call` taking interned ids."""
+        key = (caller_id << EDGE_KEY_SHIFT) | callee_id
+        row = self._rows.get(key)
+        if row is None:
+            row = self._new_row(key, caller_id, callee_id)
+
+        self._durations[row] += duration * weight
+        if self_duration is not None and self_duration != duration:
+            self._column("child_duration")[row] += (
+                duration - self_duration
+            ) * weight
 
-        if not self.graph.has_node(callee):
-            self.graph.add_node(callee)
+        if cpu_duration is not None:
+            self._column("cpu_count")[row] += weight
+            self._column("cpu_duration")[row] += cpu_duration * weight
+
+        # Inlined `sketch.bin_index` for the default accuracy. Durations come
+        # from a nanosecond clock, so only an exact zero needs clamping.
+        index = _ceil(_log(duration or MIN_VALUE) * INV_LOG_GAMMA)
+        if self._first_bins[row] == index:
+            self._first_counts[row] += weight
+        else:
+            self._add_bin(row, index, weight)
+
+    def add_call_ns(self, caller_id, callee_id, elapsed_ns, child_ns):
+        """Unweighted `add_call_ids` in integer nanoseconds, for the
+        inlined fast path of `trace_behavior`.
+        """
+        key = (caller_id << EDGE_KEY_SHIFT) | callee_id
+        row = self._rows.get(key)
+        if row is None:
+            row = self._new_row(key, caller_id, callee_id)
+
+        duration = elapsed_ns * 1e-9
+        self._durations[row] += duration
+        if child_ns:
+            self._column("child_duration")[row] += child_ns * 1e-9
+
+        if elapsed_ns < _SHORT_CALL_NS:
+            index = _SHORT_CALL_BINS[elapsed_ns]
+        else:
+            index = _ceil(_log(duration) * INV_LOG_GAMMA)
 
-        if self.graph.has_edge(caller, callee):
-            self.graph[caller][callee]["count"] += 1
-            self.graph[caller][callee]["total_duration"] += duration
+        # `_add_bin`, inlined.
+        first = self._first_bins[row]
+        if first == index:
+            self._first_counts[row] += 1.0
+        elif first == _NO_BIN:
+            self._first_bins[row] = index
+            self._first_counts[row] = 1.0
         else:
-            self.graph.add_edge(
-                caller,
-                callee,
-                count=1,
-                total_duration=duration
+            bins = self._more_bins.get(row)
+            if bins is None:
+                self._more_bins[row] = {index: 1.0}
+            else:
+                bins[index] = bins.get(index, 0.0) + 1.0
+
+    def add_call(
+        self,
+        caller,
+        callee,
+        duration,
+        weight=1,
+        self_duration=None,
+        cpu_duration=None,
+    ):
+        """Record one observed call.
+
+        `weight` is the number of real calls this observation stands for
+        (1 / sampling probability), so sampled counts and durations remain
+        unbiased estimates of the full traffic. `self_duration` defaults to
+        `duration`, i.e. a call with no traced callees. `cpu_duration` is
+        the thread CPU time of the call, when measured.
+        """
+        self.add_call_ids(
+            intern_name(caller),
+            intern_name(callee),
+            duration,
+            weight,
+            self_duration,
+            cpu_duration,
+        )
+
+    def add_totals(
+        self,
+        caller,
+        callee,
+        count,
+        total_duration,
+        histogram=None,
+        sketch_bins=None,
+        self_duration=None,
+        cpu_count=0.0,
+        cpu_duration=0.0,
+        memory_count=0.0,
+        net_bytes=0.0,
+        peak_bytes=0.0,
+        result_rows=0.0,
+        outcome_count=0.0,
+        miss_count=0.0,
+    ):
+        """Add pre-aggregated totals for an edge, e.g. counters read back
+        from `shared_graph` or deltas received by `collector`. Both
+        distributions are optional; a sparse `{bucket: count}` `histogram`
+        is only used when no `sketch_bins` are given, and is then added at
+        each bucket's midpoint.
+        `self_duration` is the total self time and defaults to
+        `total_duration`. `cpu_duration` is the total CPU time of the
+        `cpu_count` calls that measured it; `net_bytes` the total and
+        `peak_bytes` the largest peak of `memory_count` memory-sampled calls.
+        `result_rows` is the total row count of SQL statement edges, and
+        `miss_count` the misses among `outcome_count` dependency calls.
+        """
+        caller_id = intern_name(caller)
+        callee_id = intern_name(callee)
+        key = (caller_id << EDGE_KEY_SHIFT) | callee_id
+
+        row = self._rows.get(key)
+        if row is None:
+            row = self._new_row(key, caller_id, callee_id)
+
+        self._durations[row] += total_duration
+        if self_duration is not None and self_duration != total_duration:
+            self._column("child_duration")[row] += (
+                total_duration - self_duration
             )
+        for name, value in (
+            ("cpu_count", cpu_count),
+            ("cpu_duration", cpu_duration),
+            ("memory_count", memory_count),
+            ("net_bytes", net_bytes),
+            ("result_rows", result_rows),
+            ("outcome_count", outcome_count),
+            ("miss_count", miss_count),
+        ):
+            if value:
+                self._column(name)[row] += value
+        if peak_bytes:
+            peaks = self._column("peak_bytes")
+            if peak_bytes > peaks[row]:
+                peaks[row] = peak_bytes
+
+        binned = 0.0
+        if sketch_bins:
+            for index, bin_count in sketch_bins.items():
+                self._add_bin(row, int(index), bin_count)
+                binned += bin_count
+        elif histogram:
+            for bucket, bucket_count in histogram.items():
+                self._add_bin(row, _bin_for_bucket(int(bucket)), bucket_count)
+                binned += bucket_count
+        if count != binned:
+            self._column("unbinned_count")[row] += count - binned
+
+    def add_memory(self, caller_id, callee_id, net_bytes, peak_bytes):
+        """Attribute one memory-sampled call to an edge already recorded
+        with `add_call_ids`.
+        """
+        row = self._rows[(caller_id << EDGE_KEY_SHIFT) | callee_id]
+        self._column("memory_count")[row] += 1
+        self._column("net_bytes")[row] += net_bytes
+        peaks = self._column("peak_bytes")
+        if peak_bytes > peaks[row]:
+            peaks[row] = peak_bytes
+
+    def add_result_rows(self, caller_id, callee_id, rows):
+        """Add the row count of a statement already recorded with
+        `add_call_ids`.
+        """
+        row = self._rows[(caller_id << EDGE_KEY_SHIFT) | callee_id]
+        self._column("result_rows")[row] += rows
+
+    def add_outcome(self, caller_id, callee_id, hit):
+        """Count the outcome of a dependency call already recorded with
+        `add_call_ids`: a cache hit or a successful request when `hit`.
+        """
+        row = self._rows[(caller_id << EDGE_KEY_SHIFT) | callee_id]
+        self._column("outcome_count")[row] += 1
+        if not hit:
+            self._column("miss_count")[row] += 1
+
+    def add_path(self, path_id, duration, self_duration, weight=1.0):
+        stats = self._paths.get(path_id)
+        if stats is None:
+            self._paths[path_id] = [
+                weight, duration * weight, self_duration * weight
+            ]
+        else:
+            stats[0] += weight
+            stats[1] += duration * weight
+            stats[2] += self_duration * weight
+
+    def add_path_totals(self, path_id, count, total, self_total):
+        """Add pre-aggregated totals for a call path, e.g. received by
+        `collector`.
+        """
+        stats = self._paths.get(path_id)
+        if stats is None:
+            self._paths[path_id] = [count, total, self_total]
+        else:
+            stats[0] += count
+            stats[1] += total
+            stats[2] += self_total
+
+    def merge(self, other: "BehaviorGraph"):
+        """Add every edge and call-path total of `other` into this graph."""
+        paths = self._paths
+        for path_id, (count, total, self_total) in other._paths.items():
+            stats = paths.get(path_id)
+            if stats is None:
+                paths[path_id] = [count, total, self_total]
+            else:
+                stats[0] += count
+                stats[1] += total
+                stats[2] += self_total
+
+        optional = [
+            (name, source, self._column(name))
+            for name, source in other._optional.items()
+        ]
+
+        for src_row in range(other._size):
+            caller_id = other._callers[src_row]
+            callee_id = other._callees[src_row]
+            key = (caller_id << EDGE_KEY_SHIFT) | callee_id
+
+            row = self._rows.get(key)
+            if row is None:
+                # Columns grow in place, so `optional` stays valid.
+                row = self._new_row(key, caller_id, callee_id)
+
+            self._durations[row] += other._durations[src_row]
+            for name, source, target in optional:
+                if name == "peak_bytes":
+                    if source[src_row] > target[row]:
+                        target[row] = source[src_row]
+                else:
+                    target[row] += source[src_row]
+
+            first = other._first_bins[src_row]
+            if first != _NO_BIN:
+                self._add_bin(row, first, other._first_counts[src_row])
+            for index, count in other._more_bins.get(src_row, {}).items():
+                self._add_bin(row, index, count)
+
+    def copy(self) -> "BehaviorGraph":
+        clone = BehaviorGraph(max(self._size, 1))
+        clone.merge(self)
+        return clone
+
+    # --------------------------------------------------
+    # READING
+    # --------------------------------------------------
+
+    def is_empty(self):
+        return self._size == 0 and not self._paths
+
+    def iter_paths(self):
+        """`(path_id, [count, total_duration, self_duration])` pairs."""
+        return iter(self._paths.items())
+
+    def has_edge(self, caller, callee):
+        key = edge_key(intern_name(caller), intern_name(callee))
+        return key in self._rows
+
+    def iter_edges(self) -> Iterator[EdgeStats]:
+        optional = self._optional
+        for row in range(self._size):
+            bins = self._bins(row)
+            count = sum(bins.values())
+            if "unbinned_count" in optional:
+                count += optional["unbinned_count"][row]
+            yield EdgeStats(
+                caller=_names[self._callers[row]],
+                callee=_names[self._callees[row]],
+                count=count,
+                total_duration=self._durations[row],
+                self_duration=self._durations[row] - (
+                    optional["child_duration"][row]
+                    if "child_duration" in optional else 0.0
+                ),
+                histogram=_histogram(bins),
+                sketch=DDSketch(bins=bins),
+                **{
+                    name: optional[name][row]
+                    for name in OPTIONAL_FIELDS if name in optional
+                },
+            )
+
+    def to_networkx(self) -> nx.DiGraph:
+        """Build a `networkx.DiGraph` view of the current edge totals."""
+        graph = nx.DiGraph()
+        for edge in self.iter_edges():
+            graph.add_edge(
+                edge.caller,
+                edge.callee,
+                count=edge.count,
+                total_duration=edge.total_duration,
+                self_duration=edge.self_duration,
+                histogram=edge.histogram,
+                sketch=edge.sketch,
+                cpu_count=edge.cpu_count,
+                cpu_duration=edge.cpu_duration,
+                memory_count=edge.memory_count,
+                net_bytes=edge.net_bytes,
+                peak_bytes=edge.peak_bytes,
+                result_rows=edge.result_rows,
+                outcome_count=edge.outcome_count,
+                miss_count=edge.miss_count,
+            )
+        return graph
+
+    @property
+    def graph(self) -> nx.DiGraph:
+        # Kept for callers written against the networkx-backed store. Builds
+        # a fresh graph on every access.
+        return self.to_networkx()
 
     def summary(self):
         summary = []
-        for caller, callee, data in self.graph.edges(data=True):
-            avg_time = data["total_duration"] / data["count"]
-            summary.append({
-                "caller": caller,
-                "callee": callee,
-                "calls": data["count"],
-                "avg_duration": round(avg_time, 4)
-            })
+        for edge in self.iter_edges():
+            avg_time = edge.total_duration / edge.count
+            row = {
+                "caller": edge.caller,
+                "callee": edge.callee,
+                "calls": round(edge.count),
+                "avg_duration": round(avg_time, 4),
+                "avg_self_duration": round(
+                    edge.self_duration / edge.count, 4
+                ),
+            }
+            for name, value in percentiles(edge.histogram).items():
+                row[name] = round(value, 6)
+            summary.append(row)
         return summary
+
+    def node_summary(self):
+        """Per-node inclusive and self time, summed over incoming edges.
+
+        Entry points (functions never called from another traced function)
+        have no incoming edge and are not listed.
+        """
+        nodes: Dict[str, Dict] = {}
+        for edge in self.iter_edges():
+            node = nodes.setdefault(edge.callee, {
+                "node": edge.callee,
+                "calls": 0.0,
+                "total_duration": 0.0,
+                "self_duration": 0.0,
+            })
+            node["calls"] += edge.count
+            node["total_duration"] += edge.total_duration
+            node["self_duration"] += edge.self_duration
+
+        for node in nodes.values():
+            node["calls"] = round(node["calls"])
+            node["total_duration"] = round(node["total_duration"], 6)
+            node["self_duration"] = round(node["self_duration"], 6)
+
+        return sorted(
+            nodes.values(),
+            key=lambda node: node["self_duration"],
+            reverse=True,
+        )
@@ -0,0 +1,114 @@
+"""Benchmark columnar snapshot history against the JSON snapshot log.
+
+Writes `--snapshots` snapshots of `--edges` edges (hourly for a year by
+default) to both stores, then times opening each one and building the
+timing history and risk labels from it.
+
+Usage:
+    python -m ses_intelligence.benchmarks.columnar_history \
+        [--snapshots N] [--edges N]
+"""
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Dict
+
+from ses_intelligence.architecture_health.risk_labels import RiskLabelGenerator
+from ses_intelligence.behavior_change.columnar import ColumnarHistory
+from ses_intelligence.behavior_change.history import build_timing_history
+from ses_intelligence.behavior_change.snapshot_log import SnapshotLog
+
+
+def _records(snapshots: int, edges: int):
+    rng = random.Random(0)
+    for i in range(snapshots):
+        yield {
+            "snapshot_id": f"2026-01-01T00:00:00.{i:06d}",
+            "edge_signature": {
+                f"caller_{j % 50}|callee_{j}": {
+                    "call_count": rng.randint(1, 1000),
+                    "avg_duration": rng.uniform(0.001, 0.010),
+                    "p50_duration": 0.002,
+                    "p95_duration": 0.008,
+                    "p99_duration": 0.012,
+                }
+                for j in range(edges)
+                # A few edges come and go.
+                if j % 17 or i % 3
+            },
+        }
+
+
+def _time_ms(func):
+    start = time.perf_counter_ns()
+    result = func()
+    return (time.perf_counter_ns() - start) / 1e6, result
+
+
+def run(snapshots: int = 8760, edges: int = 200) -> Dict:
+    with TemporaryDirectory() as tmp:
+        log = SnapshotLog(Path(tmp) / "log")
+        columns = ColumnarHistory(Path(tmp) / "columnar", writable=True)
+        for record in _records(snapshots, edges):
+            log.append(record)
+            columns.append(record)
+
+        json_load_ms, records = _time_ms(
+            lambda: SnapshotLog(Path(tmp) / "log").read()
+        )
+        json_history_ms, _ = _time_ms(lambda: build_timing_history(records))
+        json_labels_ms, _ = _time_ms(
+            lambda: RiskLabelGenerator(records).generate()
+        )
+
+        columnar_load_ms, history = _time_ms(
+            lambda: ColumnarHistory(Path(tmp) / "columnar")
+        )
+        columnar_history_ms, _ = _time_ms(
+            lambda: build_timing_history(history)
+        )
+        columnar_labels_ms, _ = _time_ms(
+            lambda: RiskLabelGenerator(history).generate()
+        )
+
+    return {
+        "snapshots": snapshots,
+        "edges": edges,
+        "json": {
+            "load_ms": json_load_ms,
+            "timing_history_ms": json_history_ms,
+            "risk_labels_ms": json_labels_ms,
+        },
+        "columnar": {
+            "load_ms": columnar_load_ms,
+            "timing_history_ms": columnar_history_ms,
+            "risk_labels_ms": columnar_labels_ms,
+        },
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--snapshots", type=int, default=8760)
+    parser.add_argument("--edges", type=int, default=200)
+    args = parser.parse_args(argv)
+
+    result = run(args.snapshots, args.edges)
+
+    for name in ("json", "columnar"):
+        row = result[name]
+        print(
+            f"{name:9s} load {row['load_ms']:9.1f} ms  "
+            f"timing history {row['timing_history_ms']:9.1f} ms  "
+            f"risk labels {row['risk_labels_ms']:9.1f} ms"
+        )
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
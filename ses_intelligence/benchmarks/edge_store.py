@@ -0,0 +1,117 @@
+"""Benchmark the array-backed `BehaviorGraph` against a networkx store.
+
+Records `--edges` distinct caller -> callee edges, then `--calls` repeated
+calls spread over them, and reports per-call cost and retained memory for
+both stores. Exits with status 1 when the array store retains more than
+`MAX_MEMORY_RATIO` of the networkx store's memory per edge.
+
+Usage:
+    python -m ses_intelligence.benchmarks.edge_store [--edges N] [--calls N]
+"""
+
+import argparse
+import sys
+import time
+import tracemalloc
+from typing import Dict
+
+import networkx as nx
+
+from ses_intelligence.behavior_graph import BehaviorGraph, intern_name
+
+
+# The point of the array store: at most this share of networkx's memory.
+MAX_MEMORY_RATIO = 0.5
+
+
+def _networkx_add_call(graph, caller, callee, duration):
+    # The pre-array implementation of BehaviorGraph.add_call.
+    if graph.has_edge(caller, callee):
+        graph[caller][callee]["count"] += 1
+        graph[caller][callee]["total_duration"] += duration
+    else:
+        graph.add_edge(caller, callee, count=1, total_duration=duration)
+
+
+def _measure(record, edges, calls) -> Dict:
+    tracemalloc.start()
+    store = record(None, edges, 0)
+    memory_bytes, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    start = time.perf_counter_ns()
+    record(store, edges, calls)
+    elapsed = time.perf_counter_ns() - start
+
+    return {
+        "bytes_per_edge": memory_bytes / edges,
+        "ns_per_call": elapsed / calls,
+    }
+
+
+def run(edges: int = 20_000, calls: int = 200_000) -> Dict:
+    callers = [f"caller_{i % 500}" for i in range(edges)]
+    callees = [f"callee_{i}" for i in range(edges)]
+    caller_ids = [intern_name(name) for name in callers]
+    callee_ids = [intern_name(name) for name in callees]
+
+    def record_array(store, n_edges, n_calls):
+        if store is None:
+            store = BehaviorGraph()
+            for i in range(n_edges):
+                store.add_call_ids(caller_ids[i], callee_ids[i], 0.001)
+            return store
+        add = store.add_call_ids
+        for i in range(n_calls):
+            j = i % n_edges
+            add(caller_ids[j], callee_ids[j], 0.001)
+        return store
+
+    def record_networkx(store, n_edges, n_calls):
+        if store is None:
+            store = nx.DiGraph()
+            for i in range(n_edges):
+                _networkx_add_call(store, callers[i], callees[i], 0.001)
+            return store
+        for i in range(n_calls):
+            j = i % n_edges
+            _networkx_add_call(store, callers[j], callees[j], 0.001)
+        return store
+
+    array_result = _measure(record_array, edges, calls)
+    networkx_result = _measure(record_networkx, edges, calls)
+    return {
+        "edges": edges,
+        "calls": calls,
+        "array": array_result,
+        "networkx": networkx_result,
+        "memory_ratio": (
+            array_result["bytes_per_edge"] / networkx_result["bytes_per_edge"]
+        ),
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--edges", type=int, default=20_000)
+    parser.add_argument("--calls", type=int, default=200_000)
+    args = parser.parse_args(argv)
+
+    result = run(args.edges, args.calls)
+
+    for name in ("array", "networkx"):
+        row = result[name]
+        print(
+            f"{name:9s} {row['ns_per_call']:8.0f} ns/call "
+            f"{row['bytes_per_edge']:8.0f} bytes/edge"
+        )
+    print(
+        f"memory ratio {result['memory_ratio']:.2f} "
+        f"(target <= {MAX_MEMORY_RATIO:.2f})"
+    )
+
+    return 0 if result["memory_ratio"] <= MAX_MEMORY_RATIO else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
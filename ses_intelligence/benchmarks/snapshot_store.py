@@ -0,0 +1,146 @@
+"""Benchmark `SnapshotStore.save` against history length.
+
+Saves a `--edges`-edge snapshot into an empty store and into a store that
+already holds `--snapshots` snapshots, and reports save latency for both.
+Saving only reads the latest snapshot (once per process), so the two should
+match; the history is filled with one-edge records to keep the run cheap.
+For comparison it also reports one `load_all()` of that history, which the
+old save path repeated for every edge, and a `load_tail(1)`.
+
+Usage:
+    python -m ses_intelligence.benchmarks.snapshot_store \
+        [--snapshots N] [--edges N] [--saves N]
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Dict
+
+from ses_intelligence.behavior_change import history
+from ses_intelligence.behavior_change.history import SnapshotStore
+from ses_intelligence.behavior_change.snapshot_log import SnapshotLog
+
+
+class _Snapshot:
+    # Just what SnapshotStore.save reads.
+    def __init__(self, signature):
+        self._signature = signature
+
+    def edge_signature(self):
+        return self._signature
+
+
+def _signature(edges: int) -> Dict:
+    return {
+        (f"caller_{i % 500}", f"callee_{i}"): {
+            "call_count": 10,
+            "avg_duration": 0.001 * (1 + i % 7),
+            "p50_duration": 0.001,
+            "p95_duration": 0.004,
+            "p99_duration": 0.008,
+        }
+        for i in range(edges)
+    }
+
+
+def _fill_history(directory: Path, snapshots: int, edges: int) -> None:
+    log = SnapshotLog(directory)
+    for i in range(snapshots):
+        # The newest record carries every edge, as a real history would.
+        edge_count = edges if i == snapshots - 1 else 1
+        record = {
+            "snapshot_id": f"2000-01-01T00-00-00.{i:06d}",
+            "created_at": f"2000-01-01T00-00-00.{i:06d}",
+            "edge_signature": {
+                f"caller_{j % 500}|callee_{j}": {
+                    "call_count": 10,
+                    "avg_duration": 0.001,
+                }
+                for j in range(edge_count)
+            },
+        }
+        log.append(record)
+
+
+def _save_ms(directory: Path, snapshot, saves: int) -> Dict:
+    history.SNAPSHOT_DIR = directory
+    history._latest = None
+    history._log = None
+
+    start = time.perf_counter_ns()
+    SnapshotStore.save(snapshot)
+    first = (time.perf_counter_ns() - start) / 1e6
+
+    start = time.perf_counter_ns()
+    for _ in range(saves):
+        SnapshotStore.save(snapshot)
+    warm = (time.perf_counter_ns() - start) / 1e6 / saves
+
+    return {"first_save_ms": first, "save_ms": warm}
+
+
+def run(snapshots: int = 10_000, edges: int = 5_000, saves: int = 5) -> Dict:
+    snapshot = _Snapshot(_signature(edges))
+    previous_dir = history.SNAPSHOT_DIR
+    previous_latest = history._latest
+    previous_log = history._log
+
+    try:
+        with TemporaryDirectory() as empty, TemporaryDirectory() as full:
+            empty_result = _save_ms(Path(empty), snapshot, saves)
+
+            _fill_history(Path(full), snapshots, edges)
+            history.SNAPSHOT_DIR = Path(full)
+            start = time.perf_counter_ns()
+            SnapshotStore.load_all()
+            load_all_ms = (time.perf_counter_ns() - start) / 1e6
+
+            start = time.perf_counter_ns()
+            SnapshotStore.load_tail(1)
+            tail_ms = (time.perf_counter_ns() - start) / 1e6
+
+            full_result = _save_ms(Path(full), snapshot, saves)
+    finally:
+        history.SNAPSHOT_DIR = previous_dir
+        history._latest = previous_latest
+        history._log = previous_log
+
+    return {
+        "snapshots": snapshots,
+        "edges": edges,
+        "empty": empty_result,
+        "history": full_result,
+        "load_all_ms": load_all_ms,
+        "tail_ms": tail_ms,
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--snapshots", type=int, default=10_000)
+    parser.add_argument("--edges", type=int, default=5_000)
+    parser.add_argument("--saves", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    result = run(args.snapshots, args.edges, args.saves)
+
+    for name, label in (("empty", "empty store"), ("history", "with history")):
+        row = result[name]
+        print(
+            f"{label:13s} {row['save_ms']:8.1f} ms/save "
+            f"(first {row['first_save_ms']:.1f} ms)"
+        )
+    print(
+        f"load_all      {result['load_all_ms']:8.1f} ms "
+        f"({result['snapshots']} snapshots; the old save did this per edge)"
+    )
+    print(f"load_tail(1)  {result['tail_ms']:8.1f} ms")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,184 @@
+"""Microbenchmark for the per-call cost of `trace_behavior`.
+
+Runs a traced parent calling a traced leaf in a tight loop and compares it
+with the same loop over plain functions. The difference divided by the
+number of calls is the per-call overhead of recording one edge.
+
+With ``--auto`` the same plain loop is also run under decorator-free
+auto-instrumentation (see `ses_intelligence.auto_instrument`), once with
+this module allowlisted and once with it outside the allowlist, to compare
+both against the decorator.
+
+Usage:
+    python -m ses_intelligence.benchmarks.tracing_overhead [--iterations N]
+        [--auto [--backend monitoring|setprofile]]
+
+Exits non-zero if the fast path misses `FAST_PATH_OVERHEAD_TARGET_NS`.
+The run clears the in-process behavior graph, so run it standalone rather
+than inside a serving process.
+"""
+
+import argparse
+import sys
+import time
+from typing import Dict
+
+from ses_intelligence import auto_instrument, tracing
+from ses_intelligence.runtime_state import clear_process_graph
+
+
+def _leaf():
+    return None
+
+
+def _plain_parent(iterations: int):
+    leaf = _leaf
+    for _ in range(iterations):
+        leaf()
+
+
+# Separate copies for the auto-instrumentation run: `measure_overhead`
+# decorates `_leaf`, and decorated functions are never auto-instrumented.
+def _auto_leaf():
+    return None
+
+
+def _auto_parent(iterations: int):
+    leaf = _auto_leaf
+    for _ in range(iterations):
+        leaf()
+
+
+def _best_of(fn, iterations: int, repeats: int) -> int:
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter_ns()
+        fn(iterations)
+        elapsed = time.perf_counter_ns() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def measure_overhead(iterations: int = 200_000, repeats: int = 5) -> Dict:
+    """Return per-call overhead (ns) of the fast tracing path."""
+
+    traced_leaf = tracing.trace_behavior(_leaf)
+
+    def traced_parent(n):
+        leaf = traced_leaf
+        for _ in range(n):
+            leaf()
+
+    traced_parent = tracing.trace_behavior(traced_parent)
+
+    previous_mode = tracing.get_trace_mode()
+    tracing.set_trace_mode(tracing.TRACE_MODE_FAST)
+    clear_process_graph()
+
+    try:
+        plain_ns = _best_of(_plain_parent, iterations, repeats)
+        traced_ns = _best_of(traced_parent, iterations, repeats)
+    finally:
+        tracing.set_trace_mode(previous_mode)
+        clear_process_graph()
+
+    per_call_ns = max(0.0, (traced_ns - plain_ns) / iterations)
+    target_ns = tracing.FAST_PATH_OVERHEAD_TARGET_NS
+
+    return {
+        "iterations": iterations,
+        "plain_ns_per_call": plain_ns / iterations,
+        "traced_ns_per_call": traced_ns / iterations,
+        "overhead_ns_per_call": per_call_ns,
+        "target_ns_per_call": target_ns,
+        "within_target": per_call_ns <= target_ns,
+    }
+
+
+def measure_auto_overhead(
+    iterations: int = 200_000,
+    repeats: int = 5,
+    backend=None,
+) -> Dict:
+    """Return per-call overhead (ns) of auto-instrumentation next to the
+    decorator, for allowlisted and for unlisted code.
+    """
+    decorator = measure_overhead(iterations, repeats)
+
+    previous_mode = tracing.get_trace_mode()
+    tracing.set_trace_mode(tracing.TRACE_MODE_FAST)
+    clear_process_graph()
+
+    try:
+        plain_ns = _best_of(_auto_parent, iterations, repeats)
+
+        backend = auto_instrument.enable_auto_instrumentation(
+            [_auto_parent.__module__], backend=backend
+        )
+        listed_ns = _best_of(_auto_parent, iterations, repeats)
+
+        auto_instrument.enable_auto_instrumentation(
+            [_auto_parent.__module__ + "_unlisted"], backend=backend
+        )
+        unlisted_ns = _best_of(_auto_parent, iterations, repeats)
+    finally:
+        auto_instrument.disable_auto_instrumentation()
+        tracing.set_trace_mode(previous_mode)
+        clear_process_graph()
+
+    return {
+        "iterations": iterations,
+        "backend": backend,
+        "decorator_overhead_ns_per_call": decorator["overhead_ns_per_call"],
+        "auto_overhead_ns_per_call": max(
+            0.0, (listed_ns - plain_ns) / iterations
+        ),
+        "unlisted_overhead_ns_per_call": max(
+            0.0, (unlisted_ns - plain_ns) / iterations
+        ),
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=200_000)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--auto", action="store_true")
+    parser.add_argument(
+        "--backend",
+        choices=(
+            auto_instrument.BACKEND_MONITORING,
+            auto_instrument.BACKEND_PROFILE,
+        ),
+    )
+    args = parser.parse_args(argv)
+
+    if args.auto:
+        result = measure_auto_overhead(
+            args.iterations, args.repeats, args.backend
+        )
+        print(
+            f"backend:          {result['backend']}\n"
+            f"decorator:        "
+            f"{result['decorator_overhead_ns_per_call']:.0f} ns/call\n"
+            f"auto, allowlisted: "
+            f"{result['auto_overhead_ns_per_call']:.0f} ns/call\n"
+            f"auto, unlisted:   "
+            f"{result['unlisted_overhead_ns_per_call']:.0f} ns/call"
+        )
+        return 0
+
+    result = measure_overhead(args.iterations, args.repeats)
+
+    print(
+        f"plain:    {result['plain_ns_per_call']:.0f} ns/call\n"
+        f"traced:   {result['traced_ns_per_call']:.0f} ns/call\n"
+        f"overhead: {result['overhead_ns_per_call']:.0f} ns/call "
+        f"(target <= {result['target_ns_per_call']} ns)"
+    )
+
+    return 0 if result["within_target"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
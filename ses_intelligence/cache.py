@@ -0,0 +1,166 @@
+"""Django cache backend attribution.
+
+`enable_cache_attribution()` instruments every cache in ``settings.CACHES``
+(``django.core.cache.caches``). Each cache operation run while a traced
+function is on the call stack is recorded as a callee of that function,
+named ``cache:<alias>:<operation>`` (``cache:default:get``), with its count
+and time like any other edge.
+
+Lookups also record their outcome: a ``get`` is a hit when the key was
+found, a ``get_many`` when every requested key was. Snapshots carry the
+share of misses as ``miss_rate`` next to the edge timings.
+
+Operations a backend implements on top of others (``get_or_set`` via
+``get`` and ``add``, the base ``get_many`` via ``get``) are recorded once,
+as the outermost instrumented operation. Operations outside traced code are
+not recorded.
+"""
+
+from __future__ import annotations
+
+import time
+from contextvars import ContextVar
+
+from django.core.cache import caches
+
+from ses_intelligence.behavior_graph import intern_name, leaf_name
+from ses_intelligence.tracing import record_leaf_call
+
+
+CACHE_PREFIX = "cache:"
+
+OPERATIONS = (
+    "get",
+    "get_many",
+    "set",
+    "set_many",
+    "add",
+    "delete",
+    "delete_many",
+    "has_key",
+    "incr",
+    "decr",
+    "touch",
+)
+
+_perf_counter_ns = time.perf_counter_ns
+_MISSING = object()
+
+# Set while an instrumented operation runs, so the operations it is built on
+# are not recorded again.
+_in_operation: ContextVar[bool] = ContextVar("ses_cache_operation", default=False)
+
+
+def _timed(callee_id, method, args, kwargs, outcome=None):
+    if _in_operation.get():
+        return method(*args, **kwargs)
+
+    token = _in_operation.set(True)
+    hit = None
+    start = _perf_counter_ns()
+    try:
+        result = method(*args, **kwargs)
+        if outcome is not None:
+            hit = outcome(result)
+        return result
+    finally:
+        end = _perf_counter_ns()
+        _in_operation.reset(token)
+
+        record_leaf_call(callee_id, start, end, hit=hit)
+
+
+def _wrap(alias, operation, method):
+    callee_id = intern_name(leaf_name(f"{CACHE_PREFIX}{alias}:{operation}"))
+
+    if operation == "get":
+
+        def wrapper(key, default=None, version=None):
+            value = _timed(
+                callee_id,
+                method,
+                (key, _MISSING),
+                {"version": version},
+                lambda value: value is not _MISSING,
+            )
+            return default if value is _MISSING else value
+
+    elif operation == "get_many":
+
+        def wrapper(keys, version=None):
+            keys = list(keys)
+            return _timed(
+                callee_id,
+                method,
+                (keys,),
+                {"version": version},
+                lambda found: len(found) == len(keys),
+            )
+
+    else:
+
+        def wrapper(*args, **kwargs):
+            return _timed(callee_id, method, args, kwargs)
+
+    wrapper.__ses_cache__ = True
+    return wrapper
+
+
+def _instrument(cache, alias):
+    for operation in OPERATIONS:
+        method = getattr(cache, operation, None)
+        if method is None or getattr(method, "__ses_cache__", False):
+            continue
+        setattr(cache, operation, _wrap(alias, operation, method))
+
+
+def _uninstrument(cache):
+    for operation in OPERATIONS:
+        method = vars(cache).get(operation)
+        if getattr(method, "__ses_cache__", False):
+            delattr(cache, operation)
+
+
+# ------------------------------------------------------------
+# INSTALLATION
+# ------------------------------------------------------------
+
+_enabled = False
+
+
+def enable_cache_attribution() -> None:
+    """Record operations on all configured caches, including cache
+    instances created later (Django creates them per thread).
+    """
+    global _enabled
+
+    if _enabled:
+        return
+
+    create_connection = caches.create_connection
+
+    def instrumented_create_connection(alias):
+        cache = create_connection(alias)
+        _instrument(cache, alias)
+        return cache
+
+    caches.create_connection = instrumented_create_connection
+    for alias in caches:
+        _instrument(caches[alias], alias)
+    _enabled = True
+
+
+def disable_cache_attribution() -> None:
+    global _enabled
+
+    if not _enabled:
+        return
+
+    del caches.create_connection
+    for alias in caches:
+        _uninstrument(caches[alias])
+    _enabled = False
+
+
+def cache_attribution_enabled() -> bool:
+    return _enabled
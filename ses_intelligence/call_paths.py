@@ -0,0 +1,277 @@
+"""Call-path aggregation (optional).
+
+Edges lose context: ``save_user`` called from ``signup`` and from a batch
+job is one node. With `configure_call_paths()` enabled, every traced call is
+also attributed to its full call path (``signup;save_user``), with count,
+total and self time, so the same function can be told apart by how it was
+reached.
+
+Paths are interned process-wide as a prefix trie: path id 0 is the root,
+and every other id is ``(parent path id, node id)``. Each call frame
+memoizes its path id, so a call does one dict lookup on top of edge
+recording. Per-path totals live in `BehaviorGraph` next to the edges, so
+they are flushed, windowed and snapshotted with them.
+
+Memory is bounded in two places:
+
+- live: at most `max_paths` interned paths and `max_depth` frames per path.
+  Past those limits calls are attributed to an ``[other]`` child of the
+  deepest known prefix (deeper recursion collapses into it too).
+- export: `CallPathTrie.prune()` folds paths with less than `min_share` of
+  the total time into their parent's self time before a snapshot stores
+  them.
+
+`CallPathTrie.folded()` renders the folded-stack format read by
+flamegraph tools (``frame;frame;frame value`` per line).
+"""
+
+from __future__ import annotations
+
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from ses_intelligence.behavior_graph import intern_name, name_of
+
+
+ROOT_PATH = 0
+OTHER_NAME = "[other]"
+
+# Call frame layout, as in `runtime_state` (which imports snapshots and so
+# cannot be imported from here). `CALL_PATH` holds the memoized path id.
+CALL_ID = 0
+CALL_PARENT = 1
+CALL_CHILD_NS = 2
+CALL_PATH = 3
+
+
+class CallPathConfig:
+    """Process-wide call-path settings (see `configure_call_paths`)."""
+
+    def __init__(self):
+        self.enabled = False
+        self.max_paths = 10_000
+        self.max_depth = 64
+        self.min_share = 0.001
+
+
+_config = CallPathConfig()
+
+
+def configure_call_paths(
+    enabled: bool = True,
+    max_paths: int = 10_000,
+    max_depth: int = 64,
+    min_share: float = 0.001,
+) -> None:
+    """Enable or tune call-path aggregation.
+
+    `min_share` is the fraction of total time below which a path is folded
+    into its parent when snapshots are taken.
+    """
+    if max_paths < 2 or max_depth < 1:
+        raise ValueError("max_paths must be >= 2 and max_depth >= 1")
+    if not 0.0 <= min_share < 1.0:
+        raise ValueError("min_share must be in [0, 1)")
+
+    _config.enabled = enabled
+    _config.max_paths = max_paths
+    _config.max_depth = max_depth
+    _config.min_share = min_share
+
+    # Imported here: tracing imports this module.
+    from ses_intelligence.tracing import refresh_fast_path
+
+    refresh_fast_path()
+
+
+def call_paths_enabled() -> bool:
+    return _config.enabled
+
+
+# ------------------------------------------------------------
+# PATH INTERNING
+# ------------------------------------------------------------
+
+_path_ids: Dict[Tuple[int, int], int] = {}
+_path_parents: List[int] = [ROOT_PATH]
+_path_nodes: List[int] = [-1]
+_path_depths: List[int] = [0]
+_path_lock = threading.Lock()
+
+
+def intern_path(parent_path: int, node_id: int) -> int:
+    """Return the process-wide id of `parent_path` extended by `node_id`."""
+    key = (parent_path, node_id)
+    path_id = _path_ids.get(key)
+    if path_id is not None:
+        return path_id
+
+    with _path_lock:
+        path_id = _path_ids.get(key)
+        if path_id is not None:
+            return path_id
+
+        if (
+            len(_path_parents) >= _config.max_paths
+            or _path_depths[parent_path] >= _config.max_depth
+        ):
+            other = intern_name(OTHER_NAME)
+            if _path_nodes[parent_path] == other:
+                path_id = parent_path
+            else:
+                path_id = _path_ids.get((parent_path, other))
+                if path_id is None:
+                    path_id = _new_path(parent_path, other)
+        else:
+            path_id = _new_path(parent_path, node_id)
+
+        _path_ids[key] = path_id
+        return path_id
+
+
+def _new_path(parent_path: int, node_id: int) -> int:
+    # Called with `_path_lock` held. `[other]` paths may exceed
+    # `max_paths`, by at most one per existing path.
+    path_id = len(_path_parents)
+    _path_parents.append(parent_path)
+    _path_nodes.append(node_id)
+    _path_depths.append(_path_depths[parent_path] + 1)
+    _path_ids[(parent_path, node_id)] = path_id
+    return path_id
+
+
+def path_of(frame) -> int:
+    """Path id of a call frame, computed once and memoized on the frame."""
+    path_id = frame[CALL_PATH]
+    if path_id is None:
+        parent = frame[CALL_PARENT]
+        parent_path = path_of(parent) if parent is not None else ROOT_PATH
+        path_id = frame[CALL_PATH] = intern_path(parent_path, frame[CALL_ID])
+    return path_id
+
+
+def path_names(path_id: int) -> List[str]:
+    """Function names along a path, outermost first."""
+    names = []
+    while path_id != ROOT_PATH:
+        names.append(name_of(_path_nodes[path_id]))
+        path_id = _path_parents[path_id]
+    names.reverse()
+    return names
+
+
+def record_frame(graph, frame, elapsed_ns: int, weight: float = 1.0) -> None:
+    """Attribute one finished call to its path in `graph`."""
+    graph.add_path(
+        path_of(frame),
+        elapsed_ns / 1e9,
+        max(0, elapsed_ns - frame[CALL_CHILD_NS]) / 1e9,
+        weight,
+    )
+
+
+# ------------------------------------------------------------
+# TRIE EXPORT
+# ------------------------------------------------------------
+
+class CallPathTrie:
+    """A materialized trie of call paths with per-path totals.
+
+    Built from a `BehaviorGraph` (`from_graph`) or from a snapshot record
+    (`from_dict`); keyed by name tuples so it outlives interned ids.
+    """
+
+    def __init__(self, paths: Optional[Dict[Tuple[str, ...], List[float]]] = None):
+        # path -> [count, total_duration, self_duration]
+        self.paths: Dict[Tuple[str, ...], List[float]] = paths or {}
+
+    @classmethod
+    def from_graph(cls, graph) -> "CallPathTrie":
+        return cls({
+            tuple(path_names(path_id)): list(stats)
+            for path_id, stats in graph.iter_paths()
+        })
+
+    def total_duration(self) -> float:
+        # Roots are paths of length 1; their totals cover everything below.
+        return sum(
+            stats[1] for path, stats in self.paths.items() if len(path) == 1
+        )
+
+    def prune(self, min_share: Optional[float] = None) -> "CallPathTrie":
+        """Fold paths below `min_share` of total time into their parent.
+
+        The folded path's total time becomes self time of the parent, so a
+        flamegraph of the pruned trie keeps the same overall width. Root
+        paths are never folded.
+        """
+        min_share = _config.min_share if min_share is None else min_share
+        threshold = self.total_duration() * min_share
+
+        paths = {path: list(stats) for path, stats in self.paths.items()}
+
+        # Deepest first, so a folded child's time reaches a parent that may
+        # itself be folded further up.
+        for path in sorted(paths, key=len, reverse=True):
+            stats = paths[path]
+            if len(path) == 1 or stats[1] >= threshold:
+                continue
+
+            parent = paths.get(path[:-1])
+            if parent is None:
+                continue
+
+            del paths[path]
+            parent[2] += stats[1]
+
+        return CallPathTrie(paths)
+
+    def folded(self, metric: str = "self_us") -> str:
+        """Folded stacks, one ``a;b;c value`` line per path.
+
+        `metric` is ``self_us`` (self time in microseconds, the usual
+        flamegraph width) or ``count``.
+        """
+        if metric not in ("self_us", "count"):
+            raise ValueError(f"Unknown flamegraph metric: {metric!r}")
+
+        lines = []
+        for path in sorted(self.paths):
+            count, _, self_duration = self.paths[path]
+            value = (
+                round(self_duration * 1_000_000)
+                if metric == "self_us" else round(count)
+            )
+            if value > 0:
+                lines.append(f"{';'.join(path)} {value}")
+
+        return "\n".join(lines)
+
+    def to_dict(self) -> Dict[str, Dict]:
+        return {
+            ";".join(path): {
+                "count": count,
+                "total_duration": round(total, 6),
+                "self_duration": round(self_duration, 6),
+            }
+            for path, (count, total, self_duration) in self.paths.items()
+        }
+
+    @classmethod
+    def from_dict(cls, data: Optional[Dict[str, Dict]]) -> "CallPathTrie":
+        return cls({
+            tuple(key.split(";")): [
+                float(stats.get("count", 0)),
+                float(stats.get("total_duration", 0.0)),
+                float(stats.get("self_duration", 0.0)),
+            ]
+            for key, stats in (data or {}).items()
+        })
+
+
+def chain_path(node_ids: Iterable[int]) -> int:
+    """Path id for node ids given outermost first (used by the profiler)."""
+    path_id = ROOT_PATH
+    for node_id in node_ids:
+        path_id = intern_path(path_id, node_id)
+    return path_id
@@ -0,0 +1,495 @@
+"""Local collector daemon for SES data from web workers.
+
+With a collector, web workers do no SES disk I/O at all. Each worker runs a
+`CollectorClient` thread that every `interval` seconds drains the worker's
+window of flushed edges and pushes it as compact binary deltas over a Unix
+datagram socket. Request-log records take the same route
+(`CollectorClient.log_handler()`). Sends never block: if the collector is
+down or its socket buffer is full, the batch is dropped and counted.
+
+The collector process (``python manage.py ses_collector``) runs a
+`CollectorServer` that merges every received delta into its own process
+graph and writes forwarded request-log lines. It also runs the snapshot
+scheduler, so snapshot persistence and the intelligence pipeline happen
+only there.
+
+Wire format: every datagram starts with ``_HEADER`` (magic, message type,
+sender pid). An edge message then carries a name table, one record per edge
+and one record per call path. An edge record holds name indices, count,
+total and self duration, a flags byte saying which optional groups follow
+(CPU time, memory, result rows, hit/miss outcome) and the sparse sketch
+bins; the latency histogram is derived from the bins on the collector side.
+A path record holds its name indices (outermost first) and its count,
+total and self time. A request-log message carries UTF-8 JSON lines.
+Batches larger than `max_datagram` are split across datagrams.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import socket
+import struct
+import threading
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+from ses_intelligence.behavior_graph import (
+    BehaviorGraph,
+    EdgeStats,
+    intern_name,
+)
+from ses_intelligence.call_paths import ROOT_PATH, intern_path, path_names
+from ses_intelligence.runtime_state import (
+    drain_window_graph,
+    merge_into_process_graph,
+)
+
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"SES"
+# Edge deltas. Was b"E" while records only carried count, durations and
+# distributions; a collector drops messages of that older format.
+MESSAGE_EDGES = b"D"
+MESSAGE_REQUESTS = b"R"
+
+_HEADER = struct.Struct("<3scI")  # magic, message type, sender pid
+_COUNT = struct.Struct("<I")
+_NAME = struct.Struct("<H")
+# caller, callee, count, total duration, self duration, flags, n_bins
+_EDGE = struct.Struct("<IIdddBH")
+_BIN_ENTRY = struct.Struct("<hd")
+# Optional edge groups, in this order, when their flag is set.
+FLAG_CPU = 1  # cpu count, cpu duration
+FLAG_MEMORY = 2  # memory count, net bytes, peak bytes
+FLAG_ROWS = 4  # result rows
+FLAG_OUTCOME = 8  # outcome count, misses
+_GROUPS = (
+    (FLAG_CPU, struct.Struct("<dd")),
+    (FLAG_MEMORY, struct.Struct("<ddd")),
+    (FLAG_ROWS, struct.Struct("<d")),
+    (FLAG_OUTCOME, struct.Struct("<dd")),
+)
+# depth, then `depth` name indices, then count, total and self duration
+_PATH = struct.Struct("<H")
+_PATH_NAME = struct.Struct("<I")
+_PATH_TOTALS = struct.Struct("<ddd")
+
+DEFAULT_MAX_DATAGRAM = 64 * 1024
+_RECEIVE_SIZE = 256 * 1024
+
+
+# ------------------------------------------------------------
+# ENCODING
+# ------------------------------------------------------------
+
+def _edge_groups(edge: EdgeStats):
+    """The flags byte and the values of the optional groups to send."""
+    flags = 0
+    values: List[float] = []
+    if edge.cpu_count:
+        flags |= FLAG_CPU
+        values += (edge.cpu_count, edge.cpu_duration)
+    if edge.memory_count:
+        flags |= FLAG_MEMORY
+        values += (edge.memory_count, edge.net_bytes, edge.peak_bytes)
+    if edge.result_rows:
+        flags |= FLAG_ROWS
+        values.append(edge.result_rows)
+    if edge.outcome_count:
+        flags |= FLAG_OUTCOME
+        values += (edge.outcome_count, edge.miss_count)
+    return flags, values
+
+
+def _encode_edge(edge: EdgeStats, names: Dict[str, int]) -> bytes:
+    flags, values = _edge_groups(edge)
+    bins = list(edge.sketch.bins.items())
+
+    parts = [
+        _EDGE.pack(
+            names[edge.caller],
+            names[edge.callee],
+            edge.count,
+            edge.total_duration,
+            edge.self_duration,
+            flags,
+            len(bins),
+        )
+    ]
+    parts.append(struct.pack(f"<{len(values)}d", *values))
+    parts.extend(_BIN_ENTRY.pack(index, count) for index, count in bins)
+    return b"".join(parts)
+
+
+def _encode_path(path, stats, names: Dict[str, int]) -> bytes:
+    parts = [_PATH.pack(len(path))]
+    parts.extend(_PATH_NAME.pack(names[name]) for name in path)
+    parts.append(_PATH_TOTALS.pack(*stats))
+    return b"".join(parts)
+
+
+def _edge_message(
+    names: Dict[str, int], edges: List[bytes], paths: List[bytes]
+) -> bytes:
+    parts = [_HEADER.pack(MAGIC, MESSAGE_EDGES, os.getpid())]
+    parts.append(_COUNT.pack(len(names)))
+    for name in names:
+        data = name.encode("utf-8")
+        parts.append(_NAME.pack(len(data)))
+        parts.append(data)
+    parts.append(_COUNT.pack(len(edges)))
+    parts.extend(edges)
+    parts.append(_COUNT.pack(len(paths)))
+    parts.extend(paths)
+    return b"".join(parts)
+
+
+def _items(graph: BehaviorGraph):
+    """`(is_path, names used, record size without names, encode)` for
+    every edge, then every call path, of `graph`.
+    """
+    for edge in graph.iter_edges():
+        _, values = _edge_groups(edge)
+        size = (
+            _EDGE.size
+            + 8 * len(values)
+            + len(edge.sketch.bins) * _BIN_ENTRY.size
+        )
+        yield (
+            False,
+            (edge.caller, edge.callee),
+            size,
+            lambda names, edge=edge: _encode_edge(edge, names),
+        )
+
+    for path_id, stats in graph.iter_paths():
+        path = path_names(path_id)
+        if not path:
+            continue
+        yield (
+            True,
+            tuple(path),
+            _PATH.size + len(path) * _PATH_NAME.size + _PATH_TOTALS.size,
+            lambda names, path=path, stats=stats: _encode_path(
+                path, stats, names
+            ),
+        )
+
+
+def encode_edges(
+    graph: BehaviorGraph,
+    max_datagram: int = DEFAULT_MAX_DATAGRAM,
+) -> Iterator[bytes]:
+    """Encode the edges and call paths of `graph` as one or more
+    self-contained edge messages.
+    """
+    empty_size = _HEADER.size + 3 * _COUNT.size
+    names: Dict[str, int] = {}
+    edges: List[bytes] = []
+    paths: List[bytes] = []
+    size = empty_size
+
+    for is_path, used, base_size, encode in _items(graph):
+        for _ in range(2):
+            new_names = set(used) - names.keys()
+            record_size = base_size + sum(
+                _NAME.size + len(n.encode("utf-8")) for n in new_names
+            )
+            if not (edges or paths) or size + record_size <= max_datagram:
+                break
+            yield _edge_message(names, edges, paths)
+            names, edges, paths, size = {}, [], [], empty_size
+
+        for name in used:
+            if name not in names:
+                names[name] = len(names)
+
+        (paths if is_path else edges).append(encode(names))
+        size += record_size
+
+    if edges or paths:
+        yield _edge_message(names, edges, paths)
+
+
+def decode_edges(payload: bytes, offset: int = _HEADER.size) -> BehaviorGraph:
+    (name_count,) = _COUNT.unpack_from(payload, offset)
+    offset += _COUNT.size
+
+    names = []
+    for _ in range(name_count):
+        (length,) = _NAME.unpack_from(payload, offset)
+        offset += _NAME.size
+        names.append(payload[offset:offset + length].decode("utf-8"))
+        offset += length
+
+    (edge_count,) = _COUNT.unpack_from(payload, offset)
+    offset += _COUNT.size
+
+    graph = BehaviorGraph()
+    for _ in range(edge_count):
+        (
+            caller, callee, count, total, self_total, flags, n_bins
+        ) = _EDGE.unpack_from(payload, offset)
+        offset += _EDGE.size
+
+        groups = {}
+        for flag, group in _GROUPS:
+            if flags & flag:
+                groups[flag] = group.unpack_from(payload, offset)
+                offset += group.size
+        cpu_count, cpu_duration = groups.get(FLAG_CPU, (0.0, 0.0))
+        memory_count, net_bytes, peak_bytes = groups.get(
+            FLAG_MEMORY, (0.0, 0.0, 0.0)
+        )
+        (result_rows,) = groups.get(FLAG_ROWS, (0.0,))
+        outcome_count, miss_count = groups.get(FLAG_OUTCOME, (0.0, 0.0))
+
+        bins = {}
+        for _ in range(n_bins):
+            index, bin_count = _BIN_ENTRY.unpack_from(payload, offset)
+            bins[index] = bin_count
+            offset += _BIN_ENTRY.size
+
+        graph.add_totals(
+            names[caller],
+            names[callee],
+            count,
+            total,
+            sketch_bins=bins,
+            self_duration=self_total,
+            cpu_count=cpu_count,
+            cpu_duration=cpu_duration,
+            memory_count=memory_count,
+            net_bytes=net_bytes,
+            peak_bytes=peak_bytes,
+            result_rows=result_rows,
+            outcome_count=outcome_count,
+            miss_count=miss_count,
+        )
+
+    (path_count,) = _COUNT.unpack_from(payload, offset)
+    offset += _COUNT.size
+
+    for _ in range(path_count):
+        (depth,) = _PATH.unpack_from(payload, offset)
+        offset += _PATH.size
+
+        path_id = ROOT_PATH
+        for _ in range(depth):
+            (index,) = _PATH_NAME.unpack_from(payload, offset)
+            offset += _PATH_NAME.size
+            path_id = intern_path(path_id, intern_name(names[index]))
+
+        count, total, self_total = _PATH_TOTALS.unpack_from(payload, offset)
+        offset += _PATH_TOTALS.size
+        graph.add_path_totals(path_id, count, total, self_total)
+
+    return graph
+
+
+# ------------------------------------------------------------
+# WORKER SIDE
+# ------------------------------------------------------------
+
+class CollectorClient:
+    def __init__(
+        self,
+        socket_path,
+        interval: float = 0.2,
+        max_datagram: int = DEFAULT_MAX_DATAGRAM,
+    ):
+        self.socket_path = str(socket_path)
+        self.interval = interval
+        self.max_datagram = max_datagram
+
+        self.sent = 0
+        self.dropped = 0
+
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._socket.setblocking(False)
+        self._send_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # --------------------------------------------------
+    # LIFECYCLE
+    # --------------------------------------------------
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        if self.running:
+            return
+
+        self._stopped.clear()
+        self._thread = threading.Thread(
+            target=self._run,
+            name="ses-collector-client",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            self.push_window()
+
+        self.push_window()
+
+    # --------------------------------------------------
+    # SENDING
+    # --------------------------------------------------
+
+    def _send(self, message: bytes) -> bool:
+        with self._send_lock:
+            try:
+                self._socket.sendto(message, self.socket_path)
+            except OSError:
+                # Collector down, restarting or not keeping up.
+                self.dropped += 1
+                return False
+
+        self.sent += 1
+        return True
+
+    def push_window(self) -> int:
+        """Send the edges flushed since the last push; returns the number
+        of datagrams sent.
+        """
+        window = drain_window_graph()
+        if window.is_empty():
+            return 0
+
+        return sum(
+            self._send(message)
+            for message in encode_edges(window, self.max_datagram)
+        )
+
+    def send_request_lines(self, text: str) -> None:
+        header = _HEADER.pack(MAGIC, MESSAGE_REQUESTS, os.getpid())
+        limit = self.max_datagram - len(header)
+
+        chunk: List[bytes] = []
+        size = 0
+        for line in text.encode("utf-8").split(b"\n"):
+            if chunk and size + len(line) + 1 > limit:
+                self._send(header + b"\n".join(chunk))
+                chunk, size = [], 0
+            chunk.append(line)
+            size += len(line) + 1
+
+        if chunk:
+            self._send(header + b"\n".join(chunk))
+
+    def log_handler(self) -> logging.Handler:
+        """A handler for `RequestLog` that forwards records here."""
+        return _CollectorLogHandler(self)
+
+
+class _CollectorLogHandler(logging.Handler):
+    def __init__(self, client: CollectorClient):
+        super().__init__()
+        self.client = client
+
+    def emit(self, record):
+        self.client.send_request_lines(record.getMessage())
+
+
+# ------------------------------------------------------------
+# COLLECTOR SIDE
+# ------------------------------------------------------------
+
+class CollectorServer:
+    def __init__(self, socket_path, request_log=None):
+        self.socket_path = Path(socket_path)
+        self.request_log = request_log
+
+        self.received = 0
+        self.rejected = 0
+
+        if self.socket_path.exists():
+            # Left over from a previous collector.
+            self.socket_path.unlink()
+        self.socket_path.parent.mkdir(parents=True, exist_ok=True)
+
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._socket.bind(str(self.socket_path))
+        self._socket.settimeout(0.5)
+        self._stopped = threading.Event()
+
+    def handle(self, payload: bytes) -> None:
+        try:
+            magic, kind, _ = _HEADER.unpack_from(payload)
+            if magic != MAGIC:
+                raise ValueError("bad magic")
+
+            if kind == MESSAGE_EDGES:
+                merge_into_process_graph(decode_edges(payload))
+            elif kind == MESSAGE_REQUESTS:
+                if self.request_log is not None:
+                    self.request_log.write_lines(
+                        payload[_HEADER.size:].decode("utf-8")
+                    )
+            else:
+                raise ValueError(f"unknown message type {kind!r}")
+
+        except (struct.error, ValueError, IndexError):
+            self.rejected += 1
+            logger.warning("Dropping malformed collector message")
+            return
+
+        self.received += 1
+
+    def serve_forever(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                payload = self._socket.recv(_RECEIVE_SIZE)
+            except socket.timeout:
+                continue
+            self.handle(payload)
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+    def close(self) -> None:
+        self._socket.close()
+        if self.socket_path.exists():
+            self.socket_path.unlink()
+
+
+# ------------------------------------------------------------
+# PROCESS-WIDE CLIENT
+# ------------------------------------------------------------
+
+_client: Optional[CollectorClient] = None
+
+
+def get_collector_client() -> Optional[CollectorClient]:
+    return _client
+
+
+def start_collector_client(socket_path, **options) -> CollectorClient:
+    """Start (or return the already running) process-wide client."""
+    global _client
+
+    if _client is None or not _client.running:
+        _client = CollectorClient(socket_path, **options)
+        _client.start()
+
+    return _client
+
+
+def stop_collector_client() -> None:
+    global _client
+
+    if _client is not None:
+        _client.stop()
+        _client = None
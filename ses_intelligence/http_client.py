@@ -0,0 +1,213 @@
+"""Outbound HTTP request attribution.
+
+`enable_http_attribution()` instruments the HTTP clients that are installed:
+the standard library's ``urllib.request`` and, when importable, ``requests``
+and ``httpx`` (sync and async clients). Each request sent while a traced
+function is on the call stack is recorded as a callee of that function,
+named ``http:<METHOD> <host>`` (``http:GET api.example.com``) so the edge
+count stays bounded by the hosts an application talks to, not its URLs.
+
+A request's outcome is a miss when it raised or got a 5xx response; 4xx
+responses count as successful calls to a healthy dependency. Snapshots
+carry the share of misses as ``miss_rate``.
+
+Redirects followed by the client are part of the request that started
+them. Requests sent outside traced code are not recorded.
+"""
+
+from __future__ import annotations
+
+import time
+import urllib.request
+from contextvars import ContextVar
+from functools import lru_cache
+from urllib.error import HTTPError
+from urllib.parse import urlsplit
+
+from ses_intelligence.behavior_graph import intern_name, leaf_name
+from ses_intelligence.tracing import record_leaf_call
+
+try:
+    import requests
+except ImportError:  # pragma: no cover - optional dependency
+    requests = None
+
+try:
+    import httpx
+except ImportError:  # pragma: no cover - optional dependency
+    httpx = None
+
+
+HTTP_PREFIX = "http:"
+
+_perf_counter_ns = time.perf_counter_ns
+
+# Set while an instrumented request runs, so redirects and nested client
+# layers are not recorded again.
+_in_request: ContextVar[bool] = ContextVar("ses_http_request", default=False)
+
+
+@lru_cache(maxsize=4096)
+def _host_id(method: str, host: str) -> int:
+    return intern_name(leaf_name(f"{HTTP_PREFIX}{method.upper()} {host}"))
+
+
+def request_id(method: str, url) -> int:
+    """Interned node id for a request, keyed by method and host."""
+    parts = urlsplit(str(url))
+    host = parts.hostname or "unknown"
+    if parts.port is not None:
+        host = f"{host}:{parts.port}"
+    return _host_id(method, host)
+
+
+def _succeeded(status) -> bool:
+    return status is None or status < 500
+
+
+def _finish(token, callee_id, start, hit):
+    end = _perf_counter_ns()
+    _in_request.reset(token)
+
+    record_leaf_call(callee_id, start, end, hit=hit)
+
+
+def _wrap_send(send, describe, status_of):
+    """Wrap a synchronous ``send``; `describe(args, kwargs)` returns the
+    request's ``(method, url)`` and `status_of(response)` its status code.
+    """
+
+    def wrapper(*args, **kwargs):
+        if _in_request.get():
+            return send(*args, **kwargs)
+
+        callee_id = request_id(*describe(args, kwargs))
+        token = _in_request.set(True)
+        hit = False
+        start = _perf_counter_ns()
+        try:
+            response = send(*args, **kwargs)
+            hit = _succeeded(status_of(response))
+            return response
+        except HTTPError as exc:
+            hit = _succeeded(exc.code)
+            raise
+        finally:
+            _finish(token, callee_id, start, hit)
+
+    wrapper.__ses_http__ = send
+    return wrapper
+
+
+def _wrap_async_send(send, describe, status_of):
+
+    async def wrapper(*args, **kwargs):
+        if _in_request.get():
+            return await send(*args, **kwargs)
+
+        callee_id = request_id(*describe(args, kwargs))
+        token = _in_request.set(True)
+        hit = False
+        start = _perf_counter_ns()
+        try:
+            response = await send(*args, **kwargs)
+            hit = _succeeded(status_of(response))
+            return response
+        finally:
+            _finish(token, callee_id, start, hit)
+
+    wrapper.__ses_http__ = send
+    return wrapper
+
+
+# ------------------------------------------------------------
+# CLIENTS
+# ------------------------------------------------------------
+
+def _describe_urllib(args, kwargs):
+    # OpenerDirector.open(self, fullurl, data=None, timeout=...)
+    fullurl = args[1] if len(args) > 1 else kwargs["fullurl"]
+    if isinstance(fullurl, urllib.request.Request):
+        return fullurl.get_method(), fullurl.full_url
+
+    data = args[2] if len(args) > 2 else kwargs.get("data")
+    return ("GET" if data is None else "POST"), fullurl
+
+
+def _describe_prepared(args, kwargs):
+    # requests.Session.send / httpx.Client.send(self, request, ...)
+    request = args[1] if len(args) > 1 else kwargs["request"]
+    return request.method, request.url
+
+
+def _status_code(response):
+    return getattr(response, "status_code", None)
+
+
+def _urllib_status(response):
+    return getattr(response, "status", None)
+
+
+def _targets():
+    """``(owner, attribute, wrapped)`` for each installed client."""
+    targets = [(
+        urllib.request.OpenerDirector,
+        "open",
+        lambda send: _wrap_send(send, _describe_urllib, _urllib_status),
+    )]
+
+    if requests is not None:
+        targets.append((
+            requests.Session,
+            "send",
+            lambda send: _wrap_send(send, _describe_prepared, _status_code),
+        ))
+
+    if httpx is not None:
+        targets.append((
+            httpx.Client,
+            "send",
+            lambda send: _wrap_send(send, _describe_prepared, _status_code),
+        ))
+        targets.append((
+            httpx.AsyncClient,
+            "send",
+            lambda send: _wrap_async_send(
+                send, _describe_prepared, _status_code
+            ),
+        ))
+
+    return targets
+
+
+# ------------------------------------------------------------
+# INSTALLATION
+# ------------------------------------------------------------
+
+_enabled = False
+
+
+def enable_http_attribution() -> None:
+    """Record outbound requests of every installed client library."""
+    global _enabled
+
+    for owner, attribute, wrap in _targets():
+        send = getattr(owner, attribute)
+        if not hasattr(send, "__ses_http__"):
+            setattr(owner, attribute, wrap(send))
+    _enabled = True
+
+
+def disable_http_attribution() -> None:
+    global _enabled
+
+    for owner, attribute, _ in _targets():
+        send = getattr(owner, attribute)
+        original = getattr(send, "__ses_http__", None)
+        if original is not None:
+            setattr(owner, attribute, original)
+    _enabled = False
+
+
+def http_attribution_enabled() -> bool:
+    return _enabled
@@ -0,0 +1,112 @@
+"""Fixed-size, log-bucketed latency histograms.
+
+Durations are bucketed in microseconds: values below 8us get exact buckets,
+above that every power of two is split into `1 << SUB_BUCKET_BITS` equal
+sub-buckets (so a bucket spans at most 25% of its lower bound). The last
+bucket absorbs everything above roughly two hours.
+
+A histogram is just a sequence of `NUM_BUCKETS` weighted counts, so merging
+two histograms is element-wise addition. On disk they are stored sparsely as
+`{bucket_index: count}`.
+"""
+
+from typing import Dict, List, Sequence, Tuple
+
+
+SUB_BUCKET_BITS = 2
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+NUM_BUCKETS = 128
+
+_LINEAR_LIMIT = SUB_BUCKETS << 1
+
+
+def _bucket_for_micros(micros: int) -> int:
+    if micros < _LINEAR_LIMIT:
+        return micros if micros > 0 else 0
+
+    shift = micros.bit_length() - SUB_BUCKET_BITS - 1
+    index = (shift << SUB_BUCKET_BITS) + (micros >> shift)
+    return index if index < NUM_BUCKETS else NUM_BUCKETS - 1
+
+
+def bucket_index(duration: float) -> int:
+    """Bucket for a duration given in seconds."""
+    return _bucket_for_micros(int(duration * 1_000_000))
+
+
+# Precomputed buckets for durations under ~65ms, which covers most traced
+# calls; the tracer indexes this instead of doing the bit arithmetic.
+BUCKET_TABLE_LIMIT = 1 << 16
+BUCKET_TABLE = bytes(_bucket_for_micros(i) for i in range(BUCKET_TABLE_LIMIT))
+
+
+def bucket_bounds(index: int) -> Tuple[float, float]:
+    """Return `(lower, upper)` in seconds for a bucket index."""
+    if index < _LINEAR_LIMIT:
+        return index / 1_000_000, (index + 1) / 1_000_000
+
+    shift = (index >> SUB_BUCKET_BITS) - 1
+    mantissa = (index & (SUB_BUCKETS - 1)) + SUB_BUCKETS
+    return (mantissa << shift) / 1_000_000, ((mantissa + 1) << shift) / 1_000_000
+
+
+def percentile(counts: Sequence[float], q: float) -> float:
+    """Estimate the `q`-th percentile (0-100), in seconds.
+
+    Interpolates linearly inside the bucket holding the target rank.
+    """
+    total = sum(counts)
+    if total <= 0:
+        return 0.0
+
+    rank = total * min(max(q, 0.0), 100.0) / 100.0
+    cumulative = 0.0
+
+    for index, count in enumerate(counts):
+        if count <= 0:
+            continue
+
+        if cumulative + count >= rank:
+            lower, upper = bucket_bounds(index)
+            fraction = (rank - cumulative) / count
+            return lower + (upper - lower) * fraction
+
+        cumulative += count
+
+    return bucket_bounds(len(counts) - 1)[1]
+
+
+def percentiles(counts: Sequence[float]) -> Dict[str, float]:
+    """The p50/p95/p99 summary used across snapshots and the API."""
+    return {
+        "p50_duration": percentile(counts, 50),
+        "p95_duration": percentile(counts, 95),
+        "p99_duration": percentile(counts, 99),
+    }
+
+
+# ------------------------------------------------------------
+# SERIALIZATION
+# ------------------------------------------------------------
+
+def to_sparse(counts: Sequence[float]) -> Dict[str, float]:
+    return {
+        str(index): count
+        for index, count in enumerate(counts)
+        if count
+    }
+
+
+def from_sparse(sparse: Dict) -> List[float]:
+    counts = [0.0] * NUM_BUCKETS
+    for index, count in (sparse or {}).items():
+        counts[int(index)] += float(count)
+    return counts
+
+
+def merge_sparse(*histograms: Dict) -> Dict[str, float]:
+    merged: Dict[str, float] = {}
+    for histogram in histograms:
+        for index, count in (histogram or {}).items():
+            merged[str(index)] = merged.get(str(index), 0.0) + float(count)
+    return merged
@@ -0,0 +1,61 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from ses_intelligence.collector import CollectorServer, stop_collector_client
+from ses_intelligence.ml.pipeline import IntelligencePipeline
+from ses_intelligence.request_log import configure_request_log
+from ses_intelligence.scheduler import start_scheduler
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the local SES collector: receive edge deltas and request "
+        "records from worker processes, take snapshots and run the "
+        "intelligence pipeline."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--socket",
+            default=getattr(settings, "SES_COLLECTOR_SOCKET", None),
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=getattr(settings, "SES_SNAPSHOT_INTERVAL", None) or 60,
+        )
+        parser.add_argument(
+            "--min-interval",
+            type=float,
+            default=getattr(settings, "SES_SNAPSHOT_MIN_INTERVAL", 10),
+        )
+
+    def handle(self, *args, **options):
+        if not options["socket"]:
+            raise CommandError(
+                "Pass --socket or set SES_COLLECTOR_SOCKET"
+            )
+
+        # App startup made this process a client too; it is the collector.
+        stop_collector_client()
+        request_log = configure_request_log()
+
+        server = CollectorServer(options["socket"], request_log=request_log)
+        pipeline = IntelligencePipeline()
+
+        scheduler = start_scheduler(
+            interval=options["interval"],
+            min_interval=options["min_interval"],
+            on_snapshot=lambda snapshot: pipeline.run_intelligence(),
+        )
+
+        self.stdout.write(f"SES collector listening on {options['socket']}")
+
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            scheduler.stop()
+            server.close()
+            request_log.stop()
@@ -0,0 +1,123 @@
+"""Sampled memory attribution per edge (optional).
+
+With `configure_memory_tracking()` enabled, `tracemalloc` runs for the whole
+process and a random `sample_rate` fraction of synchronous traced calls is
+measured: the traced memory before the call, after it, and its peak while
+the call ran. Each measured call adds its net allocated bytes and its peak
+(relative to the memory at entry) to its caller -> callee edge, next to the
+timing data, so snapshots, `diff_snapshots` and the health score see memory
+regressions the same way as timing regressions.
+
+`tracemalloc` keeps a single process-wide peak, so measurements run on one
+thread at a time: while a thread has measured calls in flight, calls on
+other threads are not sampled. Nested measured calls on that thread carry
+the peak reached so far up to their parent before resetting it.
+Allocations made by other threads during a measured call are attributed to
+it, which sampling averages out but does not remove.
+
+`tracemalloc` itself roughly doubles allocation cost while enabled, so this
+is meant for investigating memory-bound endpoints rather than always-on use.
+"""
+
+from __future__ import annotations
+
+import random
+import threading
+import tracemalloc
+from typing import Optional, Tuple
+
+
+class MemoryConfig:
+    """Process-wide sampling settings (see `configure_memory_tracking`)."""
+
+    def __init__(self):
+        self.enabled = False
+        self.sample_rate = 0.01
+
+
+_config = MemoryConfig()
+_random = random.random
+
+# Held by the thread whose calls are being measured.
+_measuring = threading.Lock()
+
+
+class _MeasureLocal(threading.local):
+    def __init__(self):
+        # Measured calls in flight on this thread, innermost last, as
+        # `[bytes at entry, highest peak seen before a nested reset]`.
+        self.stack = []
+
+
+_local = _MeasureLocal()
+
+
+def configure_memory_tracking(
+    enabled: bool = True,
+    sample_rate: float = 0.01,
+    frames: int = 1,
+) -> None:
+    """Enable or disable sampled memory attribution.
+
+    Starts `tracemalloc` (keeping `frames` frames per allocation) if it is
+    not already tracing; disabling leaves it running if someone else
+    started it.
+    """
+    if not 0.0 < sample_rate <= 1.0:
+        raise ValueError("sample_rate must be in (0, 1]")
+
+    if enabled and not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+
+    _config.sample_rate = sample_rate
+    _config.enabled = enabled
+
+    # Imported here: tracing imports this module.
+    from ses_intelligence.tracing import refresh_fast_path
+
+    refresh_fast_path()
+
+
+def memory_tracking_enabled() -> bool:
+    return _config.enabled
+
+
+def begin_measure() -> Optional[list]:
+    """Start measuring the current call if it is sampled; returns a token
+    for `end_measure`, or None when the call is not measured.
+    """
+    if _random() >= _config.sample_rate or not tracemalloc.is_tracing():
+        return None
+
+    stack = _local.stack
+    if not stack and not _measuring.acquire(False):
+        # Another thread is measuring.
+        return None
+
+    current, peak = tracemalloc.get_traced_memory()
+    if stack:
+        parent = stack[-1]
+        parent[1] = max(parent[1], peak)
+
+    tracemalloc.reset_peak()
+    entry = [current, current]
+    stack.append(entry)
+    return entry
+
+
+def end_measure(entry: list) -> Tuple[int, int]:
+    """Finish a measurement started by `begin_measure`; returns
+    ``(net bytes, peak bytes)`` for the call.
+    """
+    stack = _local.stack
+    current, peak = tracemalloc.get_traced_memory()
+    peak = max(peak, entry[1])
+
+    stack.pop()
+    if stack:
+        parent = stack[-1]
+        parent[1] = max(parent[1], peak)
+    else:
+        _measuring.release()
+
+    return current - entry[0], max(0, peak - entry[0])
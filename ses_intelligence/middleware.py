@@ -1,26 +1,105 @@
 import time
 import uuid
-from ses_intelligence.runtime_state import reset_runtime_state
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from ses_intelligence.otlp import get_exporter
+from ses_intelligence.request_log import get_request_log
+from ses_intelligence.runtime_state import flush_thread_graph, reset_runtime_state
+from ses_intelligence.traces import (
+    RequestTrace,
+    begin_trace,
+    end_trace,
+    get_trace_store,
+)
 
 
 class BehaviorMiddleware:
+    # Runs natively under both WSGI and ASGI; under ASGI each request is its
+    # own task, so the context-local call stack keeps requests apart.
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
 
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
     def __call__(self, request):
 
-        request_id = str(uuid.uuid4())
-        start_time = time.time()
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        start_ns = self._begin(request)
+        response = None
+
+        try:
+            response = self.get_response(request)
+            return response
+        finally:
+            self._finish(request, response, start_ns)
+
+    async def __acall__(self, request):
+
+        start_ns = self._begin(request)
+        response = None
+
+        try:
+            response = await self.get_response(request)
+            return response
+        finally:
+            self._finish(request, response, start_ns)
+
+    # --------------------------------------------------
+    # REQUEST SCOPE
+    # --------------------------------------------------
+
+    @staticmethod
+    def _begin(request) -> int:
+        # Start every request from an empty call stack; anything a previous
+        # request left on this thread is flushed to the aggregate first.
+        reset_runtime_state()
+
+        request.ses_request_id = uuid.uuid4().hex
+        request.ses_trace_token = begin_trace(request.ses_request_id)
+        return time.perf_counter_ns()
+
+    @staticmethod
+    def _finish(request, response, start_ns: int) -> None:
+        duration_ns = time.perf_counter_ns() - start_ns
 
-        response = self.get_response(request)
+        # Hand this request's edges to the process-wide aggregate so
+        # snapshots see every worker thread, not just the current one.
+        flush_thread_graph()
 
-        duration = time.time() - start_time
+        match = getattr(request, "resolver_match", None)
+        route = match.route if match is not None else None
+        status = response.status_code if response is not None else 500
 
-        print(
-            f"[SES] request_id={request_id} "
-            f"path={request.path} "
-            f"method={request.method} "
-            f"duration={duration:.4f}s"
-        )
+        spans = end_trace(request.ses_trace_token)
+        if spans is not None:
+            trace = RequestTrace(
+                request.ses_request_id,
+                route,
+                request.method,
+                request.path,
+                status,
+                start_ns,
+                duration_ns,
+                spans.spans,
+                spans.dropped,
+            )
+            exporter = get_exporter()
+            if get_trace_store().add(trace) and exporter is not None:
+                exporter.offer_trace(trace)
 
-        return response
+        get_request_log().submit({
+            "request_id": request.ses_request_id,
+            "timestamp_ns": time.time_ns(),
+            "route": route,
+            "path": request.path,
+            "method": request.method,
+            "status": status,
+            "duration_ns": duration_ns,
+        })
@@ -14,12 +14,27 @@ class FeatureExtractor:
         """
         self.snapshots = snapshots
         self.total_snapshots = len(snapshots)
+        self.columns = None
+
+    @classmethod
+    def from_columns(cls, columns):
+        """
+        Extract from a `ColumnarHistory` (see behavior_change.columnar),
+        reading its memory-mapped matrices instead of parsed snapshots.
+        """
+        extractor = cls([])
+        extractor.columns = columns
+        extractor.total_snapshots = columns.rows
+        return extractor
 
     # ---------------------------
     # EDGE FEATURE EXTRACTION
     # ---------------------------
 
     def extract_edge_features(self):
+        if self.columns is not None:
+            return self._extract_columnar_edge_features()
+
         edge_history = defaultdict(list)
 
         # Collect edge history
@@ -30,6 +45,20 @@ class FeatureExtractor:
                         "snapshot_index": index,
                         "call_count": data["call_count"],
                         "avg_duration": data["avg_duration"],
+                        # The persisted avg_duration drifts; the CPU time
+                        # does not. Older snapshots only have the former.
+                        "raw_avg_duration": data.get(
+                            "raw_avg_duration", data["avg_duration"]
+                        ),
+                        # Older snapshots carry no histogram; fall back to
+                        # the mean so the features stay defined.
+                        "p50_duration": data.get("p50_duration", data["avg_duration"]),
+                        "p95_duration": data.get("p95_duration", data["avg_duration"]),
+                        "p99_duration": data.get("p99_duration", data["avg_duration"]),
+                        # Only present when the tracer measured CPU time.
+                        "avg_cpu_duration": data.get("avg_cpu_duration"),
+                        # Only present for memory-sampled edges.
+                        "peak_bytes": data.get("peak_bytes"),
                     }
                 )
 
@@ -68,11 +97,43 @@ class FeatureExtractor:
                 if durations[i] > durations[i - 1]
             )
 
+            tail_ratio = (
+                latest["p99_duration"] / latest["p50_duration"]
+                if latest["p50_duration"] > 0 else 1.0
+            )
+
+            # Share of wall time not spent on this thread's CPU (I/O, locks,
+            # sleeps). Without CPU measurements the call counts as all CPU.
+            wall_duration = latest["raw_avg_duration"]
+            cpu_duration = latest["avg_cpu_duration"]
+            if cpu_duration is None:
+                cpu_duration = wall_duration
+            io_wait_ratio = (
+                min(1.0, max(0.0, 1.0 - cpu_duration / wall_duration))
+                if wall_duration > 0 else 0.0
+            )
+
+            # Relative growth of sampled peak memory, first to latest
+            # snapshot with memory data; None when the edge has none.
+            peaks = [h["peak_bytes"] for h in history if h["peak_bytes"] is not None]
+            memory_growth = None
+            if peaks:
+                memory_growth = (
+                    (peaks[-1] - peaks[0]) / peaks[0] if peaks[0] > 0 else 0.0
+                )
+
             features.append(
                 {
                     "edge": edge,
                     "call_count_latest": latest["call_count"],
                     "avg_duration_latest": latest["avg_duration"],
+                    "p95_duration_latest": latest["p95_duration"],
+                    "p99_duration_latest": latest["p99_duration"],
+                    "tail_ratio_latest": tail_ratio,
+                    "avg_cpu_duration_latest": cpu_duration,
+                    "io_wait_ratio_latest": io_wait_ratio,
+                    "peak_bytes_latest": peaks[-1] if peaks else None,
+                    "memory_growth": memory_growth,
                     "timing_slope": slope,
                     "timing_volatility": volatility,
                     "appearance_frequency": appearance_frequency,
@@ -84,19 +145,113 @@ class FeatureExtractor:
 
         return features
 
+    def _extract_columnar_edge_features(self):
+        # Same features as above, one edge column at a time.
+        columns = self.columns
+        present = columns.present()
+        call_counts = columns.column("call_count")
+        avg_durations = columns.column("avg_duration")
+        percentiles = [
+            columns.column(name)
+            for name in ("p50_duration", "p95_duration", "p99_duration")
+        ]
+        raw_durations = columns.column("raw_avg_duration")
+        cpu_durations = columns.column("avg_cpu_duration")
+        peak_bytes = columns.column("peak_bytes")
+
+        def latest_or(values, fallback):
+            return fallback if np.isnan(values) else float(values)
+
+        features = []
+
+        for edge_id, edge in enumerate(columns.edge_pairs()):
+            rows = np.flatnonzero(present[:, edge_id])
+            if not len(rows):
+                continue
+
+            durations = avg_durations[rows, edge_id]
+            first_row = rows[0]
+            latest_row = rows[-1]
+            first_duration = float(durations[0])
+            latest_duration = float(durations[-1])
+
+            if len(durations) > 1:
+                slope = np.polyfit(np.arange(len(durations)), durations, 1)[0]
+            else:
+                slope = 0.0
+
+            drift_score = 0.0
+            if first_duration != 0:
+                drift_score = abs(
+                    (latest_duration - first_duration) / first_duration
+                )
+
+            p50, p95, p99 = (
+                latest_or(column[latest_row, edge_id], latest_duration)
+                for column in percentiles
+            )
+            tail_ratio = p99 / p50 if p50 > 0 else 1.0
+
+            wall_duration = latest_or(
+                raw_durations[latest_row, edge_id], latest_duration
+            )
+            cpu_duration = latest_or(
+                cpu_durations[latest_row, edge_id], wall_duration
+            )
+            io_wait_ratio = (
+                min(1.0, max(0.0, 1.0 - cpu_duration / wall_duration))
+                if wall_duration > 0 else 0.0
+            )
+
+            peaks = peak_bytes[rows, edge_id]
+            peaks = peaks[~np.isnan(peaks)]
+            memory_growth = None
+            if len(peaks):
+                memory_growth = (
+                    float((peaks[-1] - peaks[0]) / peaks[0])
+                    if peaks[0] > 0 else 0.0
+                )
+
+            features.append(
+                {
+                    "edge": edge,
+                    "call_count_latest": float(call_counts[latest_row, edge_id]),
+                    "avg_duration_latest": latest_duration,
+                    "p95_duration_latest": p95,
+                    "p99_duration_latest": p99,
+                    "tail_ratio_latest": tail_ratio,
+                    "avg_cpu_duration_latest": cpu_duration,
+                    "io_wait_ratio_latest": io_wait_ratio,
+                    "peak_bytes_latest": float(peaks[-1]) if len(peaks) else None,
+                    "memory_growth": memory_growth,
+                    "timing_slope": slope,
+                    "timing_volatility": float(np.std(durations)),
+                    "appearance_frequency": len(rows) / self.total_snapshots,
+                    "age_in_snapshots": int(self.total_snapshots - first_row),
+                    "drift_score": drift_score,
+                    "regression_frequency": int(
+                        np.count_nonzero(np.diff(durations) > 0)
+                    ),
+                }
+            )
+
+        return features
+
     # ---------------------------
     # NODE FEATURE EXTRACTION
     # ---------------------------
 
     def extract_node_features(self):
-        if not self.snapshots:
+        if self.columns is not None:
+            if not self.columns.rows:
+                return []
+            G_latest = self.columns.graph(self.columns.rows - 1)
+            G_first = self.columns.graph(0)
+        elif not self.snapshots:
             return []
-
-        latest_snapshot = self.snapshots[-1]
-        first_snapshot = self.snapshots[0]
-
-        G_latest = latest_snapshot.graph
-        G_first = first_snapshot.graph
+        else:
+            G_latest = self.snapshots[-1].graph
+            G_first = self.snapshots[0].graph
 
         centrality = nx.degree_centrality(G_latest)
 
@@ -1,10 +1,12 @@
 # ses_intelligence/ml/pipeline.py
 
 import networkx as nx
+import numpy as np
 from collections import defaultdict
 
 from ses_intelligence.ml.features import FeatureExtractor
 from ses_intelligence.ml.anomaly import AnomalyDetector
+from ses_intelligence.behavior_change.columnar import columnar_history_enabled
 from ses_intelligence.behavior_change.history import SnapshotStore
 
 from ses_intelligence.architecture_health.engine import ArchitectureHealthEngine
@@ -32,6 +34,15 @@ from ses_intelligence.architecture_health.history import (
 )
 
 
+class _LatestColumnarSnapshot:
+    """The last row of a `ColumnarHistory`, with the `graph` attribute of
+    reconstructed snapshots.
+    """
+
+    def __init__(self, columns):
+        self.graph = columns.graph(columns.rows - 1)
+
+
 class IntelligencePipeline:
 
     def __init__(self, contamination=0.4):
@@ -51,7 +62,7 @@ class IntelligencePipeline:
                 def __init__(self, data):
 
                     self.edge_signature = {
-                        tuple(edge.split("|")): meta
+                        tuple(edge.split("|", 1)): meta
                         for edge, meta in data["edge_signature"].items()
                     }
 
@@ -69,27 +80,49 @@ class IntelligencePipeline:
 
         return reconstructed
 
+    def _columnar_history(self):
+        """The columnar history when it is enabled and has rows, else None
+        (the snapshot log is parsed instead).
+        """
+        if not columnar_history_enabled():
+            return None
+        columns = SnapshotStore.columnar()
+        if columns is None or not columns.rows:
+            return None
+        return columns
+
     # --------------------------------------------------
     # MAIN INTELLIGENCE EXECUTION
     # --------------------------------------------------
 
     def run_intelligence(self):
 
-        raw_snapshots = SnapshotStore.load_all()
+        columns = self._columnar_history()
+        raw_snapshots = SnapshotStore.load_all() if columns is None else None
+        snapshot_count = (
+            len(raw_snapshots) if columns is None else columns.rows
+        )
 
-        if not raw_snapshots or len(raw_snapshots) < 3:
+        if snapshot_count < 3:
             return {
                 "status": "insufficient_data",
                 "message": "Need at least 3 snapshots for intelligence",
             }
 
-        snapshots = self._reconstruct_snapshots(raw_snapshots)
+        if columns is None:
+            snapshots = self._reconstruct_snapshots(raw_snapshots)
+        else:
+            # Past feature extraction only the latest graph is read.
+            snapshots = [_LatestColumnarSnapshot(columns)]
 
         # ---------------------------------
         # FEATURE EXTRACTION
         # ---------------------------------
 
-        extractor = FeatureExtractor(snapshots)
+        if columns is None:
+            extractor = FeatureExtractor(snapshots)
+        else:
+            extractor = FeatureExtractor.from_columns(columns)
         feature_matrix = extractor.build_feature_matrix()
         edge_features = feature_matrix["edges"]
 
@@ -175,7 +208,7 @@ class IntelligencePipeline:
         # EDGE RISK FORECASTING
         # ---------------------------------
 
-        risk_output = self._compute_edge_risk(raw_snapshots)
+        risk_output = self._compute_edge_risk(raw_snapshots, columns)
 
         # ---------------------------------
         # EDGE IMPACT + ESCALATION
@@ -259,14 +292,22 @@ class IntelligencePipeline:
     # EDGE RISK FORECASTING
     # --------------------------------------------------
 
-    def _compute_edge_risk(self, raw_snapshots):
-
-        if len(raw_snapshots) < 5:
+    def _compute_edge_risk(self, raw_snapshots, columns=None):
+        """Train on the snapshot history and score the latest snapshot's
+        edges. With `columns` (a `ColumnarHistory`) both read its matrices
+        and `raw_snapshots` is not used.
+        """
+        snapshot_count = (
+            len(raw_snapshots) if columns is None else columns.rows
+        )
+        if snapshot_count < 5:
             return {
                 "status": "insufficient_snapshot_history"
             }
 
-        label_generator = RiskLabelGenerator(raw_snapshots)
+        label_generator = RiskLabelGenerator(
+            raw_snapshots if columns is None else columns
+        )
         dataset = label_generator.generate()
 
         features = dataset["features"]
@@ -278,20 +319,14 @@ class IntelligencePipeline:
         if training_result.get("status") != "trained":
             return training_result
 
-        latest_snapshot = raw_snapshots[-1]
-        latest_edges = latest_snapshot.get("edge_signature", {})
-
-        latest_feature_vectors = []
-        edge_keys = []
-
-        for edge_key, edge_data in latest_edges.items():
-
-            latest_feature_vectors.append([
-                edge_data.get("call_count", 0),
-                edge_data.get("avg_duration", 0),
-            ])
-
-            edge_keys.append(edge_key)
+        if columns is None:
+            edge_keys, latest_feature_vectors = self._latest_edge_vectors(
+                raw_snapshots[-1]
+            )
+        else:
+            edge_keys, latest_feature_vectors = (
+                self._latest_columnar_edge_vectors(columns)
+            )
 
         prediction_result = forecaster.predict(latest_feature_vectors)
         probabilities = prediction_result.get("probabilities", [])
@@ -312,3 +347,34 @@ class IntelligencePipeline:
             "current_edge_predictions": risk_classification,
             "model_insights": insights,
         }
+
+    def _latest_edge_vectors(self, latest_snapshot):
+
+        latest_edges = latest_snapshot.get("edge_signature", {})
+
+        latest_feature_vectors = []
+        edge_keys = []
+
+        for edge_key, edge_data in latest_edges.items():
+
+            latest_feature_vectors.append([
+                edge_data.get("call_count", 0),
+                edge_data.get("avg_duration", 0),
+            ])
+
+            edge_keys.append(edge_key)
+
+        return edge_keys, latest_feature_vectors
+
+    def _latest_columnar_edge_vectors(self, columns):
+
+        call_counts = columns.column("call_count")[-1]
+        durations = columns.column("avg_duration")[-1]
+        edge_ids = np.flatnonzero(~np.isnan(call_counts))
+
+        edge_keys = [columns.edges[edge_id] for edge_id in edge_ids]
+        latest_feature_vectors = np.column_stack(
+            (call_counts[edge_ids], durations[edge_ids])
+        ).tolist()
+
+        return edge_keys, latest_feature_vectors
@@ -0,0 +1,441 @@
+"""OpenTelemetry (OTLP) export of SES traces and edges.
+
+Converts retained request traces (see `ses_intelligence.traces`) into OTLP
+``ExportTraceServiceRequest`` payloads and the process-wide edge totals into
+``ExportMetricsServiceRequest`` payloads, so SES data can go into an existing
+tracing stack without a second instrumentation layer.
+
+Payloads are OTLP/JSON (hex trace and span ids, string-encoded 64-bit
+integers). When the ``opentelemetry-proto`` package is installed,
+`OTLPExporter` can send binary protobuf instead (``encoding="protobuf"``).
+
+`OTLPExporter` never blocks request threads. `offer_trace` puts a trace on a
+bounded queue and drops it (counted in `dropped`) when the queue is full. A
+daemon thread drains the queue in batches and writes each batch either as
+one JSON line to a local file, or as an HTTP POST to an OTLP/HTTP endpoint
+(e.g. a local OpenTelemetry collector on ``http://127.0.0.1:4318``).
+Every `metrics_interval` seconds it also exports the cumulative edge
+counters as OTLP sums.
+"""
+
+from __future__ import annotations
+
+import base64
+import json
+import logging
+import os
+import queue
+import socket
+import threading
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from ses_intelligence.behavior_graph import BehaviorGraph, name_of
+from ses_intelligence.runtime_state import get_process_graph
+
+try:
+    from google.protobuf.json_format import ParseDict
+    from opentelemetry.proto.collector.metrics.v1.metrics_service_pb2 import (
+        ExportMetricsServiceRequest,
+    )
+    from opentelemetry.proto.collector.trace.v1.trace_service_pb2 import (
+        ExportTraceServiceRequest,
+    )
+except ImportError:  # pragma: no cover - optional dependency
+    ParseDict = None
+
+
+logger = logging.getLogger(__name__)
+
+SERVICE_NAME = "ses"
+SCOPE = {"name": "ses_intelligence"}
+
+ENCODING_JSON = "json"
+ENCODING_PROTOBUF = "protobuf"
+
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+STATUS_CODE_ERROR = 2
+AGGREGATION_TEMPORALITY_CUMULATIVE = 2
+
+# Traces carry `perf_counter_ns` timestamps; OTLP wants Unix time.
+_EPOCH_OFFSET_NS = time.time_ns() - time.perf_counter_ns()
+
+
+def protobuf_available() -> bool:
+    return ParseDict is not None
+
+
+def _attribute(key: str, value) -> Dict:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+def _resource() -> Dict:
+    return {
+        "attributes": [
+            _attribute("service.name", SERVICE_NAME),
+            _attribute("process.pid", os.getpid()),
+            _attribute("host.name", socket.gethostname()),
+        ]
+    }
+
+
+# ------------------------------------------------------------
+# TRACES
+# ------------------------------------------------------------
+
+def trace_to_spans(trace) -> List[Dict]:
+    """OTLP spans for one `RequestTrace`: a server span for the request and
+    one internal span per traced call, parented by interval containment.
+    """
+    trace_id = trace.request_id.rjust(32, "0")[-32:]
+    unix = _EPOCH_OFFSET_NS
+
+    root_id = f"{1:016x}"
+    root = {
+        "traceId": trace_id,
+        "spanId": root_id,
+        "name": f"{trace.method} {trace.route or trace.path}",
+        "kind": SPAN_KIND_SERVER,
+        "startTimeUnixNano": str(trace.start_ns + unix),
+        "endTimeUnixNano": str(trace.start_ns + trace.duration_ns + unix),
+        "attributes": [
+            _attribute("http.request.method", trace.method),
+            _attribute("url.path", trace.path),
+            _attribute("http.response.status_code", trace.status),
+        ],
+        "status": {},
+    }
+    if trace.route is not None:
+        root["attributes"].append(_attribute("http.route", trace.route))
+    if trace.status >= 500:
+        root["status"] = {"code": STATUS_CODE_ERROR}
+
+    spans = [root]
+    # (end_ns, span id) of the spans enclosing the current one.
+    open_spans = [(trace.start_ns + trace.duration_ns, root_id)]
+
+    ordered = sorted(trace.spans, key=lambda span: (span[2], -span[3]))
+    for number, (caller_id, callee_id, start, end) in enumerate(ordered, 2):
+        while len(open_spans) > 1 and open_spans[-1][0] <= start:
+            open_spans.pop()
+
+        span_id = f"{number:016x}"
+        attributes = [_attribute("ses.callee", name_of(callee_id))]
+        if caller_id is not None:
+            attributes.append(_attribute("ses.caller", name_of(caller_id)))
+
+        spans.append({
+            "traceId": trace_id,
+            "spanId": span_id,
+            "parentSpanId": open_spans[-1][1],
+            "name": name_of(callee_id),
+            "kind": SPAN_KIND_INTERNAL,
+            "startTimeUnixNano": str(start + unix),
+            "endTimeUnixNano": str(end + unix),
+            "attributes": attributes,
+            "status": {},
+        })
+        open_spans.append((end, span_id))
+
+    return spans
+
+
+def traces_payload(traces) -> Dict:
+    """An OTLP/JSON ``ExportTraceServiceRequest`` for `traces`."""
+    return {
+        "resourceSpans": [{
+            "resource": _resource(),
+            "scopeSpans": [{
+                "scope": SCOPE,
+                "spans": [
+                    span for trace in traces for span in trace_to_spans(trace)
+                ],
+            }],
+        }]
+    }
+
+
+# ------------------------------------------------------------
+# EDGES
+# ------------------------------------------------------------
+
+def _sum_metric(name: str, unit: str, points: List[Dict]) -> Dict:
+    return {
+        "name": name,
+        "unit": unit,
+        "sum": {
+            "dataPoints": points,
+            "aggregationTemporality": AGGREGATION_TEMPORALITY_CUMULATIVE,
+            "isMonotonic": True,
+        },
+    }
+
+
+def edges_payload(graph: BehaviorGraph, start_time_ns: int) -> Dict:
+    """An OTLP/JSON ``ExportMetricsServiceRequest`` with cumulative call
+    counts, total and self time per caller -> callee edge.
+    """
+    now = str(time.time_ns())
+    start = str(start_time_ns)
+
+    calls, durations, self_durations = [], [], []
+    for edge in graph.iter_edges():
+        point = {
+            "attributes": [
+                _attribute("ses.caller", edge.caller),
+                _attribute("ses.callee", edge.callee),
+            ],
+            "startTimeUnixNano": start,
+            "timeUnixNano": now,
+        }
+        calls.append(dict(point, asDouble=float(edge.count)))
+        durations.append(dict(point, asDouble=edge.total_duration))
+        self_durations.append(dict(point, asDouble=edge.self_duration))
+
+    return {
+        "resourceMetrics": [{
+            "resource": _resource(),
+            "scopeMetrics": [{
+                "scope": SCOPE,
+                "metrics": [
+                    _sum_metric("ses.edge.calls", "{call}", calls),
+                    _sum_metric("ses.edge.duration", "s", durations),
+                    _sum_metric("ses.edge.self_duration", "s", self_durations),
+                ],
+            }],
+        }]
+    }
+
+
+# ------------------------------------------------------------
+# PROTOBUF
+# ------------------------------------------------------------
+
+def _hex_ids_to_base64(payload: Dict) -> Dict:
+    # OTLP/JSON uses hex ids; the protobuf JSON mapping expects base64.
+    for resource in payload.get("resourceSpans", ()):
+        for scope in resource["scopeSpans"]:
+            for span in scope["spans"]:
+                for key in ("traceId", "spanId", "parentSpanId"):
+                    if key in span:
+                        span[key] = base64.b64encode(
+                            bytes.fromhex(span[key])
+                        ).decode("ascii")
+    return payload
+
+
+def encode_protobuf(payload: Dict) -> bytes:
+    if ParseDict is None:
+        raise RuntimeError("opentelemetry-proto is not installed")
+
+    if "resourceSpans" in payload:
+        message = ExportTraceServiceRequest()
+    else:
+        message = ExportMetricsServiceRequest()
+    return ParseDict(_hex_ids_to_base64(payload), message).SerializeToString()
+
+
+# ------------------------------------------------------------
+# EXPORTER
+# ------------------------------------------------------------
+
+class OTLPExporter:
+    def __init__(
+        self,
+        target: str,
+        encoding: str = ENCODING_JSON,
+        max_queue: int = 2_048,
+        batch_size: int = 256,
+        flush_interval: float = 1.0,
+        metrics_interval: Optional[float] = 10.0,
+        timeout: float = 2.0,
+    ):
+        if encoding not in (ENCODING_JSON, ENCODING_PROTOBUF):
+            raise ValueError(f"Unknown OTLP encoding: {encoding!r}")
+        if encoding == ENCODING_PROTOBUF and not protobuf_available():
+            raise RuntimeError("opentelemetry-proto is not installed")
+
+        self.target = target
+        self.encoding = encoding
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.metrics_interval = metrics_interval
+        self.timeout = timeout
+
+        self.is_http = target.startswith(("http://", "https://"))
+        if not self.is_http:
+            Path(target).parent.mkdir(parents=True, exist_ok=True)
+
+        self.exported = 0
+        self.dropped = 0
+        self.failed = 0
+
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self._start_time_ns = time.time_ns()
+        self._next_metrics = time.monotonic()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # --------------------------------------------------
+    # REQUEST PATH
+    # --------------------------------------------------
+
+    def offer_trace(self, trace) -> bool:
+        """Queue a finished trace; never blocks, drops when full."""
+        try:
+            self._queue.put_nowait(trace)
+        except queue.Full:
+            self.dropped += 1
+            return False
+        return True
+
+    # --------------------------------------------------
+    # LIFECYCLE
+    # --------------------------------------------------
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        if self.running:
+            return
+
+        self._stopped.clear()
+        self._thread = threading.Thread(
+            target=self._run,
+            name="ses-otlp-exporter",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.flush_interval):
+            self.flush()
+
+        self.flush()
+
+    # --------------------------------------------------
+    # EXPORT
+    # --------------------------------------------------
+
+    def flush(self) -> int:
+        """Export everything queued so far (and edge metrics when due);
+        returns the number of traces exported.
+        """
+        exported = 0
+
+        while True:
+            batch = []
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            if not batch:
+                break
+
+            if self._send("traces", traces_payload(batch)):
+                exported += len(batch)
+
+        if self.metrics_interval is not None:
+            now = time.monotonic()
+            if now >= self._next_metrics:
+                self._next_metrics = now + self.metrics_interval
+                graph = get_process_graph()
+                if not graph.is_empty():
+                    self._send(
+                        "metrics", edges_payload(graph, self._start_time_ns)
+                    )
+
+        self.exported += exported
+        return exported
+
+    def _send(self, signal: str, payload: Dict) -> bool:
+        """Export one payload; returns False (and counts it as failed)
+        on any error, so the exporter thread keeps running.
+        """
+        try:
+            if self.encoding == ENCODING_PROTOBUF:
+                body = encode_protobuf(payload)
+                content_type = "application/x-protobuf"
+            else:
+                body = json.dumps(payload, separators=(",", ":")).encode(
+                    "utf-8"
+                )
+                content_type = "application/json"
+
+            if self.is_http:
+                request = urllib.request.Request(
+                    f"{self.target.rstrip('/')}/v1/{signal}",
+                    data=body,
+                    headers={"Content-Type": content_type},
+                    method="POST",
+                )
+                with urllib.request.urlopen(request, timeout=self.timeout):
+                    pass
+            else:
+                with open(self.target, "ab") as f:
+                    if self.encoding == ENCODING_PROTOBUF:
+                        # Length-prefixed, as protobuf has no delimiter.
+                        f.write(len(body).to_bytes(4, "little"))
+                        f.write(body)
+                    else:
+                        f.write(body + b"\n")
+        except (OSError, urllib.error.URLError) as exc:
+            self.failed += 1
+            logger.warning("OTLP export of %s failed: %s", signal, exc)
+            return False
+        except Exception:
+            # Encoding errors, malformed HTTP responses and the like.
+            self.failed += 1
+            logger.exception("OTLP export of %s failed", signal)
+            return False
+
+        return True
+
+
+# ------------------------------------------------------------
+# PROCESS-WIDE EXPORTER
+# ------------------------------------------------------------
+
+_exporter: Optional[OTLPExporter] = None
+
+
+def get_exporter() -> Optional[OTLPExporter]:
+    return _exporter
+
+
+def start_exporter(target: str, **options) -> OTLPExporter:
+    """Start (or return the already running) process-wide exporter."""
+    global _exporter
+
+    if _exporter is None or not _exporter.running:
+        _exporter = OTLPExporter(target, **options)
+        _exporter.start()
+
+    return _exporter
+
+
+def stop_exporter() -> None:
+    global _exporter
+
+    if _exporter is not None:
+        _exporter.stop()
+        _exporter = None
@@ -0,0 +1,295 @@
+"""Statistical sampling profiler.
+
+An alternative to deterministic tracing: a daemon thread periodically reads
+`sys._current_frames()` and turns each sampled stack into caller -> callee
+edges in `BehaviorGraph`, with no decorators and no per-call hooks.
+
+Only frames from the allowlisted module prefixes are kept; the nearest
+allowlisted ancestor of a frame is its caller. A call that stays on the
+stack across samples is one call, and each sample credits it with the time
+since the previous sample. A call is recorded when its frame leaves the
+stack, so total time per edge is an unbiased estimate of the time spent in
+that call path, and call counts are a lower bound (calls shorter than the
+sampling interval are only seen by chance). An open call keeps a reference
+to its frame until it is recorded, so a later call can never reuse the
+frame's id and be mistaken for it: back-to-back calls that both span a
+sample count as two. What remains is sampling error proper: a call that
+returns and is called again between two samples, or that starts and ends
+between them, is seen as one call or none, and its time is credited to
+whichever call the samples landed in. A generator frame resumed across
+samples is one call for its whole life. Samples in which the callee is
+the innermost allowlisted frame count as its self time. `time_shares()`
+reports each edge's share of sampled thread time. With call paths enabled
+(`call_paths.configure_call_paths`), each sampled call is also attributed
+to its allowlisted call path, outermost frame included.
+
+Overhead is a fixed CPU budget rather than a fixed rate: after every sample
+the profiler measures its own CPU time and sleeps long enough to keep it
+under `cpu_budget` (1% by default), whatever the call rate of the
+application.
+
+Edges flow through the usual per-thread flush into the process aggregate,
+so snapshots, the scheduler and the health pipeline read them unchanged.
+Use it instead of, not together with, `trace_behavior` and
+`auto_instrument` for the same modules, or the edges are counted twice.
+"""
+
+from __future__ import annotations
+
+import sys
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from ses_intelligence.behavior_graph import EDGE_KEY_SHIFT, intern_name, name_of
+from ses_intelligence.call_paths import call_paths_enabled, chain_path
+from ses_intelligence.runtime_state import flush_thread_graph, get_thread_state
+
+
+class SamplingProfiler:
+    def __init__(
+        self,
+        module_prefixes: Iterable[str],
+        interval: float = 0.01,
+        cpu_budget: float = 0.01,
+        max_depth: int = 128,
+    ):
+        prefixes = tuple(p.rstrip(".") for p in module_prefixes if p)
+        if not prefixes:
+            raise ValueError("At least one module prefix is required")
+        if interval <= 0:
+            raise ValueError("interval must be positive")
+        if not 0.0 < cpu_budget < 1.0:
+            raise ValueError("cpu_budget must be in (0, 1)")
+
+        self.prefixes = prefixes
+        self.interval = float(interval)
+        self.cpu_budget = cpu_budget
+        self.max_depth = max_depth
+
+        self._dotted_prefixes = tuple(p + "." for p in prefixes)
+        # code object -> interned node id, or None when not allowlisted.
+        self._code_ids: Dict[object, Optional[int]] = {}
+
+        # thread id -> {(frame id, callee_id):
+        #               [caller_id, callee_id, seconds, self seconds, path_id,
+        #                frame]}
+        # The frame is held so its id stays unique while the call is open.
+        self._open: Dict[int, Dict[Tuple[int, int], List]] = {}
+
+        # edge key -> sampled seconds, and the thread-seconds they share.
+        self._edge_seconds: Dict[int, float] = {}
+        self.thread_seconds = 0.0
+        self.samples = 0
+        self.overhead_seconds = 0.0
+
+        self.delay = self.interval
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # --------------------------------------------------
+    # LIFECYCLE
+    # --------------------------------------------------
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        if self.running:
+            return
+
+        self._stopped.clear()
+        self._thread = threading.Thread(
+            target=self._run,
+            name="ses-sampling-profiler",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self) -> None:
+        last = time.perf_counter()
+
+        while not self._stopped.wait(self.delay):
+            now = time.perf_counter()
+            elapsed, last = now - last, now
+
+            cpu_start = time.thread_time()
+            self.sample_once(elapsed)
+            cost = time.thread_time() - cpu_start
+
+            self.overhead_seconds += cost
+            # Keep cost / (cost + delay) <= cpu_budget.
+            self.delay = max(self.interval, cost / self.cpu_budget - cost)
+
+        self.close_open_calls()
+
+    # --------------------------------------------------
+    # SAMPLING
+    # --------------------------------------------------
+
+    def _node_id(self, code, module: Optional[str]) -> Optional[int]:
+        node_id = None
+        if module is not None and (
+            module in self.prefixes or module.startswith(self._dotted_prefixes)
+        ):
+            node_id = intern_name(getattr(code, "co_qualname", code.co_name))
+
+        self._code_ids[code] = node_id
+        return node_id
+
+    def _stack(self, frame) -> List[Tuple[Tuple[int, int], int, object]]:
+        """Allowlisted frames of one thread, innermost first, as
+        `((frame id, node id), node id, frame)` triples.
+        """
+        stack = []
+        code_ids = self._code_ids
+        depth = 0
+
+        while frame is not None and depth < self.max_depth:
+            code = frame.f_code
+            node_id = code_ids.get(code, -1)
+            if node_id == -1:
+                node_id = self._node_id(code, frame.f_globals.get("__name__"))
+            if node_id is not None:
+                stack.append(((id(frame), node_id), node_id, frame))
+
+            frame = frame.f_back
+            depth += 1
+
+        return stack
+
+    def sample_once(self, elapsed: float) -> None:
+        """Take one sample of every other thread, crediting `elapsed`
+        seconds to each call on its stack.
+        """
+        me = threading.get_ident()
+        graph = get_thread_state().graph
+        edge_seconds = self._edge_seconds
+        sampled_threads = set()
+
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == me:
+                continue
+
+            stack = self._stack(frame)
+            del frame
+            if not stack:
+                continue
+
+            sampled_threads.add(thread_id)
+            self.thread_seconds += elapsed
+
+            open_calls = self._open.setdefault(thread_id, {})
+            active = set()
+            with_paths = call_paths_enabled()
+            depth = len(stack)
+
+            for index in range(depth):
+                key, callee_id, callee_frame = stack[index]
+                # The outermost frame has no allowlisted caller; it only
+                # matters for call paths.
+                if index + 1 < depth:
+                    caller_id = stack[index + 1][1]
+                elif with_paths:
+                    caller_id = None
+                else:
+                    break
+                active.add(key)
+
+                self_seconds = elapsed if index == 0 else 0.0
+
+                entry = open_calls.get(key)
+                if entry is None:
+                    path_id = (
+                        chain_path(
+                            node for _, node, _ in reversed(stack[index:])
+                        )
+                        if with_paths else None
+                    )
+                    open_calls[key] = [
+                        caller_id, callee_id, elapsed, self_seconds, path_id,
+                        callee_frame,
+                    ]
+                else:
+                    entry[2] += elapsed
+                    entry[3] += self_seconds
+
+                if caller_id is not None:
+                    edge = (caller_id << EDGE_KEY_SHIFT) | callee_id
+                    edge_seconds[edge] = edge_seconds.get(edge, 0.0) + elapsed
+
+            for key in [key for key in open_calls if key not in active]:
+                _record(graph, open_calls.pop(key))
+
+        # Threads that finished or left allowlisted code since the last
+        # sample end all of their open calls.
+        for thread_id in [t for t in self._open if t not in sampled_threads]:
+            for entry in self._open.pop(thread_id).values():
+                _record(graph, entry)
+
+        self.samples += 1
+        flush_thread_graph()
+
+    def close_open_calls(self) -> None:
+        """Record every call still on a sampled stack as finished."""
+        graph = get_thread_state().graph
+        for open_calls in self._open.values():
+            for entry in open_calls.values():
+                _record(graph, entry)
+
+        self._open.clear()
+        flush_thread_graph()
+
+    # --------------------------------------------------
+    # QUERIES
+    # --------------------------------------------------
+
+    def time_shares(self) -> Dict[Tuple[str, str], float]:
+        """Fraction of sampled thread time spent in each caller -> callee
+        call path.
+        """
+        if self.thread_seconds <= 0:
+            return {}
+
+        mask = (1 << EDGE_KEY_SHIFT) - 1
+        return {
+            (name_of(edge >> EDGE_KEY_SHIFT), name_of(edge & mask)):
+                seconds / self.thread_seconds
+            for edge, seconds in self._edge_seconds.items()
+        }
+
+
+def _record(graph, entry) -> None:
+    caller_id, callee_id, seconds, self_seconds, path_id, _ = entry
+    if caller_id is not None:
+        graph.add_call_ids(caller_id, callee_id, seconds, 1.0, self_seconds)
+    if path_id is not None:
+        graph.add_path(path_id, seconds, self_seconds)
+
+
+# ------------------------------------------------------------
+# PROCESS-WIDE PROFILER
+# ------------------------------------------------------------
+
+_profiler: Optional[SamplingProfiler] = None
+
+
+def get_profiler() -> Optional[SamplingProfiler]:
+    return _profiler
+
+
+def start_profiler(module_prefixes: Iterable[str], **options) -> SamplingProfiler:
+    """Start (or return the already running) process-wide profiler."""
+    global _profiler
+
+    if _profiler is None or not _profiler.running:
+        _profiler = SamplingProfiler(module_prefixes, **options)
+        _profiler.start()
+
+    return _profiler
@@ -0,0 +1,186 @@
+"""Buffered, structured request logging.
+
+`BehaviorMiddleware` hands one small dict per request to `RequestLog.submit`,
+which only appends to an in-memory deque. A daemon writer thread
+drains the buffer in batches and emits them as JSON lines through a logging
+handler (a size-rotated file under ``behavior_data/`` by default), so the
+request path never waits on disk or stdout.
+
+The deque itself is unbounded: once it holds `max_buffer` records,
+`submit` evicts the oldest one before appending and counts each eviction
+in `RequestLog.dropped`.
+"""
+
+from __future__ import annotations
+
+import atexit
+import json
+import logging
+import threading
+from collections import deque
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+from typing import Dict, Optional
+
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+DEFAULT_LOG_PATH = BASE_DIR / "behavior_data" / "requests.log"
+
+
+class RequestLog:
+    def __init__(
+        self,
+        handler: Optional[logging.Handler] = None,
+        path: Optional[Path] = None,
+        max_buffer: int = 10_000,
+        batch_size: int = 500,
+        flush_interval: float = 1.0,
+        max_bytes: int = 10 * 1024 * 1024,
+        backup_count: int = 5,
+    ):
+        if handler is None:
+            path = Path(path or DEFAULT_LOG_PATH)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            handler = RotatingFileHandler(
+                path,
+                maxBytes=max_bytes,
+                backupCount=backup_count,
+                encoding="utf-8",
+                delay=True,
+            )
+            handler.setFormatter(logging.Formatter("%(message)s"))
+
+        self.handler = handler
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self.max_buffer = max_buffer
+        self.dropped = 0
+
+        # Unbounded: `submit` evicts, so that every eviction is counted.
+        self._buffer: deque = deque()
+        self._evict_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+
+        self._logger = logging.getLogger(f"ses.requests.{id(self)}")
+        self._logger.propagate = False
+        self._logger.setLevel(logging.INFO)
+        self._logger.addHandler(handler)
+
+    # --------------------------------------------------
+    # REQUEST PATH
+    # --------------------------------------------------
+
+    def submit(self, record: Dict) -> None:
+        """Queue one record; O(1) and never blocks on I/O."""
+        if self._thread is None:
+            self.start()
+
+        buffer = self._buffer
+        if len(buffer) >= self.max_buffer:
+            # Only when full; the writer may have drained it meanwhile.
+            with self._evict_lock:
+                if len(buffer) >= self.max_buffer:
+                    try:
+                        buffer.popleft()
+                    except IndexError:
+                        pass
+                    else:
+                        self.dropped += 1
+        buffer.append(record)
+
+        if len(buffer) >= self.batch_size:
+            self._wakeup.set()
+
+    # --------------------------------------------------
+    # WRITER
+    # --------------------------------------------------
+
+    def start(self) -> None:
+        with self._start_lock:
+            if self._thread is not None:
+                return
+
+            self._thread = threading.Thread(
+                target=self._run,
+                name="ses-request-log",
+                daemon=True,
+            )
+            self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+        self.flush()
+
+    def flush(self) -> int:
+        """Write everything buffered so far; returns the number of records."""
+        written = 0
+
+        while self._buffer:
+            lines = []
+            while self._buffer and len(lines) < self.batch_size:
+                lines.append(
+                    json.dumps(self._buffer.popleft(), separators=(",", ":"))
+                )
+
+            self.write_lines("\n".join(lines))
+            written += len(lines)
+
+        return written
+
+    def write_lines(self, text: str) -> None:
+        """Emit already serialized JSON lines, e.g. forwarded by a worker."""
+        self._logger.info(text)
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._wakeup.set()
+
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        else:
+            self.flush()
+
+        self.handler.flush()
+
+
+# ------------------------------------------------------------
+# PROCESS-WIDE LOG
+# ------------------------------------------------------------
+
+_request_log: Optional[RequestLog] = None
+_request_log_lock = threading.Lock()
+
+
+def get_request_log() -> RequestLog:
+    global _request_log
+
+    if _request_log is None:
+        with _request_log_lock:
+            if _request_log is None:
+                _request_log = RequestLog()
+                atexit.register(_request_log.stop)
+
+    return _request_log
+
+
+def configure_request_log(**options) -> RequestLog:
+    """Replace the process-wide log, e.g. to send records to a handler."""
+    global _request_log
+
+    with _request_log_lock:
+        previous = _request_log
+        _request_log = RequestLog(**options)
+        atexit.register(_request_log.stop)
+
+    if previous is not None:
+        previous.stop()
+
+    return _request_log
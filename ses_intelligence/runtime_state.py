@@ -1,6 +1,18 @@
 """ses_intelligence.runtime_state
 
-Thread-local runtime state used by the tracing middleware/decorators.
+Runtime state used by the tracing middleware/decorators.
+
+The call stack lives in a `contextvars.ContextVar` as a linked list of
+`[node_id, parent, child_ns, path_id]` frames, where `node_id` is the
+interned function name. Threads and asyncio tasks each see their own stack,
+so concurrent tasks on one event loop produce correct caller -> callee edges.
+
+Each thread records into its own `BehaviorGraph` without locking. Those
+per-thread graphs are periodically flushed (at most once per
+`FLUSH_INTERVAL_NS` from the tracer, and at the end of every request) into
+one process-wide aggregate, which is what snapshots and the debug/API views
+read. When the process is attached to a host-wide `SharedEdgeRegion`
+(see `ses_intelligence.shared_graph`), each flush is also published there.
 
 This module also exposes small helper APIs used by Django views.
 Historically, views expected a `get_runtime_snapshots()` function, but it
@@ -8,15 +20,59 @@ was never implemented, which breaks `python manage.py check`.
 """
 
 import threading
+import time
+from contextvars import ContextVar
 from typing import Dict, List, Optional, Tuple
 
 import networkx as nx
 
-from ses_intelligence.behavior_graph import BehaviorGraph
+from ses_intelligence.behavior_graph import BehaviorGraph, intern_name, name_of
 from ses_intelligence.behavior_change.history import SnapshotStore
+from ses_intelligence.behavior_change.snapshot import BehaviorSnapshot
+from ses_intelligence.shared_graph import get_shared_region
+
+
+FLUSH_INTERVAL_NS = 1_000_000_000
+
+
+class _RuntimeLocal(threading.local):
+    """Per-thread tracing state.
+
+    `threading.local` runs `__init__` once per thread on first access, so the
+    hot path never has to probe for missing attributes.
+    """
+
+    def __init__(self):
+        self.graph = BehaviorGraph()
+        self.next_flush_ns = time.perf_counter_ns() + FLUSH_INTERVAL_NS
+
+
+# A call frame is a `[node_id, parent_frame, child_ns, path_id]` list:
+# cheaper to build on every traced call than an object. `child_ns`
+# accumulates the inclusive time of traced callees, so a call's self time is
+# its own duration minus `child_ns`. `path_id` is filled in lazily by
+# `call_paths.path_of`. Only the call that created a frame and its direct
+# callees touch it.
+CALL_ID = 0
+CALL_PARENT = 1
+CALL_CHILD_NS = 2
+CALL_PATH = 3
 
 
-_thread_local = threading.local()
+_thread_local = _RuntimeLocal()
+
+current_call: ContextVar[Optional[tuple]] = ContextVar(
+    "ses_current_call", default=None
+)
+
+# Process-wide aggregate of all flushed per-thread graphs. The lock is only
+# taken by flushes and readers, never by an individual traced call.
+_process_graph = BehaviorGraph()
+_process_lock = threading.Lock()
+
+# Edges flushed since the last `drain_window_graph()`; the snapshot
+# scheduler turns each drained window into one snapshot.
+_window_graph = BehaviorGraph()
 
 
 class RuntimeSnapshot:
@@ -43,34 +99,101 @@ class RuntimeSnapshot:
 # GRAPH ACCESS
 # ------------------------------------------------------------
 
+def get_thread_state() -> _RuntimeLocal:
+    """Return the thread-local state object.
+
+    The object itself is shared; attribute access resolves per thread, so the
+    tracer can bind it once at import time.
+    """
+    return _thread_local
+
+
 def get_behavior_graph():
-    if not hasattr(_thread_local, "graph"):
-        _thread_local.graph = BehaviorGraph()
+    """Return this thread's (unflushed) accumulation graph."""
     return _thread_local.graph
 
 
+def flush_thread_graph() -> None:
+    """Merge this thread's pending edges into the process-wide aggregate."""
+    state = _thread_local
+    pending = state.graph
+    state.graph = BehaviorGraph()
+    state.next_flush_ns = time.perf_counter_ns() + FLUSH_INTERVAL_NS
+
+    if pending.is_empty():
+        return
+
+    with _process_lock:
+        _process_graph.merge(pending)
+        _window_graph.merge(pending)
+
+    region = get_shared_region()
+    if region is not None:
+        region.publish(pending)
+
+
+def merge_into_process_graph(graph: BehaviorGraph) -> None:
+    """Add edges recorded elsewhere (e.g. received by the collector from
+    worker processes) to the aggregate and the current window.
+    """
+    with _process_lock:
+        _process_graph.merge(graph)
+        _window_graph.merge(graph)
+
+
+def get_process_graph() -> BehaviorGraph:
+    """Return a copy of the process-wide graph covering all threads.
+
+    The calling thread is flushed first so its own recent calls are included;
+    other threads contribute everything up to their last flush.
+    """
+    flush_thread_graph()
+
+    with _process_lock:
+        return _process_graph.copy()
+
+
+def drain_window_graph() -> BehaviorGraph:
+    """Return the edges flushed since the previous drain and start a new
+    window. Edges still pending in other threads land in the next window.
+    """
+    global _window_graph
+
+    flush_thread_graph()
+
+    with _process_lock:
+        window, _window_graph = _window_graph, BehaviorGraph()
+
+    return window
+
+
 # ------------------------------------------------------------
 # CALL STACK MANAGEMENT
 # ------------------------------------------------------------
 
 def push_call(func_name: str):
-    if not hasattr(_thread_local, "call_stack"):
-        _thread_local.call_stack = []
-    _thread_local.call_stack.append(func_name)
+    """Push `func_name` and return a token for `pop_call`."""
+    return current_call.set(
+        [intern_name(func_name), current_call.get(), 0, None]
+    )
+
 
+def pop_call(token=None):
+    if token is not None:
+        current_call.reset(token)
+        return
 
-def pop_call():
-    if hasattr(_thread_local, "call_stack") and _thread_local.call_stack:
-        _thread_local.call_stack.pop()
+    frame = current_call.get()
+    if frame is not None:
+        current_call.set(frame[CALL_PARENT])
 
 
 def get_current_caller():
     """
     Returns the current parent BEFORE pushing new function.
     """
-    if hasattr(_thread_local, "call_stack") and _thread_local.call_stack:
-        return _thread_local.call_stack[-1]
-    return None
+    frame = current_call.get()
+    return name_of(frame[CALL_ID]) if frame is not None else None
 
 
 # ------------------------------------------------------------
@@ -78,8 +201,20 @@ def get_current_caller():
 # ------------------------------------------------------------
 
 def reset_runtime_state():
+    flush_thread_graph()
+    current_call.set(None)
+
+
+def clear_process_graph() -> None:
+    """Discard all recorded edges, in this thread and in the aggregate."""
+    global _process_graph, _window_graph
+
     _thread_local.graph = BehaviorGraph()
-    _thread_local.call_stack = []
+    current_call.set(None)
+
+    with _process_lock:
+        _process_graph = BehaviorGraph()
+        _window_graph = BehaviorGraph()
 
 
 # ------------------------------------------------------------
@@ -94,7 +229,9 @@ def _reconstruct_snapshots(records: List[Dict]) -> List[RuntimeSnapshot]:
     for record in records:
         serialized = record.get("edge_signature", {})
         edge_signature: Dict[Tuple[str, str], Dict] = {
-            tuple(edge_key.split("|")): meta for edge_key, meta in serialized.items()
+            # The caller never contains "|"; older SQL callee names may.
+            tuple(edge_key.split("|", 1)): meta
+            for edge_key, meta in serialized.items()
         }
 
         graph = nx.DiGraph()
@@ -128,29 +265,17 @@ def get_runtime_snapshots(limit: Optional[int] = None) -> List[RuntimeSnapshot]:
 
     Preference order:
       1) On-disk snapshots from `behavior_data/snapshots` (append-only)
-      2) A single in-memory snapshot derived from the current thread-local graph
+      2) A single in-memory snapshot derived from the process-wide graph
     """
-    records = SnapshotStore.load_all()
+    records = (
+        SnapshotStore.load_tail(limit) if limit else SnapshotStore.load_all()
+    )
     if records:
-        snapshots = _reconstruct_snapshots(records)
-        return snapshots[-limit:] if limit else snapshots
+        return _reconstruct_snapshots(records)
 
     # Fallback: construct a single snapshot from the current runtime graph.
-    behavior_graph = get_behavior_graph()
-    graph = behavior_graph.graph.copy()
-
-    edge_signature: Dict[Tuple[str, str], Dict] = {}
-    for u, v, data in graph.edges(data=True):
-        call_count = int(data.get("count", data.get("call_count", 0)) or 0)
-        total_duration = data.get("total_duration")
-        if total_duration is None:
-            total_duration = float(data.get("avg_duration", 0.0) or 0.0) * call_count
-
-        avg_duration = (float(total_duration) / call_count) if call_count > 0 else 0.0
-        edge_signature[(str(u), str(v))] = {
-            "call_count": call_count,
-            "avg_duration": avg_duration,
-        }
+    snapshot = BehaviorSnapshot(get_process_graph())
+    graph = snapshot.graph
 
     # Even with zero edges, having a graph can be useful (health score becomes 100).
     if graph.number_of_nodes() == 0 and graph.number_of_edges() == 0:
@@ -159,7 +284,10 @@ def get_runtime_snapshots(limit: Optional[int] = None) -> List[RuntimeSnapshot]:
     return [
         RuntimeSnapshot(
             graph=graph,
-            edge_signature=edge_signature,
+            edge_signature={
+                (str(u), str(v)): meta
+                for (u, v), meta in snapshot.edge_signature().items()
+            },
             snapshot_id="in_memory",
         )
     ]
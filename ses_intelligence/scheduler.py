@@ -0,0 +1,350 @@
+"""Background snapshot scheduler.
+
+Takes a snapshot of the process-wide behavior graph on fixed tumbling
+windows: each window's edges are drained from the aggregate, snapshotted
+and persisted, so snapshot history is evenly spaced in time (which the
+slope-based forecasters assume) without any traffic to debug endpoints.
+
+When a window shows timing or memory regressions against the previous
+one, the interval is halved (down to `min_interval`) to sample the
+regression more closely; quiet windows double it back towards the
+configured interval.
+Windows with no traced calls are skipped rather than persisted empty.
+
+When the process is attached to a host-wide shared edge region, windows are
+read from the merged counters of all workers instead, and only the process
+holding the region's leader lock takes snapshots. Without a shared region,
+only the process holding an `fcntl.flock` on ``scheduler.lock`` in the
+snapshot directory persists windows, so several workers (or the runserver
+reloader's parent and child) never write interleaved partial windows; the
+others hand each of their windows over through the ``handoff`` directory
+next to it, and the leader adds them to its next window.
+
+Leadership is decided by those locks, across processes: `snapshots_scheduled`
+asks whether any process on the host holds one. A scheduler started before
+a fork (gunicorn ``--preload``) is restarted in the child, since threads
+do not survive `fork()`.
+
+Started from `SesIntelligenceConfig.ready()` when the
+`SES_SNAPSHOT_INTERVAL` setting is set (it is off by default).
+"""
+
+from __future__ import annotations
+
+import fcntl
+import logging
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+from ses_intelligence.behavior_change import history
+from ses_intelligence.behavior_change.analysis import analyze_diff
+from ses_intelligence.behavior_change.diff import diff_snapshots
+from ses_intelligence.behavior_change.snapshot import BehaviorSnapshot
+from ses_intelligence.behavior_change.store import (
+    get_previous_snapshot,
+    save_snapshot,
+)
+from ses_intelligence.behavior_graph import BehaviorGraph
+from ses_intelligence.collector import decode_edges, encode_edges
+from ses_intelligence.runtime_state import drain_window_graph
+from ses_intelligence.shared_graph import get_shared_region
+
+
+logger = logging.getLogger(__name__)
+
+LEADER_LOCK_NAME = "scheduler.lock"
+HANDOFF_DIR_NAME = "handoff"
+HANDOFF_SUFFIX = ".edges"
+
+
+class SnapshotScheduler:
+    def __init__(
+        self,
+        interval: float = 60.0,
+        min_interval: float = 10.0,
+        timing_threshold_pct: float = 20.0,
+        on_snapshot: Optional[Callable[[BehaviorSnapshot], None]] = None,
+    ):
+        if interval <= 0 or min_interval <= 0:
+            raise ValueError("Snapshot intervals must be positive")
+
+        self.base_interval = float(interval)
+        self.min_interval = min(float(min_interval), self.base_interval)
+        self.timing_threshold_pct = timing_threshold_pct
+        # Called after each persisted snapshot, e.g. to run the pipeline.
+        self.on_snapshot = on_snapshot
+
+        self.interval = self.base_interval
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # --------------------------------------------------
+    # LIFECYCLE
+    # --------------------------------------------------
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        if self.running:
+            return
+
+        self._stopped.clear()
+        self._thread = threading.Thread(
+            target=self._run,
+            name="ses-snapshot-scheduler",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self) -> None:
+        # Start the first window now so it has a well-defined start. What
+        # came before is dropped, not handed over: in a forked child it is
+        # the parent's traffic, which the parent reports itself.
+        self._drain_window(hand_over=False)
+        window_start = time.monotonic()
+
+        while True:
+            deadline = window_start + self.interval
+            if self._stopped.wait(max(0.0, deadline - time.monotonic())):
+                return
+
+            window_seconds = self.interval
+            window_start = deadline
+
+            try:
+                self.run_once(window_seconds)
+            except Exception:
+                logger.exception("Snapshot scheduler tick failed")
+
+    # --------------------------------------------------
+    # ONE WINDOW
+    # --------------------------------------------------
+
+    def run_once(self, window_seconds: Optional[float] = None) -> Optional[Dict]:
+        """Snapshot the current window; returns a short report, or None when
+        the window was empty.
+        """
+        window = self._drain_window()
+        if window is None or window.is_empty():
+            return None
+
+        snapshot = BehaviorSnapshot(
+            window,
+            window_seconds=window_seconds or self.interval,
+        )
+
+        regressions = 0
+        previous = get_previous_snapshot()
+        if previous is not None:
+            changes, _ = analyze_diff(
+                diff_snapshots(previous, snapshot, self.timing_threshold_pct)
+            )
+            regressions = sum(
+                1 for change in changes
+                if change.type in ("timing_regression", "memory_regression")
+            )
+
+        snapshot.persist()
+        save_snapshot(snapshot)
+
+        if self.on_snapshot is not None:
+            try:
+                self.on_snapshot(snapshot)
+            except Exception:
+                logger.exception("Snapshot callback failed")
+
+        self._adapt_interval(regressions)
+
+        return {
+            "edges": snapshot.graph.number_of_edges(),
+            "regressions": regressions,
+            "next_interval": self.interval,
+        }
+
+    @staticmethod
+    def _drain_window(hand_over: bool = True):
+        """This window's edges, or None when another process leads.
+
+        Without a shared region, a process that does not lead hands its
+        window over to the one that does. With one, the local window is
+        only reset: every worker's edges are in the region already.
+        """
+        window = drain_window_graph()
+
+        region = get_shared_region()
+        if region is not None:
+            return region.drain_window() if region.try_lead() else None
+
+        handoff = Path(history.SNAPSHOT_DIR) / HANDOFF_DIR_NAME
+        if not _leader.try_lead(history.SNAPSHOT_DIR):
+            if hand_over:
+                _hand_over(window, handoff)
+            return None
+        _take_over(window, handoff)
+        return window
+
+    def _adapt_interval(self, regressions: int) -> None:
+        if regressions:
+            self.interval = max(self.min_interval, self.interval / 2)
+        else:
+            self.interval = min(self.base_interval, self.interval * 2)
+
+
+# ------------------------------------------------------------
+# SNAPSHOT WRITER ELECTION
+# ------------------------------------------------------------
+
+class _SnapshotLeader:
+    """Non-blocking `flock` on the snapshot directory's lock file, kept for
+    the life of the process that wins it (the kernel releases it on exit).
+    """
+
+    def __init__(self):
+        self._path: Optional[Path] = None
+        self._fd: Optional[int] = None
+        self._pid: Optional[int] = None
+
+    def try_lead(self, directory) -> bool:
+        path = Path(directory) / LEADER_LOCK_NAME
+        if self._fd is not None:
+            if self._path == path and self._pid == os.getpid():
+                return True
+            # A forked child shares the parent's lock; closing its copy of
+            # the descriptor leaves the parent's lock in place.
+            os.close(self._fd)
+            self._fd = None
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+
+        self._path, self._fd, self._pid = path, fd, os.getpid()
+        return True
+
+
+_leader = _SnapshotLeader()
+
+
+def _lock_held(path: Path) -> bool:
+    """Whether some process (this one included) holds the lock on `path`.
+
+    Probing takes the lock for a moment when it is free; a scheduler
+    trying to lead just then waits for its next window.
+    """
+    try:
+        fd = os.open(path, os.O_RDWR)
+    except FileNotFoundError:
+        return False
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        return True
+    finally:
+        os.close(fd)
+    return False
+
+
+# ------------------------------------------------------------
+# WINDOW HANDOVER
+# ------------------------------------------------------------
+
+def _hand_over(window: BehaviorGraph, directory: Path) -> None:
+    """Leave a non-leader's window in `directory` for the leader."""
+    if window.is_empty():
+        return
+
+    directory.mkdir(parents=True, exist_ok=True)
+    # One message: no datagram limit applies to a file.
+    (message,) = encode_edges(window, max_datagram=sys.maxsize)
+    name = f"{os.getpid()}-{time.time_ns()}"
+    partial = directory / f"{name}.tmp"
+    partial.write_bytes(message)
+    # Renamed once complete, so the leader never reads half a window.
+    os.replace(partial, directory / f"{name}{HANDOFF_SUFFIX}")
+
+
+def _take_over(window: BehaviorGraph, directory: Path) -> None:
+    """Add the windows other processes handed over to `window`."""
+    if not directory.is_dir():
+        return
+
+    for path in sorted(directory.glob(f"*{HANDOFF_SUFFIX}")):
+        try:
+            payload = path.read_bytes()
+            path.unlink()
+        except FileNotFoundError:
+            continue
+        try:
+            window.merge(decode_edges(payload))
+        except Exception:
+            logger.exception("Dropping unreadable handed-over window %s", path)
+
+
+# ------------------------------------------------------------
+# PROCESS-WIDE SCHEDULER
+# ------------------------------------------------------------
+
+_scheduler: Optional[SnapshotScheduler] = None
+
+
+def get_scheduler() -> Optional[SnapshotScheduler]:
+    return _scheduler
+
+
+def snapshots_scheduled() -> bool:
+    """Whether a scheduler persists windows for this host's traffic.
+
+    Either this process runs one, or another process holds the leader
+    lock: the lock of the shared region when attached, otherwise the one
+    in the snapshot directory. The in-process scheduler alone says nothing
+    about the other workers of a server.
+    """
+    if _scheduler is not None and _scheduler.running:
+        return True
+
+    region = get_shared_region()
+    if region is not None:
+        return _lock_held(region.leader_path)
+    return _lock_held(Path(history.SNAPSHOT_DIR) / LEADER_LOCK_NAME)
+
+
+def start_scheduler(**options) -> SnapshotScheduler:
+    """Start (or return the already running) process-wide scheduler."""
+    global _scheduler
+
+    if _scheduler is None or not _scheduler.running:
+        _scheduler = SnapshotScheduler(**options)
+        _scheduler.start()
+
+    return _scheduler
+
+
+def _restart_after_fork() -> None:
+    # Only the forking thread survives fork(). A child of a process whose
+    # scheduler was running (gunicorn --preload) restarts it, to lead or
+    # hand its windows over like any other worker.
+    scheduler = _scheduler
+    if (
+        scheduler is not None
+        and scheduler._thread is not None
+        and not scheduler._stopped.is_set()
+    ):
+        scheduler.start()
+
+
+os.register_at_fork(after_in_child=_restart_after_fork)
@@ -0,0 +1,601 @@
+"""Host-wide edge counters shared by all worker processes.
+
+Each gunicorn/uwsgi worker keeps its own `BehaviorGraph`, so without help a
+snapshot only describes one worker. `SharedEdgeRegion` is a fixed-layout,
+file-backed `mmap` (put it on ``/dev/shm`` to keep it in memory) that every
+worker on the host attaches to:
+
+- a directory maps edges (``caller, callee`` names) and call paths (the
+  slot of the parent path plus the innermost name, as in the `call_paths`
+  trie) to a slot; names are interned per process, so the directory is
+  what makes ids agree across processes. Inserting an entry takes an
+  `fcntl.flock` on the file; lookups are lock-free and cached per process.
+- every worker claims its own row of counters per slot, so each counter
+  has exactly one writer and needs no atomics. A per-worker sequence number
+  (odd while a batch is being written) lets readers take a consistent copy
+  of each row, seqlock style.
+
+A slot's counters are the `EdgeStats` measurements (count, total and self
+duration, then CPU time, memory, SQL rows and outcomes) followed by the
+edge's latency histogram (see `ses_intelligence.latency`); call paths only
+use the first three. An edge's DDSketch has no fixed size, so it stays in
+each process: sketches read back from the region are rebuilt from the
+histogram, and their percentiles are as coarse as its buckets. Peak bytes
+are a maximum rather than a sum: each worker keeps its largest peak, and a
+drained window reports the host's largest peak so far for the edges
+memory-sampled in that window.
+
+Workers publish their flushed thread graphs (`flush_thread_graph`) into
+their row. The snapshot scheduler in whichever process holds the leader
+lock reads the rows of all workers, merged, and turns the change since its
+previous read into the window's snapshot.
+
+When the region is full (every slot or worker slot taken) or a name does
+not fit a slot, `publish` skips those entries, counts them in
+`dropped_edges` and `dropped_paths` and logs a warning once per process;
+the process keeps its own totals and keeps serving.
+
+The file is sparse: only the counters of slots a worker wrote take memory.
+Rows of workers that exit keep their totals, and a new worker reusing the
+slot adds on top of them, so the merged totals never go backwards. POSIX
+only (`fcntl`).
+"""
+
+from __future__ import annotations
+
+import fcntl
+import logging
+import mmap
+import os
+import struct
+import threading
+import zlib
+from pathlib import Path
+from typing import Dict, Optional, Set, Tuple
+
+import numpy as np
+
+from ses_intelligence.behavior_graph import (
+    OPTIONAL_FIELDS,
+    BehaviorGraph,
+    EdgeStats,
+    intern_name,
+)
+from ses_intelligence.call_paths import ROOT_PATH, intern_path, path_names
+from ses_intelligence.latency import NUM_BUCKETS
+
+
+logger = logging.getLogger(__name__)
+
+# Was b"SESEDGE2" while slots only held count, total and self duration.
+MAGIC = b"SESEDGE3"
+_HEADER = struct.Struct("<8sIII")
+HEADER_SIZE = 64
+
+_WORKER = struct.Struct("<qq")  # pid, sequence number
+_EDGE_HEADER = struct.Struct("<II")  # state, name length
+_PATH_PARENT = struct.Struct("<I")  # parent path slot + 1, 0 for a root
+
+EDGE_EMPTY = 0
+EDGE_USED = 1
+PATH_USED = 2
+
+# Counters per slot and worker: these `EdgeStats` fields, then the latency
+# histogram. Call paths only use count, total and self duration.
+FIELDS = ("count", "total_duration", "self_duration") + OPTIONAL_FIELDS
+_MEMORY_COUNT = FIELDS.index("memory_count")
+_PEAK = FIELDS.index("peak_bytes")
+_HISTOGRAM = len(FIELDS)
+COUNTERS_PER_EDGE = len(FIELDS) + NUM_BUCKETS
+
+# Attempts at a consistent copy of a row that is being written.
+_READ_RETRIES = 1000
+
+DEFAULT_MAX_WORKERS = 64
+DEFAULT_MAX_EDGES = 8192
+# Fits a shortened SQL statement (`sql.MAX_STATEMENT_LENGTH` plus its hash
+# suffix) next to a long caller name; directory entries are 512 bytes.
+DEFAULT_NAME_SIZE = 504
+
+
+class SharedRegionFull(RuntimeError):
+    """Raised when the region has no free worker slot or edge slot."""
+
+
+class EdgeNameTooLong(ValueError):
+    """Raised for an entry whose encoded name exceeds the slot name size."""
+
+
+class SharedEdgeRegion:
+    def __init__(
+        self,
+        path,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+        max_edges: int = DEFAULT_MAX_EDGES,
+        name_size: int = DEFAULT_NAME_SIZE,
+    ):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Held by the one process that snapshots the region.
+        self.leader_path = Path(f"{self.path}.leader")
+
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+        with self._file_lock():
+            if os.fstat(self._fd).st_size == 0:
+                self._initialize(max_workers, max_edges, name_size)
+
+            header = os.pread(self._fd, _HEADER.size, 0)
+            magic, self.max_workers, self.max_edges, self.name_size = (
+                _HEADER.unpack(header)
+            )
+            if magic != MAGIC:
+                raise ValueError(f"{self.path} is not a shared edge region")
+
+        self._edge_size = _EDGE_HEADER.size + self.name_size
+        self._workers_offset = HEADER_SIZE
+        self._edges_offset = (
+            self._workers_offset + self.max_workers * _WORKER.size
+        )
+        self._counters_offset = (
+            self._edges_offset + self.max_edges * self._edge_size
+        )
+
+        self._mm = mmap.mmap(self._fd, self._size())
+        self._workers = memoryview(self._mm)[
+            self._workers_offset:self._edges_offset
+        ].cast("q")
+        self._counter_rows = np.frombuffer(
+            self._mm,
+            dtype=np.float64,
+            count=self.max_workers * self.max_edges * COUNTERS_PER_EDGE,
+            offset=self._counters_offset,
+        ).reshape(self.max_workers, self.max_edges, COUNTERS_PER_EDGE)
+
+        # (caller, callee) -> edge slot and call path -> path slot, for
+        # entries this process has seen.
+        self._slots: Dict[Tuple[str, str], int] = {}
+        self._path_slots: Dict[Tuple[str, ...], int] = {}
+        # Entries that got no slot; slots are never freed, so not retried.
+        self._rejected: Set[Tuple[str, str]] = set()
+        self._rejected_paths: Set[Tuple[str, ...]] = set()
+        # Edge and call path records `publish` could not add to the region.
+        self.dropped_edges = 0
+        self.dropped_paths = 0
+        self._warned = False
+        self._worker_slot: Optional[int] = None
+        self._worker_pid: Optional[int] = None
+
+        # Merged totals at the previous `drain_window()`.
+        self._drained = np.zeros((self.max_edges, COUNTERS_PER_EDGE))
+        self._leader_fd: Optional[int] = None
+
+    # --------------------------------------------------
+    # LAYOUT
+    # --------------------------------------------------
+
+    def _size(self) -> int:
+        return self._counters_offset + (
+            self.max_workers * self.max_edges * COUNTERS_PER_EDGE * 8
+        )
+
+    def _initialize(self, max_workers, max_edges, name_size) -> None:
+        self.max_workers = max_workers
+        self.max_edges = max_edges
+        self._edge_size = _EDGE_HEADER.size + name_size
+        self._counters_offset = (
+            HEADER_SIZE
+            + max_workers * _WORKER.size
+            + max_edges * self._edge_size
+        )
+        os.ftruncate(self._fd, self._size())
+        os.pwrite(
+            self._fd,
+            _HEADER.pack(MAGIC, max_workers, max_edges, name_size),
+            0,
+        )
+
+    def _file_lock(self):
+        if self._pid != os.getpid():
+            self._after_fork()
+        return _FileLock(self._fd)
+
+    def _after_fork(self) -> None:
+        # flock() locks belong to the open file description, which a forked
+        # child shares with its parent; the child needs its own.
+        self._fd = os.open(self.path, os.O_RDWR)
+        if self._leader_fd is not None:
+            os.close(self._leader_fd)
+            self._leader_fd = None
+        self._pid = os.getpid()
+
+    def close(self) -> None:
+        if self._leader_fd is not None:
+            os.close(self._leader_fd)
+            self._leader_fd = None
+
+        self._workers.release()
+        del self._counter_rows
+        self._mm.close()
+        os.close(self._fd)
+
+    # --------------------------------------------------
+    # DIRECTORY
+    # --------------------------------------------------
+
+    @staticmethod
+    def _encode(caller: str, callee: str) -> bytes:
+        return f"{caller}\0{callee}".encode("utf-8")
+
+    def _read_edge(self, slot: int) -> Tuple[int, bytes]:
+        offset = self._edges_offset + slot * self._edge_size
+        state, length = _EDGE_HEADER.unpack_from(self._mm, offset)
+        if state == EDGE_EMPTY:
+            return state, b""
+        start = offset + _EDGE_HEADER.size
+        return state, self._mm[start:start + length]
+
+    def _probe(
+        self, kind: int, name: bytes
+    ) -> Tuple[Optional[int], Optional[int]]:
+        """Return `(slot holding name, first empty slot)`."""
+        start = zlib.crc32(name) % self.max_edges
+        for step in range(self.max_edges):
+            slot = (start + step) % self.max_edges
+            state, stored = self._read_edge(slot)
+            if state == EDGE_EMPTY:
+                return None, slot
+            if state == kind and stored == name:
+                return slot, None
+        return None, None
+
+    def _slot(self, kind: int, name: bytes) -> int:
+        """Return the slot of a `kind` entry, creating it if needed.
+
+        Raises `EdgeNameTooLong` rather than truncating, so two long names
+        never share a slot.
+        """
+        if len(name) > self.name_size:
+            raise EdgeNameTooLong(
+                f"Name is {len(name)} bytes; slots hold {self.name_size}"
+            )
+
+        slot, _ = self._probe(kind, name)
+        if slot is None:
+            with self._file_lock():
+                slot, empty = self._probe(kind, name)
+                if slot is None:
+                    if empty is None:
+                        raise SharedRegionFull("No free edge slot")
+                    offset = self._edges_offset + empty * self._edge_size
+                    start = offset + _EDGE_HEADER.size
+                    self._mm[start:start + len(name)] = name
+                    # The state is written last so readers never see a
+                    # used slot without its name.
+                    _EDGE_HEADER.pack_into(self._mm, offset, kind, len(name))
+                    slot = empty
+        return slot
+
+    def edge_slot(self, caller: str, callee: str) -> int:
+        """Return the host-wide slot of an edge, creating it if needed."""
+        slot = self._slots.get((caller, callee))
+        if slot is None:
+            slot = self._slot(EDGE_USED, self._encode(caller, callee))
+            self._slots[(caller, callee)] = slot
+        return slot
+
+    def path_slot(self, path: Tuple[str, ...]) -> int:
+        """Return the host-wide slot of a call path (names, outermost
+        first), creating it and its prefixes if needed.
+        """
+        slot = self._path_slots.get(path)
+        if slot is None:
+            parent = self.path_slot(path[:-1]) + 1 if len(path) > 1 else 0
+            slot = self._slot(
+                PATH_USED,
+                _PATH_PARENT.pack(parent) + path[-1].encode("utf-8"),
+            )
+            self._path_slots[path] = slot
+        return slot
+
+    def _entries(self, kind: int) -> Dict[int, bytes]:
+        entries = {}
+        for slot in range(self.max_edges):
+            state, stored = self._read_edge(slot)
+            if state == kind:
+                entries[slot] = stored
+        return entries
+
+    def edge_names(self) -> Dict[int, Tuple[str, str]]:
+        names = {}
+        for slot, stored in self._entries(EDGE_USED).items():
+            caller, _, callee = stored.decode("utf-8", "replace").partition("\0")
+            names[slot] = (caller, callee)
+        return names
+
+    def call_paths(self) -> Dict[int, Tuple[str, ...]]:
+        """Slot -> call path (names, outermost first)."""
+        entries = self._entries(PATH_USED)
+        paths: Dict[int, Tuple[str, ...]] = {}
+
+        def resolve(slot):
+            path = paths.get(slot)
+            if path is None:
+                (parent,) = _PATH_PARENT.unpack_from(entries[slot])
+                name = entries[slot][_PATH_PARENT.size:].decode(
+                    "utf-8", "replace"
+                )
+                prefix = resolve(parent - 1) if parent else ()
+                path = paths[slot] = prefix + (name,)
+            return path
+
+        # A path's prefixes get their slots first, so every parent a reader
+        # finds is already in `entries`.
+        for slot in entries:
+            resolve(slot)
+        return paths
+
+    # --------------------------------------------------
+    # WRITER (one row per worker process)
+    # --------------------------------------------------
+
+    def _claim_worker_slot(self) -> int:
+        pid = os.getpid()
+        if self._worker_pid == pid:
+            return self._worker_slot
+
+        # First publish in this process, or first after a fork.
+        workers = self._workers
+        with self._file_lock():
+            free = None
+            for slot in range(self.max_workers):
+                owner = workers[slot * 2]
+                if owner == pid:
+                    free = slot
+                    break
+                if free is None and (owner == 0 or not _pid_alive(owner)):
+                    free = slot
+
+            if free is None:
+                raise SharedRegionFull("No free worker slot")
+
+            workers[free * 2] = pid
+
+        self._worker_slot = free
+        self._worker_pid = pid
+        return free
+
+    def publish(self, graph: BehaviorGraph) -> None:
+        """Add the edge and call path totals of `graph` to this worker's
+        row.
+
+        Entries that cannot be placed are counted in `dropped_edges` and
+        `dropped_paths`; this never raises on a full region.
+        """
+        if graph.is_empty():
+            return
+
+        with self._lock:
+            try:
+                worker = self._claim_worker_slot()
+            except SharedRegionFull as exc:
+                self.dropped_edges += sum(1 for _ in graph.iter_edges())
+                self.dropped_paths += sum(1 for _ in graph.iter_paths())
+                self._warn_dropped(exc)
+                return
+
+            pending = []
+            for edge in graph.iter_edges():
+                key = (edge.caller, edge.callee)
+                if key in self._rejected:
+                    self.dropped_edges += 1
+                    continue
+                try:
+                    pending.append((self.edge_slot(*key), _counters(edge)))
+                except (SharedRegionFull, EdgeNameTooLong) as exc:
+                    self._rejected.add(key)
+                    self.dropped_edges += 1
+                    self._warn_dropped(exc)
+
+            for path_id, stats in graph.iter_paths():
+                path = tuple(path_names(path_id))
+                if not path:
+                    continue
+                if path in self._rejected_paths:
+                    self.dropped_paths += 1
+                    continue
+                try:
+                    slot = self.path_slot(path)
+                except (SharedRegionFull, EdgeNameTooLong) as exc:
+                    self._rejected_paths.add(path)
+                    self.dropped_paths += 1
+                    self._warn_dropped(exc)
+                    continue
+                counters = np.zeros(COUNTERS_PER_EDGE)
+                counters[:3] = stats
+                pending.append((slot, counters))
+
+            rows = self._counter_rows[worker]
+            workers = self._workers
+            sequence = worker * 2 + 1
+
+            workers[sequence] += 1
+            for slot, counters in pending:
+                row = rows[slot]
+                peak = max(row[_PEAK], counters[_PEAK])
+                row += counters
+                row[_PEAK] = peak
+            workers[sequence] += 1
+
+    def _warn_dropped(self, reason: Exception) -> None:
+        if not self._warned:
+            self._warned = True
+            logger.warning(
+                "Shared edge region %s dropped an entry (%s); snapshots "
+                "will miss it and any others dropped after it",
+                self.path,
+                reason,
+            )
+
+    # --------------------------------------------------
+    # READER
+    # --------------------------------------------------
+
+    def totals(self) -> np.ndarray:
+        """Merged counters per slot (see `FIELDS`), over all workers: sums,
+        except peak bytes, the largest peak of any worker.
+        """
+        merged = np.zeros((self.max_edges, COUNTERS_PER_EDGE))
+        workers = self._workers
+        # Only slots in use are copied; others have no counters yet.
+        used = np.array(
+            [
+                slot
+                for slot in range(self.max_edges)
+                if self._read_edge(slot)[0] != EDGE_EMPTY
+            ],
+            dtype=np.intp,
+        )
+
+        for worker in range(self.max_workers):
+            if workers[worker * 2] == 0:
+                continue
+
+            sequence = worker * 2 + 1
+            for _ in range(_READ_RETRIES):
+                before = workers[sequence]
+                rows = self._counter_rows[worker][used]
+                if before % 2 == 0 and workers[sequence] == before:
+                    break
+            # After that many retries the writer most likely died mid-batch;
+            # the row is then used as is.
+
+            peaks = np.maximum(merged[used, _PEAK], rows[:, _PEAK])
+            merged[used] += rows
+            merged[used, _PEAK] = peaks
+
+        return merged
+
+    def to_graph(self, totals: Optional[np.ndarray] = None) -> BehaviorGraph:
+        totals = self.totals() if totals is None else totals
+        graph = BehaviorGraph()
+
+        for slot, (caller, callee) in self.edge_names().items():
+            counters = totals[slot].tolist()
+            if counters[0] <= 0:
+                continue
+            histogram = {
+                bucket: count
+                for bucket, count in enumerate(counters[_HISTOGRAM:])
+                if count > 0
+            }
+            graph.add_totals(
+                caller,
+                callee,
+                histogram=histogram,
+                **dict(zip(FIELDS, counters[:_HISTOGRAM])),
+            )
+
+        for slot, path in self.call_paths().items():
+            count, total, self_total = totals[slot, :3].tolist()
+            if count <= 0:
+                continue
+            path_id = ROOT_PATH
+            for name in path:
+                path_id = intern_path(path_id, intern_name(name))
+            graph.add_path_totals(path_id, count, total, self_total)
+
+        return graph
+
+    def drain_window(self) -> BehaviorGraph:
+        """Merged edges and call paths added since the previous drain in
+        this process.
+        """
+        totals = self.totals()
+        window = totals - self._drained
+        window[:, _PEAK] = np.where(
+            window[:, _MEMORY_COUNT] > 0, totals[:, _PEAK], 0.0
+        )
+        self._drained = totals
+        return self.to_graph(window)
+
+    def try_lead(self) -> bool:
+        """Become (or stay) the one process that snapshots the region."""
+        if self._pid != os.getpid():
+            self._after_fork()
+        if self._leader_fd is not None:
+            return True
+
+        fd = os.open(self.leader_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+
+        self._leader_fd = fd
+        # Start the first window now rather than at the host's first call.
+        self._drained = self.totals()
+        return True
+
+
+def _counters(edge: EdgeStats) -> np.ndarray:
+    counters = np.empty(COUNTERS_PER_EDGE)
+    counters[:_HISTOGRAM] = [getattr(edge, name) for name in FIELDS]
+    counters[_HISTOGRAM:] = edge.histogram
+    return counters
+
+
+class _FileLock:
+    def __init__(self, fd: int):
+        self.fd = fd
+
+    def __enter__(self):
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+# ------------------------------------------------------------
+# PROCESS-WIDE REGION
+# ------------------------------------------------------------
+
+_region: Optional[SharedEdgeRegion] = None
+
+
+def get_shared_region() -> Optional[SharedEdgeRegion]:
+    return _region
+
+
+def attach_shared_region(path, **options) -> SharedEdgeRegion:
+    """Attach this process to the host-wide region at `path`; flushed
+    thread graphs are published to it from then on.
+    """
+    global _region
+
+    if _region is None or _region.path != Path(path):
+        _region = SharedEdgeRegion(path, **options)
+
+    return _region
+
+
+def detach_shared_region() -> None:
+    global _region
+
+    if _region is not None:
+        _region.close()
+        _region = None
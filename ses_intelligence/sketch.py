@@ -0,0 +1,155 @@
+"""Mergeable quantile sketches with relative-error guarantees.
+
+`DDSketch` follows the DDSketch construction (Masson et al., 2019): values
+are mapped to logarithmic bins of ratio `gamma = (1 + a) / (1 - a)`, and any
+quantile read back from the sketch is within relative error `a` of the true
+value. Sketches with the same accuracy merge by adding bin counts, so
+per-edge sketches can be combined across threads, workers, snapshots and
+arbitrary time windows without keeping raw samples.
+
+The tracer does not build `DDSketch` objects per call; `BehaviorGraph`
+updates plain `{bin_index: count}` dicts using `bin_index()` and wraps them
+when a snapshot is taken.
+"""
+
+from __future__ import annotations
+
+import math
+from typing import Dict, Iterable, Optional
+
+
+DEFAULT_RELATIVE_ACCURACY = 0.01
+
+# Durations at or below this (seconds) are clamped to it; 1ns is the
+# resolution of the underlying timer.
+MIN_VALUE = 1e-9
+
+DEFAULT_MAX_BINS = 2048
+
+
+def _inverse_log_gamma(relative_accuracy: float) -> float:
+    gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+    return 1.0 / math.log(gamma)
+
+
+INV_LOG_GAMMA = _inverse_log_gamma(DEFAULT_RELATIVE_ACCURACY)
+
+
+def bin_index(value: float, inv_log_gamma: float = INV_LOG_GAMMA) -> int:
+    if value < MIN_VALUE:
+        value = MIN_VALUE
+    return math.ceil(math.log(value) * inv_log_gamma)
+
+
+class DDSketch:
+    def __init__(
+        self,
+        relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY,
+        bins: Optional[Dict[int, float]] = None,
+        max_bins: int = DEFAULT_MAX_BINS,
+    ):
+        if not 0.0 < relative_accuracy < 1.0:
+            raise ValueError("relative_accuracy must be in (0, 1)")
+
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.inv_log_gamma = 1.0 / math.log(self.gamma)
+        self.max_bins = max_bins
+        self.bins: Dict[int, float] = dict(bins or {})
+        self._collapse()
+
+    # --------------------------------------------------
+    # UPDATES
+    # --------------------------------------------------
+
+    def add(self, value: float, weight: float = 1.0) -> None:
+        index = bin_index(value, self.inv_log_gamma)
+        self.bins[index] = self.bins.get(index, 0.0) + weight
+        if len(self.bins) > self.max_bins:
+            self._collapse()
+
+    def merge(self, other: "DDSketch") -> "DDSketch":
+        if not math.isclose(other.relative_accuracy, self.relative_accuracy):
+            raise ValueError("Cannot merge sketches with different accuracy")
+
+        for index, count in other.bins.items():
+            self.bins[index] = self.bins.get(index, 0.0) + count
+
+        self._collapse()
+        return self
+
+    def _collapse(self) -> None:
+        # Fold the lowest bins together; this keeps upper quantiles (the
+        # ones latency analysis cares about) within the accuracy bound.
+        if len(self.bins) <= self.max_bins:
+            return
+
+        ordered = sorted(self.bins)
+        overflow = ordered[: len(ordered) - self.max_bins + 1]
+        folded = sum(self.bins.pop(index) for index in overflow)
+        target = overflow[-1]
+        self.bins[target] = self.bins.get(target, 0.0) + folded
+
+    # --------------------------------------------------
+    # QUERIES
+    # --------------------------------------------------
+
+    @property
+    def count(self) -> float:
+        return sum(self.bins.values())
+
+    def _bin_value(self, index: int) -> float:
+        return 2 * self.gamma ** index / (self.gamma + 1)
+
+    def quantile(self, q: float) -> float:
+        """Value at quantile `q` in [0, 1]; 0.0 for an empty sketch."""
+        total = self.count
+        if total <= 0:
+            return 0.0
+
+        rank = min(max(q, 0.0), 1.0) * (total - 1)
+        cumulative = 0.0
+
+        for index in sorted(self.bins):
+            cumulative += self.bins[index]
+            if cumulative > rank:
+                return self._bin_value(index)
+
+        return self._bin_value(max(self.bins))
+
+    def percentile(self, p: float) -> float:
+        return self.quantile(p / 100.0)
+
+    # --------------------------------------------------
+    # SERIALIZATION
+    # --------------------------------------------------
+
+    def to_dict(self) -> Dict:
+        return {
+            "relative_accuracy": self.relative_accuracy,
+            "bins": {str(index): count for index, count in self.bins.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data: Optional[Dict]) -> "DDSketch":
+        data = data or {}
+        return cls(
+            relative_accuracy=data.get(
+                "relative_accuracy", DEFAULT_RELATIVE_ACCURACY
+            ),
+            bins={
+                int(index): float(count)
+                for index, count in (data.get("bins") or {}).items()
+            },
+        )
+
+
+def merge_sketches(sketches: Iterable[Dict]) -> Optional[DDSketch]:
+    """Merge serialized sketches; returns None when none were given."""
+    merged = None
+    for data in sketches:
+        if not data:
+            continue
+        sketch = DDSketch.from_dict(data)
+        merged = sketch if merged is None else merged.merge(sketch)
+    return merged
@@ -0,0 +1,134 @@
+"""Django SQL query attribution.
+
+`enable_sql_attribution()` installs an execute wrapper (Django's
+``connection.execute_wrapper`` hook) on every database connection. Each
+statement run while a traced function is on the call stack is recorded as
+a callee of that function: the node is the normalized statement (literals
+and parameters replaced by ``?``, ``IN`` lists collapsed) prefixed with
+``sql:``, and the edge carries the query count, total time and the rows
+returned or affected (as reported by ``cursor.rowcount``; backends that
+report -1 for SELECT, like SQLite, only count rows of writes).
+
+Statement edges are ordinary `BehaviorGraph` edges, so snapshots, the
+health pipeline and `diff_snapshots` treat them like any other: a new query
+shows up as ``edge_added``, a slower one as ``timing_regression``. Query
+time is child time of the calling function, so its self time excludes it.
+
+Statements longer than `MAX_STATEMENT_LENGTH` are shortened for display
+and suffixed with a hash of the whole normalized statement, so two
+statements sharing a long prefix (Django's column lists alone run past the
+limit) stay separate nodes. ``|`` and ``;`` (e.g. the ``||`` operator) are
+replaced as for every leaf name (see `behavior_graph.leaf_name`), since they
+separate edge keys and call paths.
+
+Statements run outside traced code are not recorded.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import re
+import time
+from functools import lru_cache
+
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from ses_intelligence.behavior_graph import intern_name, leaf_name
+from ses_intelligence.tracing import record_leaf_call
+
+
+SQL_PREFIX = "sql:"
+MAX_STATEMENT_LENGTH = 200
+# Hex digits of the full-statement hash kept on shortened statements.
+STATEMENT_HASH_LENGTH = 12
+
+_perf_counter_ns = time.perf_counter_ns
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?\b")
+_PLACEHOLDER = re.compile(r"%s|%\(\w+\)s|\?|(?<!:):\w+")
+_IN_LIST = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.IGNORECASE)
+_VALUES_LIST = re.compile(
+    r"\bVALUES\s*\(\s*\?(?:\s*,\s*\?)*\s*\)(?:\s*,\s*\(\s*\?(?:\s*,\s*\?)*\s*\))*",
+    re.IGNORECASE,
+)
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_sql(sql: str) -> str:
+    """Strip literals from `sql` so statements differing only in values
+    map to the same node.
+    """
+    sql = _STRING.sub("?", sql)
+    sql = _NUMBER.sub("?", sql)
+    sql = _PLACEHOLDER.sub("?", sql)
+    sql = _IN_LIST.sub("IN (...)", sql)
+    sql = _VALUES_LIST.sub("VALUES (...)", sql)
+    sql = _WHITESPACE.sub(" ", sql).strip()
+
+    if len(sql) > MAX_STATEMENT_LENGTH:
+        digest = hashlib.blake2b(
+            sql.encode("utf-8"), digest_size=STATEMENT_HASH_LENGTH // 2
+        ).hexdigest()
+        suffix = f"... #{digest}"
+        sql = sql[:MAX_STATEMENT_LENGTH - len(suffix)] + suffix
+    return sql
+
+
+@lru_cache(maxsize=4096)
+def statement_id(sql: str) -> int:
+    """Interned node id for a raw statement."""
+    return intern_name(SQL_PREFIX + leaf_name(normalize_sql(sql)))
+
+
+def _record_statement(execute, sql, params, many, context):
+    start = _perf_counter_ns()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        end = _perf_counter_ns()
+
+        rows = getattr(context.get("cursor"), "rowcount", -1)
+        record_leaf_call(
+            statement_id(sql), start, end, rows if rows and rows > 0 else None
+        )
+
+
+# ------------------------------------------------------------
+# INSTALLATION
+# ------------------------------------------------------------
+
+_enabled = False
+
+
+def _install(connection, **kwargs):
+    # Outermost, not appended: `connection.execute_wrapper()` pops the last
+    # wrapper on exit, so appending while one of those blocks is open (e.g.
+    # the block opens the connection) would pop ours and leave its own.
+    if _record_statement not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _record_statement)
+
+
+def enable_sql_attribution() -> None:
+    """Record SQL statements on all current and future connections."""
+    global _enabled
+
+    connection_created.connect(_install, dispatch_uid="ses_sql_attribution")
+    for connection in connections.all(initialized_only=True):
+        _install(connection)
+    _enabled = True
+
+
+def disable_sql_attribution() -> None:
+    global _enabled
+
+    connection_created.disconnect(dispatch_uid="ses_sql_attribution")
+    for connection in connections.all(initialized_only=True):
+        if _record_statement in connection.execute_wrappers:
+            connection.execute_wrappers.remove(_record_statement)
+    _enabled = False
+
+
+def sql_attribution_enabled() -> bool:
+    return _enabled
@@ -0,0 +1,2026 @@
+import asyncio
+import fcntl
+import http.client
+import io
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import time
+import tracemalloc
+import urllib.error
+import urllib.request
+from contextlib import redirect_stdout
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from ses_intelligence import auto_instrument, tracing
+from ses_intelligence.architecture_health.impact import EdgeImpactAnalyzer
+from ses_intelligence.architecture_health.risk_labels import RiskLabelGenerator
+from ses_intelligence.behavior_change.analysis import analyze_diff
+from ses_intelligence.behavior_change.diff import diff_snapshots
+from ses_intelligence.behavior_change.columnar import (
+    ColumnarHistory,
+    configure_columnar_history,
+)
+from ses_intelligence.behavior_change.history import (
+    SnapshotStore,
+    build_timing_history,
+    merge_edge_sketches,
+)
+from ses_intelligence.behavior_change.snapshot import BehaviorSnapshot
+from ses_intelligence.behavior_change.snapshot_log import SnapshotLog
+from ses_intelligence.behavior_graph import (
+    BehaviorGraph,
+    edge_key,
+    intern_name,
+)
+from ses_intelligence.benchmarks.edge_store import (
+    MAX_MEMORY_RATIO,
+    run as run_edge_store_benchmark,
+)
+from ses_intelligence.benchmarks.snapshot_store import run as run_store_benchmark
+from ses_intelligence.benchmarks.tracing_overhead import measure_overhead
+from ses_intelligence.cache import (
+    disable_cache_attribution,
+    enable_cache_attribution,
+)
+from ses_intelligence.call_paths import (
+    ROOT_PATH,
+    CallPathTrie,
+    configure_call_paths,
+    intern_path,
+)
+from ses_intelligence.collector import (
+    CollectorClient,
+    CollectorServer,
+    decode_edges,
+    encode_edges,
+)
+from ses_intelligence.http_client import (
+    disable_http_attribution,
+    enable_http_attribution,
+)
+from ses_intelligence.latency import NUM_BUCKETS, bucket_index
+from ses_intelligence.memory import configure_memory_tracking
+from ses_intelligence.middleware import BehaviorMiddleware
+from ses_intelligence.ml.features import FeatureExtractor
+from ses_intelligence.ml.pipeline import IntelligencePipeline
+from ses_intelligence.otlp import OTLPExporter
+from ses_intelligence.profiler import SamplingProfiler
+from ses_intelligence.request_log import RequestLog, configure_request_log
+from ses_intelligence.scheduler import (
+    SnapshotScheduler,
+    get_scheduler,
+    snapshots_scheduled,
+)
+from ses_intelligence.shared_graph import SharedEdgeRegion
+from ses_intelligence.sketch import DDSketch
+from ses_intelligence.sql import (
+    MAX_STATEMENT_LENGTH,
+    _record_statement,
+    disable_sql_attribution,
+    enable_sql_attribution,
+    normalize_sql,
+)
+from ses_intelligence.traces import (
+    KEEP_ERROR,
+    KEEP_NEW_EDGE,
+    KEEP_SLOW,
+    RequestTrace,
+    TailSampler,
+    TraceStore,
+    configure_traces,
+)
+from ses_intelligence.runtime_state import (
+    RuntimeSnapshot,
+    _reconstruct_snapshots,
+    clear_process_graph,
+    flush_thread_graph,
+    get_behavior_graph,
+    get_current_caller,
+    get_process_graph,
+)
+
+
+class TraceBehaviorFastPathTests(SimpleTestCase):
+    def setUp(self):
+        self.previous_mode = tracing.get_trace_mode()
+        tracing.set_trace_mode(tracing.TRACE_MODE_FAST)
+        clear_process_graph()
+
+    def tearDown(self):
+        tracing.set_trace_mode(self.previous_mode)
+        clear_process_graph()
+
+    def test_fast_mode_records_edges_without_output(self):
+        @tracing.trace_behavior
+        def child():
+            return 1
+
+        @tracing.trace_behavior
+        def parent():
+            return child() + child()
+
+        out = io.StringIO()
+        with redirect_stdout(out):
+            self.assertEqual(parent(), 2)
+
+        self.assertEqual(out.getvalue(), "")
+
+        summary = get_process_graph().summary()
+        self.assertEqual(len(summary), 1)
+        self.assertEqual(summary[0]["caller"], "parent")
+        self.assertEqual(summary[0]["callee"], "child")
+        self.assertEqual(summary[0]["calls"], 2)
+
+    def test_stack_unwinds_when_traced_function_raises(self):
+        @tracing.trace_behavior
+        def failing():
+            raise ValueError("boom")
+
+        with self.assertRaises(ValueError):
+            failing()
+
+        self.assertEqual(get_process_graph().summary(), [])
+        self.assertIsNone(get_current_caller())
+
+    def test_overhead_benchmark_reports_against_target(self):
+        result = measure_overhead(iterations=20_000, repeats=3)
+
+        self.assertEqual(
+            result["target_ns_per_call"],
+            tracing.FAST_PATH_OVERHEAD_TARGET_NS,
+        )
+        self.assertGreaterEqual(result["overhead_ns_per_call"], 0.0)
+        self.assertEqual(tracing.get_trace_mode(), tracing.TRACE_MODE_FAST)
+
+    def test_fast_path_meets_overhead_target(self):
+        # Shared machines run slow for seconds at a time, so retry for a
+        # while; the target must hold for one run, not for every run.
+        results = []
+        for _ in range(10):
+            results.append(
+                measure_overhead(iterations=20_000, repeats=5)[
+                    "overhead_ns_per_call"
+                ]
+            )
+            if results[-1] <= tracing.FAST_PATH_OVERHEAD_TARGET_NS:
+                break
+            time.sleep(0.2)
+        self.assertLessEqual(
+            min(results), tracing.FAST_PATH_OVERHEAD_TARGET_NS
+        )
+
+    def test_optional_features_leave_the_fast_path(self):
+        self.assertFalse(tracing._slow_path)
+        tracing.set_cpu_time(True)
+        try:
+            self.assertTrue(tracing._slow_path)
+        finally:
+            tracing.set_cpu_time(False)
+        self.assertFalse(tracing._slow_path)
+
+        configure_traces()
+        try:
+            self.assertTrue(tracing._slow_path)
+        finally:
+            configure_traces(enabled=False)
+        self.assertFalse(tracing._slow_path)
+
+
+class TraceBehaviorSamplingTests(SimpleTestCase):
+    def setUp(self):
+        self.previous_mode = tracing.get_trace_mode()
+        tracing.set_trace_mode(tracing.TRACE_MODE_FAST)
+        clear_process_graph()
+
+    def tearDown(self):
+        tracing.configure_sampling(enabled=False)
+        tracing.set_trace_mode(self.previous_mode)
+        clear_process_graph()
+
+    def test_sampled_counts_are_reweighted(self):
+        tracing.configure_sampling(
+            target_calls_per_second=1,
+            min_rate=0.1,
+            window_seconds=0,
+        )
+
+        @tracing.trace_behavior
+        def hot():
+            return None
+
+        @tracing.trace_behavior
+        def rare():
+            return None
+
+        @tracing.trace_behavior
+        def loop(n):
+            for _ in range(n):
+                hot()
+            rare()
+
+        loop(20_000)
+
+        rows = {
+            row["callee"]: row for row in get_process_graph().summary()
+        }
+
+        # The rare edge is new, so it is always recorded at weight 1.
+        self.assertEqual(rows["rare"]["calls"], 1)
+        self.assertAlmostEqual(rows["hot"]["calls"], 20_000, delta=4_000)
+
+    def test_per_function_rate_is_validated(self):
+        with self.assertRaises(ValueError):
+            tracing.trace_behavior(sample_rate=0)(lambda: None)
+
+
+class ProcessGraphAggregationTests(SimpleTestCase):
+    def setUp(self):
+        self.previous_mode = tracing.get_trace_mode()
+        tracing.set_trace_mode(tracing.TRACE_MODE_FAST)
+        clear_process_graph()
+
+    def tearDown(self):
+        tracing.set_trace_mode(self.previous_mode)
+        clear_process_graph()
+
+    def test_edges_from_worker_threads_are_merged(self):
+        @tracing.trace_behavior
+        def query():
+            return None
+
+        @tracing.trace_behavior
+        def handler():
+            query()
+
+        def worker():
+            handler()
+            # Request boundary: what BehaviorMiddleware does per request.
+            flush_thread_graph()
+
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        handler()
+
+        summary = get_process_graph().summary()
+        self.assertEqual(len(summary), 1)
+        self.assertEqual(summary[0]["calls"], 5)
+
+
+class SelfTimeTests(SimpleTestCase):
+    def setUp(self):
+        self.previous_mode = tracing.get_trace_mode()
+        tracing.set_trace_mode(tracing.TRACE_MODE_FAST)
+        clear_process_graph()
+
+    def tearDown(self):
+        tracing.set_trace_mode(self.previous_mode)
+        clear_process_graph()
+
+    def test_child_time_is_subtracted_from_self_time(self):
+        @tracing.trace_behavior
+        def query():
+            time.sleep(0.03)
+
+        @tracing.trace_behavior
+        def service():
+            time.sleep(0.01)
+            query()
+
+        @tracing.trace_behavior
+        def view():
+            service()
+
+        view()
+
+        rows = {row["callee"]: row for row in get_process_graph().summary()}
+        self.assertGreaterEqual(rows["service"]["avg_duration"], 0.04)
+        self.assertAlmostEqual(
+            rows["service"]["avg_self_duration"], 0.01, delta=0.008
+        )
+        self.assertAlmostEqual(
+            rows["query"]["avg_self_duration"],
+            rows["query"]["avg_duration"],
+        )
+
+        nodes = get_process_graph().node_summary()
+        self.assertEqual(nodes[0]["node"], "query")
+
+        signature = BehaviorSnapshot(get_process_graph()).edge_signature()
+        self.assertLess(
+            signature[("view", "service")]["avg_self_duration"],
+            signature[("view", "service")]["avg_duration"],
+        )
+
+
+class CpuTimeTests(SimpleTestCase):
+    def setUp(self):
+        self.previous_mode = tracing.get_trace_mode()
+        tracing.set_trace_mode(tracing.TRACE_MODE_FAST)
+        tracing.set_cpu_time(True)
+        clear_process_graph()
+
+    def tearDown(self):
+        tracing.set_cpu_time(False)
+        tracing.set_trace_mode(self.previous_mode)
+        clear_process_graph()
+
+    def test_io_bound_edge_has_high_io_wait_ratio(self):
+        @tracing.trace_behavior
+        def wait_on_io():
+            time.sleep(0.02)
+
+        @tracing.trace_behavior
+        def compute():
+            deadline = time.thread_time() + 0.02
+            while time.thread_time() < deadline:
+                pass
+
+        @tracing.trace_behavior
+        def view():
+            wait_on_io()
+            compute()
+
+        view()
+
+        signature = BehaviorSnapshot(get_process_graph()).edge_signature()
+        io = signature[("view", "wait_on_io")]
+        cpu = signature[("view", "compute")]
+        self.assertLess(io["avg_cpu_duration"], io["avg_duration"] / 4)
+        self.assertGreater(cpu["avg_cpu_duration"], cpu["avg_duration"] / 2)
+
+        snapshot = RuntimeSnapshot(graph=None, edge_signature=signature)
+        features = {
+            f["edge"]: f
+            for f in FeatureExtractor([snapshot]).extract_edge_features()
+        }
+        self.assertGreater(
+            features[("view", "wait_on_io")]["io_wait_ratio_latest"], 0.75
+        )
+        self.assertLess(
+            features[("view", "compute")]["io_wait_ratio_latest"], 0.5
+        )
+
+
+class MemoryAttributionTests(SimpleTestCase):
+    def setUp(self):
+        self.previous_mode = tracing.get_trace_mode()
+        tracing.set_trace_mode(tracing.TRACE_MODE_FAST)
+        configure_memory_tracking(sample_rate=1.0)
+        clear_process_graph()
+
+    def tearDown(self):
+        configure_memory_tracking(enabled=False)
+        tracemalloc.stop()
+        tracing.set_trace_mode(self.previous_mode)
+        clear_process_graph()
+
+    def _snapshot(self, size):
+        kept = []
+
+        @tracing.trace_behavior
+        def build_report():
+            scratch = bytearray(size)
+            kept.append(bytearray(size // 2))
+            del scratch
+
+        @tracing.trace_behavior
+        def view():
+            build_report()
+
+        clear_process_graph()
+        view()
+        return BehaviorSnapshot(get_process_graph())
+
+    def test_memory_regression_shows_up_in_diff(self):
+        old = self._snapshot(256 * 1024)
+        new = self._snapshot(4 * 1024 * 1024)
+
+        edge = ("view", "build_report")
+        old_meta = old.edge_signature()[edge]
+        self.assertGreaterEqual(old_meta["peak_bytes"], 256 * 1024)
+        self.assertGreaterEqual(old_meta["avg_net_bytes"], 128 * 1024)
+        self.assertLess(old_meta["avg_net_bytes"], 256 * 1024)
+
+        diff = diff_snapshots(old, new)
+        self.assertGreater(diff.memory_changes[edge]["delta_pct"], 100)
+
+        changes, _ = analyze_diff(diff)
+        self.assertIn(
+            "memory_regression", {change.type for change in changes}
+        )
+
+
+class SqlAttributionTests(SimpleTestCase):
+    databases = {"default"}
+
+    def setUp(self):
+        self.previous_mode = tracing.get_trace_mode()
+        tracing.set_trace_mode(tracing.TRACE_MODE_FAST)
+        enable_sql_attribution()
+        clear_process_graph()
+
+    def tearDown(self):
+        disable_sql_attribution()
+        tracing.set_trace_mode(self.previous_mode)
+        clear_process_graph()
+
+    def test_normalize_sql_strips_literals(self):
+        self.assertEqual(
+            normalize_sql("SELECT * FROM t WHERE id = 42 AND name = 'a''b'"),
+            "SELECT * FROM t WHERE id = ? AND name = ?",
+        )
+        self.assertEqual(
+            normalize_sql('SELECT "t"."id" FROM "t" WHERE "t"."id" IN (%s, %s, %s)'),
+            'SELECT "t"."id" FROM "t" WHERE "t"."id" IN (...)',
+        )
+        self.assertEqual(
+            normalize_sql("INSERT INTO t2 (a, b) VALUES (%s, %s), (%s, %s)"),
+            "INSERT INTO t2 (a, b) VALUES (...)",
+        )
+        self.assertEqual(normalize_sql("SELECT x::text"), "SELECT x::text")
+
+    def test_long_statements_keep_distinct_names(self):
+        columns = ", ".join(f'"auth_user"."column_{i}"' for i in range(20))
+        by_pk = f'SELECT {columns} FROM "auth_user" WHERE "auth_user"."id" = %s'
+        by_email = (
+            f'SELECT {columns} FROM "auth_user" WHERE "auth_user"."email" = %s'
+        )
+
+        names = {normalize_sql(by_pk), normalize_sql(by_email)}
+        self.assertEqual(len(names), 2)
+        for name in names:
+            self.assertEqual(len(name), MAX_STATEMENT_LENGTH)
+            self.assertTrue(name.startswith('SELECT "auth_user"."column_0"'))
+        self.assertEqual(normalize_sql(by_pk), normalize_sql(by_pk % 7))
+
+    def test_install_keeps_execute_wrapper_blocks_balanced(self):
+        def blocker(execute, sql, params, many, context):
+            return execute(sql, params, many, context)
+
+        connection.execute_wrappers.remove(_record_statement)
+        with connection.execute_wrapper(blocker):
+            # What opening the connection inside the block does.
+            connection_created.send(
+                sender=connection.__class__, connection=connection
+            )
+        self.assertNotIn(blocker, connection.execute_wrappers)
+        self.assertIn(_record_statement, connection.execute_wrappers)
+
+    def _snapshot(self, query_twice):
+        @tracing.trace_behavior
+        def load_profile():
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT %s", [1])
+                if query_twice:
+                    cursor.execute("SELECT %s + %s", [1, 2])
+
+        clear_process_graph()
+        load_profile()
+        load_profile()
+        return BehaviorSnapshot(get_process_graph())
+
+    def test_statements_become_callee_edges(self):
+        old = self._snapshot(query_twice=False)
+
+        edge = ("load_profile", "sql:SELECT ?")
+        meta = old.edge_signature()[edge]
+        self.assertEqual(meta["call_count"], 2)
+        self.assertGreater(meta["avg_duration"], 0.0)
+
+        new = self._snapshot(query_twice=True)
+        diff = diff_snapshots(old, new)
+        self.assertIn(("load_profile", "sql:SELECT ? + ?"), diff.new_edges)
+
+    def test_separators_in_statements_stay_out_of_edge_keys(self):
+        @tracing.trace_behavior
+        def load_label():
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT %s || %s; ", ["a", "b"])
+
+        load_label()
+        signature = BehaviorSnapshot(get_process_graph()).edge_signature()
+        self.assertIn(
+            ("load_label", "sql:SELECT ? \u00a6\u00a6 ?\u204f"), signature
+        )
+
+        # Records saved before names were escaped still split in two.
+        (snapshot,) = _reconstruct_snapshots([{
+            "snapshot_id": "legacy",
+            "edge_signature": {
+                "view|sql:SELECT a || b": {"call_count": 1, "avg_duration": 0.1}
+            },
+        }])
+        self.assertIn(("view", "sql:SELECT a || b"), snapshot.edge_signature)
+
+    def test_untraced_statements_are_ignored(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1")
+
+        self.assertTrue(get_process_graph().is_empty())
+
+
+class _StatusHandler(BaseHTTPRequestHandler):
+    # Responds with the status code given as the request path ("/500").
+    def do_GET(self):
+        self.send_response(int(self.path.strip("/")))
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class DependencyAttributionTests(SimpleTestCase):
+    def setUp(self):
+        self.previous_mode = tracing.get_trace_mode()
+        tracing.set_trace_mode(tracing.TRACE_MODE_FAST)
+        enable_cache_attribution()
+        enable_http_attribution()
+        cache.clear()
+        clear_process_graph()
+
+    def tearDown(self):
+        disable_cache_attribution()
+        disable_http_attribution()
+        cache.clear()
+        tracing.set_trace_mode(self.previous_mode)
+        clear_process_graph()
+
+    def test_cache_operations_record_hits_and_misses(self):
+        @tracing.trace_behavior
+        def load_settings():
+            value = cache.get("settings")
+            if value is None:
+                value = {"theme": "dark"}
+                cache.set("settings", value)
+            return value
+
+        load_settings()
+        self.assertEqual(load_settings(), {"theme": "dark"})
+        self.assertEqual(cache.get("absent", "fallback"), "fallback")
+
+        signature = BehaviorSnapshot(get_process_graph()).edge_signature()
+        get_meta = signature[("load_settings", "cache:default:get")]
+        self.assertEqual(get_meta["call_count"], 2)
+        self.assertEqual(get_meta["miss_rate"], 0.5)
+        set_meta = signature[("load_settings", "cache:default:set")]
+        self.assertEqual(set_meta["call_count"], 1)
+        self.assertNotIn("miss_rate", set_meta)
+
+    def test_outbound_requests_become_ranked_edges(self):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), _StatusHandler)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        host = f"127.0.0.1:{server.server_port}"
+
+        @tracing.trace_behavior
+        def sync_payments():
+            urllib.request.urlopen(f"http://{host}/200").close()
+            try:
+                urllib.request.urlopen(f"http://{host}/503")
+            except urllib.error.HTTPError:
+                pass
+
+        sync_payments()
+
+        snapshot = BehaviorSnapshot(get_process_graph())
+        edge = ("sync_payments", f"http:GET {host}")
+        meta = snapshot.edge_signature()[edge]
+        self.assertEqual(meta["call_count"], 2)
+        self.assertEqual(meta["miss_rate"], 0.5)
+
+        ranked = EdgeImpactAnalyzer(
+            snapshot.graph,
+            [{"edge": "|".join(edge), "instability_probability": 0.4}],
+        ).compute()
+        self.assertEqual(ranked[0]["edge"], "|".join(edge))
+        self.assertEqual(ranked[0]["usage_weight"], 1.0)
+
+
+class CallPathTests(SimpleTestCase):
+    def setUp(self):
+        self.previous_mode = tracing.get_trace_mode()
+        tracing.set_trace_mode(tracing.TRACE_MODE_FAST)
+        configure_call_paths()
+        clear_process_graph()
+
+    def tearDown(self):
+        configure_call_paths(enabled=False)
+        tracing.set_trace_mode(self.previous_mode)
+        clear_process_graph()
+
+    def test_same_function_is_split_by_call_path(self):
+        @tracing.trace_behavior
+        def save_user():
+            time.sleep(0.002)
+
+        @tracing.trace_behavior
+        def signup():
+            save_user()
+
+        @tracing.trace_behavior
+        def batch_job():
+            save_user()
+            save_user()
+
+        signup()
+        batch_job()
+        flush_thread_graph()
+
+        trie = CallPathTrie.from_graph(get_process_graph())
+        self.assertEqual(trie.paths[("signup", "save_user")][0], 1)
+        self.assertEqual(trie.paths[("batch_job", "save_user")][0], 2)
+        self.assertEqual(trie.paths[("signup",)][0], 1)
+
+        folded = dict(
+            line.rsplit(" ", 1) for line in trie.folded("count").splitlines()
+        )
+        self.assertEqual(folded["batch_job;save_user"], "2")
+
+        restored = CallPathTrie.from_dict(trie.to_dict())
+        self.assertEqual(restored.folded("count"), trie.folded("count"))
+
+    def test_prune_folds_rare_paths_into_parent_self_time(self):
+        trie = CallPathTrie({
+            ("view",): [1, 1.0, 0.1],
+            ("view", "hot"): [1, 0.899, 0.899],
+            ("view", "rare"): [1, 0.001, 0.0005],
+            ("view", "rare", "leaf"): [1, 0.0005, 0.0005],
+        })
+
+        pruned = trie.prune(min_share=0.01)
+
+        self.assertEqual(set(pruned.paths), {("view",), ("view", "hot")})
+        self.assertAlmostEqual(pruned.paths[("view",)][2], 0.101)
+        self.assertAlmostEqual(
+            sum(stats[2] for stats in pruned.paths.values()), 1.0
+        )
+
+    def test_snapshot_stores_call_paths(self):
+        @tracing.trace_behavior
+        def handler():
+            pass
+
+        handler()
+        flush_thread_graph()
+
+        snapshot = BehaviorSnapshot(get_process_graph())
+        self.assertIn(("handler",), snapshot.call_paths.paths)
+
+        clear_process_graph()
+        self.assertIsNone(BehaviorSnapshot(get_process_graph()).call_paths)
+
+
+def _auto_query():
+    return 1
+
+
+def _auto_handler():
+    return _auto_query() + _auto_query()
+
+
+@tracing.trace_behavior
+def _auto_view():
+    return _auto_handler()
+
+
+class AutoInstrumentationTests(SimpleTestCase):
+    def setUp(self):
+        self.previous_mode = tracing.get_trace_mode()
+        tracing.set_trace_mode(tracing.TRACE_MODE_FAST)
+        clear_process_graph()
+
+    def tearDown(self):
+        auto_instrument.disable_auto_instrumentation()
+        tracing.set_trace_mode(self.previous_mode)
+        clear_process_graph()
+
+    def test_allowlisted_functions_join_the_decorated_graph(self):
+        auto_instrument.enable_auto_instrumentation([__name__])
+        _auto_view()
+        _auto_view()
+        auto_instrument.disable_auto_instrumentation()
+
+        edges = {
+            (row["caller"], row["callee"]): row["calls"]
+            for row in get_process_graph().summary()
+        }
+        self.assertEqual(edges[("_auto_view", "_auto_handler")], 2)
+        self.assertEqual(edges[("_auto_handler", "_auto_query")], 4)
+        # The decorated view is recorded once, by its decorator.
+        self.assertNotIn(("_auto_view", "_auto_view"), edges)
+
+        # Nothing is recorded once disabled.
+        _auto_handler()
+        self.assertEqual(
+            {
+                (row["caller"], row["callee"]): row["calls"]
+                for row in get_process_graph().summary()
+            }[("_auto_handler", "_auto_query")],
+            4,
+        )
+
+
+def _sampled_query(release):
+    release.wait(5)
+
+
+def _sampled_handler(release):
+    _sampled_query(release)
+
+
+def _sampled_step(entered, release):
+    entered.set()
+    release.wait(5)
+
+
+def _sampled_steps(steps):
+    for entered, release in steps:
+        _sampled_step(entered, release)
+
+
+class SamplingProfilerTests(SimpleTestCase):
+    def setUp(self):
+        clear_process_graph()
+
+    def tearDown(self):
+        clear_process_graph()
+
+    def test_sampled_stacks_become_edges_with_time_shares(self):
+        profiler = SamplingProfiler([__name__])
+        release = threading.Event()
+        worker = threading.Thread(target=_sampled_handler, args=(release,))
+        worker.start()
+
+        try:
+            for _ in range(3):
+                profiler.sample_once(0.01)
+        finally:
+            release.set()
+            worker.join()
+
+        # The call ends once its frame is gone from the next sample.
+        profiler.sample_once(0.01)
+
+        summary = get_process_graph().summary()
+        self.assertEqual(len(summary), 1)
+        self.assertEqual(summary[0]["caller"], "_sampled_handler")
+        self.assertEqual(summary[0]["callee"], "_sampled_query")
+        self.assertEqual(summary[0]["calls"], 1)
+        self.assertAlmostEqual(summary[0]["avg_duration"], 0.03)
+
+        shares = profiler.time_shares()
+        self.assertAlmostEqual(
+            shares[("_sampled_handler", "_sampled_query")], 1.0
+        )
+
+    def test_back_to_back_calls_are_not_merged(self):
+        profiler = SamplingProfiler([__name__])
+        steps = [(threading.Event(), threading.Event()) for _ in range(2)]
+        worker = threading.Thread(target=_sampled_steps, args=(steps,))
+        worker.start()
+
+        try:
+            # Each call spans one sample; once the first returns, the
+            # second may get a frame at the same address.
+            for entered, release in steps:
+                self.assertTrue(entered.wait(5))
+                profiler.sample_once(0.01)
+                release.set()
+        finally:
+            for _, release in steps:
+                release.set()
+            worker.join()
+        profiler.sample_once(0.01)
+
+        summary = get_process_graph().summary()
+        self.assertEqual(len(summary), 1)
+        self.assertEqual(summary[0]["caller"], "_sampled_steps")
+        self.assertEqual(summary[0]["callee"], "_sampled_step")
+        self.assertEqual(summary[0]["calls"], 2)
+        self.assertAlmostEqual(summary[0]["avg_duration"], 0.01)
+
+    def test_cpu_budget_is_validated(self):
+        with self.assertRaises(ValueError):
+            SamplingProfiler([__name__], cpu_budget=0)
+
+
+def _publish_from_worker(path, calls):
+    region = SharedEdgeRegion(path, max_workers=4, max_edges=64)
+    graph = BehaviorGraph()
+    for _ in range(calls):
+        graph.add_call("handler", "query", 0.01)
+    region.publish(graph)
+    region.close()
+
+
+class SharedEdgeRegionTests(SimpleTestCase):
+    def test_worker_processes_merge_into_one_view(self):
+        context = multiprocessing.get_context("fork")
+
+        with TemporaryDirectory() as tmp:
+            path = Path(tmp) / "edges"
+            region = SharedEdgeRegion(path, max_workers=4, max_edges=64)
+            self.assertTrue(region.try_lead())
+
+            def run_workers(*calls):
+                workers = [
+                    context.Process(target=_publish_from_worker, args=(path, n))
+                    for n in calls
+                ]
+                for worker in workers:
+                    worker.start()
+                for worker in workers:
+                    worker.join()
+                    self.assertEqual(worker.exitcode, 0)
+
+            run_workers(2, 3)
+            window = region.drain_window().summary()
+            self.assertEqual(len(window), 1)
+            self.assertEqual(window[0]["calls"], 5)
+            self.assertAlmostEqual(window[0]["avg_duration"], 0.01)
+
+            # Only the change since the previous drain lands in a window.
+            run_workers(4)
+            self.assertEqual(region.drain_window().summary()[0]["calls"], 4)
+            self.assertEqual(region.to_graph().summary()[0]["calls"], 9)
+
+            region.close()
+
+    def test_windows_carry_every_measurement_and_call_paths(self):
+        with TemporaryDirectory() as tmp:
+            region = SharedEdgeRegion(
+                Path(tmp) / "edges", max_workers=2, max_edges=64
+            )
+            self.assertTrue(region.try_lead())
+
+            graph = BehaviorGraph()
+            for duration in (0.001, 0.002, 0.100):
+                graph.add_call("view", "query", duration, cpu_duration=0.001)
+            graph.add_memory(
+                intern_name("view"), intern_name("query"), 512, 2048
+            )
+            # Longest statement name `sql` produces, from a long caller.
+            statement = "sql:" + "x" * MAX_STATEMENT_LENGTH
+            graph.add_totals(
+                "app.views." + "v" * 80, statement, 2, 0.002, result_rows=7
+            )
+            graph.add_totals(
+                "view", "cache:get", 4, 0.004, outcome_count=4, miss_count=1
+            )
+            path_id = intern_path(
+                intern_path(ROOT_PATH, intern_name("view")),
+                intern_name("query"),
+            )
+            graph.add_path_totals(path_id, 3, 0.103, 0.103)
+
+            region.publish(graph)
+            region.publish(graph)
+            window = region.drain_window()
+
+            self.assertEqual(region.dropped_edges, 0)
+            edges = {edge.callee: edge for edge in window.iter_edges()}
+            self.assertEqual(edges["query"].count, 6)
+            self.assertAlmostEqual(edges["query"].cpu_duration, 0.006)
+            self.assertEqual(edges["query"].net_bytes, 1024)
+            self.assertEqual(edges["query"].peak_bytes, 2048)
+            self.assertGreater(edges["query"].sketch.quantile(0.99), 0.05)
+            self.assertEqual(edges[statement].result_rows, 14)
+            self.assertEqual(edges["cache:get"].miss_count, 2)
+            self.assertEqual(
+                CallPathTrie.from_graph(window).paths[("view", "query")],
+                [6, 0.206, 0.206],
+            )
+
+            # Peaks are kept only for edges memory-sampled in the window.
+            region.publish(graph)
+            self.assertEqual(
+                {e.callee: e for e in region.drain_window().iter_edges()}[
+                    "query"
+                ].peak_bytes,
+                2048,
+            )
+            cpu_only = BehaviorGraph()
+            cpu_only.add_call("view", "query", 0.001)
+            region.publish(cpu_only)
+            self.assertEqual(
+                next(region.drain_window().iter_edges()).peak_bytes, 0.0
+            )
+            region.close()
+
+    def test_full_region_drops_edges_instead_of_raising(self):
+        with TemporaryDirectory() as tmp:
+            region = SharedEdgeRegion(
+                Path(tmp) / "edges", max_workers=2, max_edges=4, name_size=32
+            )
+            graph = BehaviorGraph()
+            for n in range(6):
+                graph.add_call("caller", f"callee_{n}", 0.01)
+            graph.add_call("caller", "callee_" + "x" * 64, 0.01)
+
+            with self.assertLogs("ses_intelligence.shared_graph", "WARNING"):
+                region.publish(graph)
+            self.assertEqual(region.dropped_edges, 3)
+            self.assertEqual(len(region.to_graph().summary()), 4)
+
+            # Rejected edges are not probed again, only counted.
+            region.publish(graph)
+            self.assertEqual(region.dropped_edges, 6)
+            self.assertEqual(
+                sum(row["calls"] for row in region.to_graph().summary()), 8
+            )
+            region.close()
+
+
+class AsyncTraceBehaviorTests(SimpleTestCase):
+    def setUp(self):
+        self.previous_mode = tracing.get_trace_mode()
+        tracing.set_trace_mode(tracing.TRACE_MODE_FAST)
+        clear_process_graph()
+
+    def tearDown(self):
+        tracing.set_trace_mode(self.previous_mode)
+        clear_process_graph()
+
+    def test_concurrent_tasks_keep_separate_call_stacks(self):
+        @tracing.trace_behavior
+        async def fetch(delay):
+            await asyncio.sleep(delay)
+
+        @tracing.trace_behavior
+        async def view_a():
+            await fetch(0.02)
+
+        @tracing.trace_behavior
+        async def view_b():
+            await fetch(0.0)
+
+        async def main():
+            await asyncio.gather(view_a(), view_b())
+
+        asyncio.run(main())
+
+        rows = {
+            (row["caller"], row["callee"]): row
+            for row in get_process_graph().summary()
+        }
+
+        self.assertEqual(set(rows), {("view_a", "fetch"), ("view_b", "fetch")})
+        # The awaited time is measured, not just coroutine creation.
+        self.assertGreaterEqual(rows[("view_a", "fetch")]["avg_duration"], 0.015)
+
+
+class BehaviorGraphEdgeStoreTests(SimpleTestCase):
+    def test_columns_grow_and_merge_by_interned_id(self):
+        left = BehaviorGraph(capacity=2)
+        right = BehaviorGraph(capacity=2)
+
+        for i in range(10):
+            left.add_call("view", f"helper_{i}", 0.5)
+        right.add_call("view", "helper_3", 1.5)
+        right.add_call("job", "helper_3", 1.0)
+
+        left.merge(right)
+
+        graph = left.to_networkx()
+        self.assertEqual(graph.number_of_edges(), 11)
+        self.assertEqual(graph["view"]["helper_3"]["count"], 2)
+        self.assertAlmostEqual(graph["view"]["helper_3"]["total_duration"], 2.0)
+        self.assertTrue(left.has_edge("job", "helper_3"))
+        self.assertFalse(right.has_edge("view", "helper_0"))
+
+    def test_optional_measurements_survive_merge(self):
+        plain = BehaviorGraph()
+        plain.add_call("view", "query", 0.5, self_duration=0.2)
+        measured = BehaviorGraph()
+        measured.add_call("view", "query", 1.5, cpu_duration=1.0)
+        measured.add_call("view", "query", 0.5)
+        measured.add_totals("view", "cache", 2, 0.1, peak_bytes=64.0)
+        self.assertEqual(plain._optional.keys(), {"child_duration"})
+
+        plain.merge(measured)
+
+        edges = {edge.callee: edge for edge in plain.iter_edges()}
+        self.assertEqual(edges["query"].count, 3)
+        self.assertAlmostEqual(edges["query"].self_duration, 2.2)
+        self.assertEqual(edges["query"].cpu_count, 1)
+        self.assertAlmostEqual(edges["query"].cpu_duration, 1.0)
+        self.assertEqual(edges["query"].sketch.count, 3)
+        self.assertEqual(edges["cache"].peak_bytes, 64.0)
+        self.assertEqual(edges["cache"].cpu_count, 0.0)
+
+    def test_nanosecond_calls_match_second_calls(self):
+        by_ns = BehaviorGraph()
+        by_seconds = BehaviorGraph()
+        caller, callee = intern_name("view"), intern_name("helper")
+        for elapsed, child in ((0, 0), (150, 0), (8_191, 91), (250_000, 0)):
+            by_ns.add_call_ns(caller, callee, elapsed, child)
+            by_seconds.add_call_ids(
+                caller,
+                callee,
+                elapsed * 1e-9,
+                1.0,
+                (elapsed - child) * 1e-9,
+            )
+
+        (ns_edge,) = by_ns.iter_edges()
+        (seconds_edge,) = by_seconds.iter_edges()
+        self.assertEqual(ns_edge.count, 4)
+        self.assertAlmostEqual(
+            ns_edge.self_duration, seconds_edge.self_duration
+        )
+        self.assertEqual(
+            by_ns._bins(by_ns._rows[edge_key(caller, callee)]),
+            by_seconds._bins(by_seconds._rows[edge_key(caller, callee)]),
+        )
+
+    def test_benchmark_array_store_uses_less_memory(self):
+        result = run_edge_store_benchmark(edges=2_000, calls=2_000)
+
+        self.assertLessEqual(result["memory_ratio"], MAX_MEMORY_RATIO)
+
+
+class LatencyHistogramTests(SimpleTestCase):
+    def test_percentiles_expose_bimodal_tail(self):
+        fast = BehaviorGraph()
+        slow = BehaviorGraph()
+
+        for _ in range(95):
+            fast.add_call("view", "query", 0.002)
+        for _ in range(5):
+            slow.add_call("view", "query", 0.5)
+
+        fast.merge(slow)
+        row = fast.summary()[0]
+
+        self.assertAlmostEqual(row["avg_duration"], 0.0269, places=3)
+        self.assertLess(row["p50_duration"], 0.003)
+        self.assertGreater(row["p99_duration"], 0.4)
+
+    def test_snapshot_signature_persists_histogram(self):
+        graph = BehaviorGraph()
+        graph.add_call("view", "query", 0.010)
+
+        meta = BehaviorSnapshot(graph).edge_signature()[("view", "query")]
+
+        self.assertEqual(sum(meta["histogram"].values()), 1)
+        self.assertAlmostEqual(meta["p50_duration"], 0.010, delta=0.0025)
+
+    def test_histogram_is_derived_from_sketch_bins(self):
+        graph = BehaviorGraph()
+        for duration in (0.000003, 0.002, 0.002, 0.5):
+            graph.add_call("view", "query", duration)
+        # Totals without sketch bins (older collector peers) still land in
+        # the right buckets.
+        graph.add_totals("view", "query", 2, 0.004, histogram={
+            bucket_index(0.002): 2,
+        })
+
+        histogram = next(graph.iter_edges()).histogram
+        self.assertEqual(len(histogram), NUM_BUCKETS)
+        self.assertEqual(histogram[bucket_index(0.000003)], 1)
+        self.assertEqual(histogram[bucket_index(0.002)], 4)
+        self.assertEqual(histogram[bucket_index(0.5)], 1)
+
+
+class QuantileSketchTests(SimpleTestCase):
+    def test_merged_sketch_quantiles_within_relative_accuracy(self):
+        values = [0.001 * (1 + i % 500) for i in range(10_000)]
+        left, right = DDSketch(), DDSketch()
+
+        for i, value in enumerate(values):
+            (left if i % 2 else right).add(value)
+
+        merged = DDSketch.from_dict(left.to_dict()).merge(right)
+        exact_p99 = sorted(values)[int(0.99 * (len(values) - 1))]
+
+        self.assertEqual(merged.count, len(values))
+        self.assertLessEqual(
+            abs(merged.quantile(0.99) - exact_p99) / exact_p99,
+            merged.relative_accuracy,
+        )
+
+    def test_diff_can_compare_tail_quantile(self):
+        def snapshot(tail):
+            graph = BehaviorGraph()
+            for _ in range(98):
+                graph.add_call("view", "query", 0.010)
+            for _ in range(2):
+                graph.add_call("view", "query", tail)
+            return BehaviorSnapshot(graph)
+
+        old, new = snapshot(0.020), snapshot(0.100)
+
+        self.assertEqual(diff_snapshots(old, new).changed_edges, {})
+
+        changed = diff_snapshots(old, new, quantile=0.99).changed_edges
+        self.assertEqual(changed[("view", "query")]["metric"], "p99")
+        self.assertGreater(changed[("view", "query")]["delta_pct"], 100)
+
+        records = [
+            {
+                "snapshot_id": str(i),
+                "edge_signature": {
+                    "view|query": snap.edge_signature()[("view", "query")],
+                },
+            }
+            for i, snap in enumerate((old, new))
+        ]
+        week = merge_edge_sketches(records, "view|query")
+        self.assertEqual(week.count, 200)
+
+
+class _CollectingHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.lines = []
+
+    def emit(self, record):
+        self.lines.extend(record.getMessage().splitlines())
+
+
+@override_settings(ROOT_URLCONF="ses_core.urls")
+class BehaviorMiddlewareTests(SimpleTestCase):
+    def setUp(self):
+        self.handler = _CollectingHandler()
+        self.log = configure_request_log(handler=self.handler, flush_interval=60)
+
+    def tearDown(self):
+        configure_request_log(handler=logging.NullHandler())
+
+    def test_request_records_are_buffered_then_written_in_batches(self):
+        request = RequestFactory().get("/debug/graph/")
+        middleware = BehaviorMiddleware(lambda req: HttpResponse(status=204))
+
+        out = io.StringIO()
+        with redirect_stdout(out):
+            middleware(request)
+
+        self.assertEqual(out.getvalue(), "")
+        self.assertEqual(self.handler.lines, [])
+
+        self.log.flush()
+
+        record = json.loads(self.handler.lines[0])
+        self.assertEqual(record["request_id"], request.ses_request_id)
+        self.assertEqual(record["method"], "GET")
+        self.assertEqual(record["status"], 204)
+        self.assertIsInstance(record["duration_ns"], int)
+
+    def test_full_buffer_drops_and_counts_the_oldest_records(self):
+        handler = _CollectingHandler()
+        log = RequestLog(handler=handler, max_buffer=3, flush_interval=60)
+        try:
+            for i in range(5):
+                log.submit({"request_id": str(i)})
+            self.assertEqual(log.dropped, 2)
+
+            self.assertEqual(log.flush(), 3)
+            self.assertEqual(log.dropped, 2)
+        finally:
+            log.stop()
+
+        self.assertEqual(
+            [json.loads(line)["request_id"] for line in handler.lines],
+            ["2", "3", "4"],
+        )
+
+
+class RequestTraceTests(SimpleTestCase):
+    def setUp(self):
+        self.handler = _CollectingHandler()
+        configure_request_log(handler=self.handler, flush_interval=60)
+        self.previous_mode = tracing.get_trace_mode()
+        tracing.set_trace_mode(tracing.TRACE_MODE_FAST)
+        self.store = configure_traces(slowest_per_route=2, reservoir_size=0)
+
+    def tearDown(self):
+        configure_traces(enabled=False)
+        tracing.set_trace_mode(self.previous_mode)
+        configure_request_log(handler=logging.NullHandler())
+        clear_process_graph()
+
+    def test_middleware_links_spans_to_request_id(self):
+        @tracing.trace_behavior
+        def load_rows():
+            time.sleep(0.002)
+
+        @tracing.trace_behavior
+        def view(request):
+            load_rows()
+            return HttpResponse(status=200)
+
+        request = RequestFactory().get("/orders/")
+        BehaviorMiddleware(view)(request)
+
+        trace = self.store.get(request.ses_request_id)
+        self.assertIsNotNone(trace)
+
+        waterfall = trace.waterfall()
+        spans = [(s["callee"], s["depth"]) for s in waterfall["spans"]]
+        self.assertEqual(spans, [("view", 0), ("load_rows", 1)])
+        self.assertGreaterEqual(waterfall["spans"][1]["duration_ms"], 2)
+
+    def test_store_keeps_slowest_per_route(self):
+        def trace(request_id, route, duration_ms):
+            return RequestTrace(
+                request_id, route, "GET", "/", 200, 0, duration_ms * 10**6, []
+            )
+
+        for i, duration in enumerate((5, 50, 10, 40)):
+            self.store.add(trace(f"a{i}", "a/", duration))
+        self.store.add(trace("b0", "b/", 1))
+
+        slowest = [t["request_id"] for t in self.store.slowest("a/")]
+        self.assertEqual(slowest, ["a1", "a3"])
+        self.assertIsNone(self.store.get("a0"))
+        self.assertIsNotNone(self.store.get("b0"))
+        self.assertEqual(len(self.store), 3)
+
+    def test_reservoir_is_bounded(self):
+        store = TraceStore(slowest_per_route=0, reservoir_size=10, seed=1)
+        for i in range(1000):
+            store.add(RequestTrace(str(i), "r/", "GET", "/", 200, 0, i, []))
+
+        self.assertEqual(len(store), 10)
+        self.assertEqual(store.offered, 1000)
+
+
+class TailSamplingTests(SimpleTestCase):
+    @staticmethod
+    def _trace(request_id, duration_ms, status=200, spans=()):
+        return RequestTrace(
+            request_id,
+            "orders/",
+            "GET",
+            "/orders/",
+            status,
+            0,
+            int(duration_ms * 10**6),
+            list(spans),
+        )
+
+    def test_keeps_only_slow_failed_and_new_edge_requests(self):
+        store = TraceStore(
+            slowest_per_route=0,
+            reservoir_size=0,
+            tail_sampler=TailSampler(percentile=95, min_samples=20),
+        )
+
+        span = (1, 2, 0, 1)
+        store.add(self._trace("first", 10, spans=[span]))
+        for i in range(200):
+            store.add(self._trace(f"fast{i}", 10 + i % 5, spans=[span]))
+
+        store.add(self._trace("slow", 300, spans=[span]))
+        store.add(self._trace("failed", 10, status=500, spans=[span]))
+        store.add(self._trace("new", 10, spans=[span, (2, 3, 0, 1)]))
+
+        kept = {t["request_id"]: t["keep_reason"] for t in store.kept()}
+        self.assertEqual(kept["first"], KEEP_NEW_EDGE)
+        self.assertEqual(kept["slow"], KEEP_SLOW)
+        self.assertEqual(kept["failed"], KEEP_ERROR)
+        self.assertEqual(kept["new"], KEEP_NEW_EDGE)
+        self.assertLess(len(kept), 20)
+
+    def test_threshold_follows_recent_traffic(self):
+        sampler = TailSampler(percentile=90, min_samples=10, half_life=100)
+
+        for i in range(1000):
+            sampler.decide(self._trace(str(i), 10))
+        before = sampler.threshold("orders/")
+
+        for i in range(1000):
+            sampler.decide(self._trace(str(i), 100))
+
+        self.assertAlmostEqual(before, 0.010, delta=0.001)
+        self.assertAlmostEqual(sampler.threshold("orders/"), 0.100, delta=0.005)
+
+
+class OTLPExportTests(SimpleTestCase):
+    def setUp(self):
+        self.tmp = TemporaryDirectory()
+        self.path = Path(self.tmp.name) / "otlp.jsonl"
+        clear_process_graph()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+        clear_process_graph()
+
+    @staticmethod
+    def _trace(request_id="ab" * 16):
+        view, query = intern_name("view"), intern_name("query")
+        return RequestTrace(
+            request_id,
+            "orders/",
+            "GET",
+            "/orders/",
+            200,
+            1_000,
+            10_000,
+            [(view, query, 3_000, 5_000), (None, view, 2_000, 9_000)],
+        )
+
+    def test_traces_and_edges_are_written_as_otlp_json(self):
+        graph = get_behavior_graph()
+        graph.add_call("view", "query", 0.002)
+
+        exporter = OTLPExporter(str(self.path))
+        self.assertTrue(exporter.offer_trace(self._trace()))
+        self.assertEqual(exporter.flush(), 1)
+
+        traces, metrics = [
+            json.loads(line) for line in self.path.read_text().splitlines()
+        ]
+
+        spans = traces["resourceSpans"][0]["scopeSpans"][0]["spans"]
+        by_name = {span["name"]: span for span in spans}
+        self.assertEqual(len(spans), 3)
+        self.assertEqual({span["traceId"] for span in spans}, {"ab" * 16})
+        self.assertEqual(
+            by_name["query"]["parentSpanId"], by_name["view"]["spanId"]
+        )
+        self.assertEqual(
+            by_name["view"]["parentSpanId"], by_name["GET orders/"]["spanId"]
+        )
+
+        sums = {
+            metric["name"]: metric["sum"]["dataPoints"]
+            for metric in metrics["resourceMetrics"][0]["scopeMetrics"][0][
+                "metrics"
+            ]
+        }
+        self.assertEqual(sums["ses.edge.calls"][0]["asDouble"], 1.0)
+
+    def test_full_queue_drops_instead_of_blocking(self):
+        exporter = OTLPExporter(
+            str(self.path), max_queue=1, metrics_interval=None
+        )
+
+        self.assertTrue(exporter.offer_trace(self._trace()))
+        self.assertFalse(exporter.offer_trace(self._trace()))
+        self.assertEqual(exporter.dropped, 1)
+
+    def test_unexpected_send_errors_are_counted_as_failed(self):
+        exporter = OTLPExporter(
+            "http://collector.invalid:4318", metrics_interval=None
+        )
+        exporter.offer_trace(self._trace())
+
+        with patch(
+            "ses_intelligence.otlp.urllib.request.urlopen",
+            side_effect=http.client.BadStatusLine(""),
+        ), self.assertLogs("ses_intelligence.otlp", logging.ERROR):
+            self.assertEqual(exporter.flush(), 0)
+
+        self.assertEqual(exporter.failed, 1)
+
+
+def _append_from_worker(directory, worker, n):
+    log = SnapshotLog(directory, segment_bytes=200)
+    for i in range(n):
+        log.append({"snapshot_id": f"{worker}-{i}", "edge_signature": {}})
+
+
+class SnapshotLogTests(SimpleTestCase):
+    def setUp(self):
+        self.tmp = TemporaryDirectory()
+        self.directory = Path(self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _fill(self, log, n):
+        for i in range(n):
+            log.append({"snapshot_id": str(i), "edge_signature": {}})
+
+    def _ids(self, records):
+        return [int(record["snapshot_id"]) for record in records]
+
+    def test_reads_span_segments(self):
+        log = SnapshotLog(self.directory, segment_bytes=200)
+        self._fill(log, 40)
+
+        self.assertGreater(len(list(self.directory.glob("*.log"))), 3)
+        self.assertEqual(len(log), 40)
+        self.assertEqual(self._ids(log.read()), list(range(40)))
+        self.assertEqual(self._ids(log.read(7, 23)), list(range(7, 23)))
+        self.assertEqual(self._ids(log.tail(5)), list(range(35, 40)))
+        self.assertEqual(self._ids(log.tail(100)), list(range(40)))
+
+        # A second handle (another process) sees the same records.
+        reader = SnapshotLog(self.directory, segment_bytes=200)
+        self._fill(log, 1)
+        self.assertEqual(self._ids(reader.tail(2)), [39, 0])
+
+    def test_compact_drops_whole_segments(self):
+        log = SnapshotLog(self.directory, segment_bytes=200)
+        self._fill(log, 40)
+
+        removed = log.compact(keep_last=10)
+
+        self.assertGreater(removed, 0)
+        self.assertEqual(len(log), 40 - removed)
+        self.assertGreaterEqual(len(log), 10)
+        self.assertEqual(self._ids(log.tail(10)), list(range(30, 40)))
+        self.assertEqual(self._ids(log.read(0, 1)), [removed])
+
+    def test_reader_retries_when_segments_are_deleted_under_it(self):
+        log = SnapshotLog(self.directory, segment_bytes=200)
+        self._fill(log, 40)
+        reader = SnapshotLog(self.directory, segment_bytes=200)
+        self.assertEqual(len(reader), 40)
+
+        removed = log.compact(keep_last=10)
+
+        # The first refresh keeps the manifest read before the compaction.
+        refresh = reader._refresh
+        refreshes = []
+
+        def stale_then_fresh():
+            if refreshes:
+                refresh()
+            refreshes.append(None)
+
+        with patch.object(reader, "_refresh", stale_then_fresh):
+            self.assertEqual(self._ids(reader.read(0, 1)), [removed])
+        self.assertEqual(len(refreshes), 2)
+
+    def test_initial_records_are_written_before_the_manifest(self):
+        manifest = self.directory / "manifest.json"
+
+        def initial_records():
+            self.assertFalse(manifest.exists())
+            for i in range(30):
+                yield {"snapshot_id": str(i), "edge_signature": {}}
+
+        log = SnapshotLog(
+            self.directory, segment_bytes=200, initial_records=initial_records
+        )
+        self.assertTrue(log.created)
+        self.assertGreater(len(list(self.directory.glob("*.log"))), 3)
+
+        reopened = SnapshotLog(
+            self.directory,
+            initial_records=lambda: self.fail("log already exists"),
+        )
+        self.assertEqual(self._ids(reopened.read()), list(range(30)))
+
+    def test_torn_append_is_dropped_on_open(self):
+        log = SnapshotLog(self.directory)
+        self._fill(log, 3)
+        with open(self.directory / "segment-000000.log", "ab") as f:
+            f.write(b"\x00\x00\x01\x00{")
+
+        reopened = SnapshotLog(self.directory)
+        self._fill(reopened, 1)
+        self.assertEqual(self._ids(reopened.read()), [0, 1, 2, 0])
+
+    def test_concurrent_writers_do_not_interleave(self):
+        first = SnapshotLog(self.directory, segment_bytes=200)
+        second = SnapshotLog(self.directory, segment_bytes=200)
+        for i in range(10):
+            for n, log in enumerate((first, second)):
+                log.append({"snapshot_id": str(2 * i + n), "edge_signature": {}})
+        self.assertEqual(self._ids(first.read()), list(range(20)))
+
+        context = multiprocessing.get_context("fork")
+        workers = [
+            context.Process(
+                target=_append_from_worker, args=(self.directory, n, 50)
+            )
+            for n in range(4)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+            self.assertEqual(worker.exitcode, 0)
+
+        records = SnapshotLog(self.directory, segment_bytes=200).read()
+        self.assertEqual(len(records), 220)
+        for n in range(4):
+            self.assertEqual(
+                [r["snapshot_id"] for r in records
+                 if r["snapshot_id"].startswith(f"{n}-")],
+                [f"{n}-{i}" for i in range(50)],
+            )
+
+    def test_store_imports_legacy_snapshot_files(self):
+        for i in range(3):
+            record = {"snapshot_id": str(i), "edge_signature": {}}
+            (self.directory / f"2026-01-0{i + 1}T00-00-00.json").write_text(
+                json.dumps(record)
+            )
+
+        with patch(
+            "ses_intelligence.behavior_change.history.SNAPSHOT_DIR",
+            self.directory,
+        ), patch("ses_intelligence.behavior_change.history._log", None):
+            self.assertEqual(self._ids(SnapshotStore.load_all()), [0, 1, 2])
+            self.assertEqual(self._ids(SnapshotStore.load_tail(1)), [2])
+
+
+class ColumnarHistoryTests(SimpleTestCase):
+    def setUp(self):
+        self.tmp = TemporaryDirectory()
+        self.directory = Path(self.tmp.name)
+        # Start tiny so appends exercise growth in both dimensions.
+        self.patches = [
+            patch("ses_intelligence.behavior_change.columnar.INITIAL_ROWS", 2),
+            patch("ses_intelligence.behavior_change.columnar.INITIAL_EDGES", 2),
+        ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+        configure_columnar_history(enabled=False)
+        self.tmp.cleanup()
+
+    def _records(self):
+        records = []
+        for i in range(6):
+            signature = {
+                "view|query": {
+                    "call_count": 10 + i,
+                    "avg_duration": 0.010 * (1 + i % 3),
+                    "p50_duration": 0.008,
+                    "p95_duration": 0.020 + i * 0.001,
+                    "p99_duration": 0.040,
+                    "avg_cpu_duration": 0.004,
+                },
+                "view|render": {"call_count": 5, "avg_duration": 0.002},
+            }
+            if i >= 2:
+                signature["view|cache"] = {
+                    "call_count": 3,
+                    "avg_duration": 0.001 * i,
+                    "peak_bytes": 1024.0 * i,
+                }
+            if i == 4:
+                del signature["view|render"]
+            records.append(
+                {"snapshot_id": f"2026-01-0{i + 1}", "edge_signature": signature}
+            )
+        return records
+
+    def test_readers_match_json_records(self):
+        records = self._records()
+        ColumnarHistory(self.directory, writable=True).extend(records)
+        columns = ColumnarHistory(self.directory)
+        self.assertEqual(columns.rows, 6)
+
+        snapshots = [
+            RuntimeSnapshot(
+                graph=None,
+                edge_signature={
+                    tuple(key.split("|")): meta
+                    for key, meta in record["edge_signature"].items()
+                },
+                snapshot_id=record["snapshot_id"],
+            )
+            for record in records
+        ]
+        expected = {
+            row["edge"]: row
+            for row in FeatureExtractor(snapshots).extract_edge_features()
+        }
+        extractor = FeatureExtractor.from_columns(columns)
+        actual = {
+            row["edge"]: row for row in extractor.extract_edge_features()
+        }
+        self.assertEqual(expected.keys(), actual.keys())
+        for edge, row in expected.items():
+            for name, value in row.items():
+                if isinstance(value, float):
+                    self.assertAlmostEqual(actual[edge][name], value, msg=name)
+                else:
+                    self.assertEqual(actual[edge][name], value, msg=name)
+
+        self.assertEqual(
+            build_timing_history(columns), build_timing_history(records)
+        )
+        p95 = build_timing_history(columns, quantile=0.95)
+        self.assertEqual(
+            [point["quantile_duration"] for point in p95["view|query"]],
+            [0.020 + i * 0.001 for i in range(6)],
+        )
+        # No stored percentile: falls back to avg_duration.
+        self.assertEqual(
+            [point["quantile_duration"] for point in p95["view|render"]],
+            [0.002] * 5,
+        )
+
+        expected_labels = RiskLabelGenerator(records).generate()
+        actual_labels = RiskLabelGenerator(columns).generate()
+        self.assertEqual(
+            sorted(zip(map(tuple, expected_labels["features"]),
+                       expected_labels["labels"])),
+            sorted(zip(map(tuple, actual_labels["features"].tolist()),
+                       actual_labels["labels"].tolist())),
+        )
+
+    def test_edge_risk_reads_columns_instead_of_the_log(self):
+        records = self._records()
+        ColumnarHistory(self.directory, writable=True).extend(records)
+        columns = ColumnarHistory(self.directory)
+        pipeline = IntelligencePipeline()
+
+        expected = pipeline._compute_edge_risk(records)
+        actual = pipeline._compute_edge_risk(None, columns)
+
+        self.assertIn("current_edge_predictions", expected)
+        self.assertEqual(
+            sorted(
+                expected["current_edge_predictions"],
+                key=lambda row: row["edge"],
+            ),
+            sorted(
+                actual["current_edge_predictions"],
+                key=lambda row: row["edge"],
+            ),
+        )
+
+    def test_reader_follows_the_writer(self):
+        records = self._records()
+        writer = ColumnarHistory(self.directory, writable=True)
+        writer.extend(records[:1])
+        reader = ColumnarHistory(self.directory)
+        self.assertEqual(reader.rows, 1)
+
+        # Outgrows the initial capacity, so the writer replaces the files.
+        writer.extend(records[1:])
+        reader.refresh()
+
+        self.assertEqual(reader.rows, 6)
+        self.assertEqual(reader.edges, writer.edges)
+        self.assertEqual(
+            reader.column("call_count").tolist()[5][0], 15.0
+        )
+        with self.assertRaises(RuntimeError):
+            reader.append(records[0])
+
+    def test_store_writes_saved_snapshots(self):
+        with patch(
+            "ses_intelligence.behavior_change.history.SNAPSHOT_DIR",
+            self.directory,
+        ), patch(
+            "ses_intelligence.behavior_change.history._log", None
+        ), patch(
+            "ses_intelligence.behavior_change.history._columns", None
+        ), patch(
+            "ses_intelligence.behavior_change.history._column_reader", None
+        ), patch(
+            "ses_intelligence.behavior_change.history._latest", None
+        ):
+            graph = BehaviorGraph()
+            graph.add_call("view", "query", 0.010)
+            SnapshotStore.save(BehaviorSnapshot(graph))
+            # Readers never create the history.
+            self.assertIsNone(SnapshotStore.columnar())
+
+            configure_columnar_history()
+            graph.add_call("view", "render", 0.002)
+            SnapshotStore.save(BehaviorSnapshot(graph))
+
+            records = SnapshotStore.load_all()
+            # The saving process reads through its writable handle.
+            self.assertTrue(SnapshotStore.columnar().writable)
+
+        columns = ColumnarHistory(self.directory / "columnar")
+        self.assertEqual(columns.rows, 2)
+        self.assertEqual(
+            columns.snapshot_ids.tolist(),
+            [record["snapshot_id"] for record in records],
+        )
+        render = columns.edges.index("view|render")
+        self.assertEqual(columns.column("call_count")[:, render].tolist()[1], 1.0)
+        self.assertEqual(columns.present()[:, render].tolist(), [False, True])
+
+
+class SnapshotStoreTests(SimpleTestCase):
+    def setUp(self):
+        self.tmp = TemporaryDirectory()
+        self.patches = [
+            patch(
+                "ses_intelligence.behavior_change.history.SNAPSHOT_DIR",
+                Path(self.tmp.name),
+            ),
+            patch("ses_intelligence.behavior_change.history._latest", None),
+        ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+        self.tmp.cleanup()
+
+    def _snapshot(self, duration):
+        graph = BehaviorGraph()
+        graph.add_call("view", "query", duration)
+        graph.add_call("view", "render", duration)
+        return BehaviorSnapshot(graph)
+
+    def test_save_drifts_from_latest_without_rereading_history(self):
+        SnapshotStore.save(self._snapshot(0.010))
+
+        with patch.object(
+            SnapshotStore, "load_all", side_effect=AssertionError("re-read")
+        ):
+            SnapshotStore.save(self._snapshot(0.050))
+
+        first, second = SnapshotStore.load_all()
+        for edge_key in ("view|query", "view|render"):
+            before = first["edge_signature"][edge_key]["avg_duration"]
+            after = second["edge_signature"][edge_key]["avg_duration"]
+            self.assertAlmostEqual(after / before, 1.0, delta=0.0051)
+
+    def test_save_drifts_from_snapshots_other_processes_saved(self):
+        SnapshotStore.save(self._snapshot(0.010))
+        # Another process (its own log handle) saves in between.
+        other = SnapshotLog(Path(self.tmp.name))
+        other.append({
+            "snapshot_id": "other",
+            "edge_signature": {"view|query": {
+                "call_count": 1, "avg_duration": 0.050,
+            }},
+        })
+
+        SnapshotStore.save(self._snapshot(0.010))
+
+        latest = SnapshotStore.load_tail(1)[0]["edge_signature"]
+        self.assertAlmostEqual(
+            latest["view|query"]["avg_duration"] / 0.050, 1.0, delta=0.0051
+        )
+        # Edges the other snapshot lacks start again from their measurement.
+        self.assertAlmostEqual(
+            latest["view|render"]["avg_duration"] / 0.010, 1.0, delta=0.0051
+        )
+
+    def test_io_wait_ratio_uses_the_measured_duration(self):
+        SnapshotStore.save(self._snapshot(0.100))
+        graph = BehaviorGraph()
+        graph.add_call("view", "query", 0.010, cpu_duration=0.005)
+        SnapshotStore.save(BehaviorSnapshot(graph))
+
+        records = SnapshotStore.load_all()
+        meta = records[-1]["edge_signature"]["view|query"]
+        # avg_duration still drifts from the first snapshot's 0.1s.
+        self.assertGreater(meta["avg_duration"], 0.09)
+        self.assertAlmostEqual(meta["raw_avg_duration"], 0.010)
+
+        snapshots = [
+            RuntimeSnapshot(
+                graph=None,
+                edge_signature={
+                    tuple(key.split("|")): meta
+                    for key, meta in record["edge_signature"].items()
+                },
+            )
+            for record in records
+        ]
+        features = {
+            row["edge"]: row
+            for row in FeatureExtractor(snapshots).extract_edge_features()
+        }
+        self.assertAlmostEqual(
+            features[("view", "query")]["io_wait_ratio_latest"], 0.5
+        )
+
+        columns = ColumnarHistory(Path(self.tmp.name) / "columnar", True)
+        columns.extend(records)
+        features = {
+            row["edge"]: row
+            for row in FeatureExtractor.from_columns(
+                columns
+            ).extract_edge_features()
+        }
+        self.assertAlmostEqual(
+            features[("view", "query")]["io_wait_ratio_latest"], 0.5
+        )
+
+    def test_benchmark_save_cost_is_independent_of_history(self):
+        result = run_store_benchmark(snapshots=300, edges=200, saves=3)
+
+        self.assertEqual(result["snapshots"], 300)
+        self.assertLess(
+            result["history"]["save_ms"], result["empty"]["save_ms"] * 5 + 5
+        )
+
+
+def _hold_lock(path, held, release):
+    fd = os.open(path, os.O_RDWR | os.O_CREAT)
+    fcntl.flock(fd, fcntl.LOCK_EX)
+    held.set()
+    release.wait(5)
+    os.close(fd)
+
+
+class SnapshotSchedulerTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Keep the app's own scheduler from draining windows mid-test.
+        cls.app_scheduler = get_scheduler()
+        if cls.app_scheduler is not None:
+            cls.app_scheduler.stop()
+
+    @classmethod
+    def tearDownClass(cls):
+        if cls.app_scheduler is not None:
+            cls.app_scheduler.start()
+        super().tearDownClass()
+
+    def setUp(self):
+        clear_process_graph()
+        self.tmp = TemporaryDirectory()
+        self.patches = [
+            patch(
+                "ses_intelligence.behavior_change.history.SNAPSHOT_DIR",
+                Path(self.tmp.name),
+            ),
+            patch("ses_intelligence.behavior_change.store._previous_snapshot", None),
+        ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+        self.tmp.cleanup()
+        clear_process_graph()
+
+    def test_windows_are_persisted_and_regressions_shorten_interval(self):
+        scheduler = SnapshotScheduler(interval=60, min_interval=10)
+
+        self.assertIsNone(scheduler.run_once())
+
+        get_behavior_graph().add_call("view", "query", 0.010)
+        first = scheduler.run_once()
+        self.assertEqual(first["regressions"], 0)
+        self.assertEqual(scheduler.interval, 60)
+
+        get_behavior_graph().add_call("view", "query", 0.050)
+        second = scheduler.run_once()
+        self.assertEqual(second["regressions"], 1)
+        self.assertEqual(scheduler.interval, 30)
+
+        records = SnapshotStore.load_all()
+        self.assertEqual(len(records), 2)
+        self.assertEqual(records[0]["window_seconds"], 60)
+        # Tumbling windows: each snapshot only counts its own calls.
+        self.assertEqual(records[1]["edge_signature"]["view|query"]["call_count"], 1)
+
+    def test_only_the_lock_holder_persists_windows(self):
+        scheduler = SnapshotScheduler(interval=60, min_interval=10)
+
+        # Another process (its own open file description) holds the lock.
+        fd = os.open(
+            Path(self.tmp.name) / "scheduler.lock", os.O_RDWR | os.O_CREAT
+        )
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            get_behavior_graph().add_call("view", "query", 0.010)
+            self.assertIsNone(scheduler.run_once())
+            self.assertTrue(snapshots_scheduled())
+        finally:
+            os.close(fd)
+
+        # The window drained while another process led was handed over,
+        # and lands in the first window this process persists.
+        get_behavior_graph().add_call("view", "query", 0.010)
+        self.assertEqual(scheduler.run_once()["edges"], 1)
+        records = SnapshotStore.load_all()
+        self.assertEqual(len(records), 1)
+        self.assertEqual(
+            records[0]["edge_signature"]["view|query"]["call_count"], 2
+        )
+        self.assertEqual(
+            list((Path(self.tmp.name) / "handoff").iterdir()), []
+        )
+
+    def test_snapshots_scheduled_asks_the_lock_not_this_process(self):
+        lock_path = Path(self.tmp.name) / "scheduler.lock"
+        self.assertFalse(snapshots_scheduled())
+
+        # E.g. the gunicorn master, which started the scheduler before
+        # forking the worker serving this request.
+        context = multiprocessing.get_context("fork")
+        held, release = context.Event(), context.Event()
+        holder = context.Process(
+            target=_hold_lock, args=(lock_path, held, release)
+        )
+        holder.start()
+        try:
+            self.assertTrue(held.wait(5))
+            self.assertTrue(snapshots_scheduled())
+        finally:
+            release.set()
+            holder.join()
+        self.assertFalse(snapshots_scheduled())
+
+
+class CollectorTests(SimpleTestCase):
+    def setUp(self):
+        clear_process_graph()
+        self.tmp = TemporaryDirectory()
+        self.handler = _CollectingHandler()
+        self.server = CollectorServer(
+            Path(self.tmp.name) / "collector.sock",
+            request_log=RequestLog(handler=self.handler),
+        )
+        self.client = CollectorClient(self.server.socket_path)
+
+    def tearDown(self):
+        self.server.stop()
+        self.server.close()
+        self.tmp.cleanup()
+        clear_process_graph()
+
+    def test_worker_deltas_and_request_lines_reach_the_collector(self):
+        for duration in (0.010, 0.020):
+            get_behavior_graph().add_call("view", "query", duration)
+
+        self.assertEqual(self.client.push_window(), 1)
+        self.client.send_request_lines('{"request_id": "a"}\n{"request_id": "b"}')
+
+        # Same process here: start from an empty aggregate so only what the
+        # collector receives is counted.
+        clear_process_graph()
+
+        serving = threading.Thread(target=self.server.serve_forever)
+        serving.start()
+        try:
+            for _ in range(100):
+                if self.server.received == 2:
+                    break
+                threading.Event().wait(0.01)
+        finally:
+            self.server.stop()
+            serving.join()
+
+        summary = get_process_graph().summary()
+        self.assertEqual(summary[0]["calls"], 2)
+        self.assertAlmostEqual(summary[0]["avg_duration"], 0.015)
+        self.assertGreater(summary[0]["p95_duration"], 0.0)
+        self.assertEqual(len(self.handler.lines), 2)
+
+    def test_edge_records_carry_every_measurement(self):
+        graph = BehaviorGraph()
+        graph.add_call("view", "query", 0.010, cpu_duration=0.004)
+        graph.add_memory(intern_name("view"), intern_name("query"), 512, 2048)
+        graph.add_totals("view", "sql:SELECT ?", 2, 0.002, result_rows=7)
+        graph.add_totals(
+            "view", "cache:get", 4, 0.004, outcome_count=4, miss_count=1
+        )
+        path_id = intern_path(
+            intern_path(ROOT_PATH, intern_name("view")), intern_name("query")
+        )
+        graph.add_path_totals(path_id, 1, 0.010, 0.010)
+
+        messages = list(encode_edges(graph, max_datagram=200))
+        self.assertGreater(len(messages), 1)
+        received = BehaviorGraph()
+        for message in messages:
+            received.merge(decode_edges(message))
+
+        edges = {edge.callee: edge for edge in received.iter_edges()}
+        self.assertEqual(edges["query"].cpu_duration, 0.004)
+        self.assertEqual(edges["query"].net_bytes, 512)
+        self.assertEqual(edges["query"].peak_bytes, 2048)
+        self.assertEqual(edges["sql:SELECT ?"].result_rows, 7)
+        self.assertEqual(edges["cache:get"].miss_count, 1)
+        self.assertEqual(sum(edges["query"].histogram), 1)
+        self.assertEqual(
+            CallPathTrie.from_graph(received).paths[("view", "query")],
+            [1, 0.010, 0.010],
+        )
+
+    def test_sends_are_dropped_when_collector_is_down(self):
+        self.server.close()
+        get_behavior_graph().add_call("view", "query", 0.010)
+
+        self.assertEqual(self.client.push_window(), 0)
+        self.assertEqual(self.client.dropped, 1)
@@ -0,0 +1,430 @@
+"""Per-request traces (optional).
+
+Aggregated edges hide individual outliers: one 3 s request among thousands
+of 40 ms ones barely moves an average. With `configure_traces()` enabled,
+`BehaviorMiddleware` opens a span buffer for each request, every traced call
+made while serving it appends one span, and the finished request is offered
+to a bounded in-memory `TraceStore`.
+
+The store keeps, per route, the `slowest_per_route` slowest requests seen so
+far, plus a uniform reservoir sample of `reservoir_size` requests across all
+routes (so typical requests can be compared with the outliers). Anything
+else is discarded as soon as the request ends. `RequestTrace.waterfall()`
+renders one retained request as a span waterfall.
+
+With tail-based sampling (`configure_traces(tail_percentile=...)`), the
+decision to keep a request is made after it finishes, from its whole span
+buffer: a `TailSampler` keeps it when it is slower than the route's
+`tail_percentile` latency, when it failed (5xx), or when it contains a
+caller -> callee edge never seen before. Route latency comes from a live,
+exponentially decayed `DDSketch` per route, so the threshold follows the
+current traffic. Kept requests go to a bounded queue next to the
+slowest/reservoir slots, so trace storage grows with interesting traffic
+rather than with request rate.
+
+A span is ``(caller_id, callee_id, start_ns, end_ns)``. Nesting is not
+stored; the waterfall derives each span's depth from interval containment,
+which matches the call tree for synchronous code.
+
+Traces are per process; there is no cross-worker transport.
+"""
+
+from __future__ import annotations
+
+import heapq
+import itertools
+import random
+import threading
+from collections import deque
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Set, Tuple
+
+from ses_intelligence.behavior_graph import name_of
+from ses_intelligence.sketch import DDSketch
+
+
+class TraceConfig:
+    """Process-wide trace settings (see `configure_traces`)."""
+
+    def __init__(self):
+        self.enabled = False
+        self.max_spans = 2_000
+
+
+_config = TraceConfig()
+
+
+# ------------------------------------------------------------
+# SPAN BUFFERS
+# ------------------------------------------------------------
+
+class SpanBuffer:
+    """Spans of one in-flight request; appended to by the tracer."""
+
+    __slots__ = ("request_id", "spans", "dropped", "limit")
+
+    def __init__(self, request_id: str, limit: int):
+        self.request_id = request_id
+        self.spans: List[Tuple[Optional[int], int, int, int]] = []
+        self.dropped = 0
+        self.limit = limit
+
+
+current_trace: ContextVar[Optional[SpanBuffer]] = ContextVar(
+    "ses_current_trace", default=None
+)
+
+
+def begin_trace(request_id: str):
+    """Start collecting spans for `request_id` in the current context.
+
+    Returns a token for `end_trace`, or None when tracing is disabled.
+    """
+    if not _config.enabled:
+        return None
+    return current_trace.set(SpanBuffer(request_id, _config.max_spans))
+
+
+def end_trace(token) -> Optional[SpanBuffer]:
+    """Stop collecting and return the request's span buffer."""
+    if token is None:
+        return None
+
+    buffer = current_trace.get()
+    current_trace.reset(token)
+    return buffer
+
+
+def record_span(caller_id, callee_id, start_ns, end_ns) -> None:
+    buffer = current_trace.get()
+    if buffer is None:
+        return
+
+    if len(buffer.spans) < buffer.limit:
+        buffer.spans.append((caller_id, callee_id, start_ns, end_ns))
+    else:
+        buffer.dropped += 1
+
+
+# ------------------------------------------------------------
+# RETAINED TRACES
+# ------------------------------------------------------------
+
+class RequestTrace:
+    def __init__(
+        self,
+        request_id: str,
+        route: Optional[str],
+        method: str,
+        path: str,
+        status: int,
+        start_ns: int,
+        duration_ns: int,
+        spans: List[Tuple[Optional[int], int, int, int]],
+        dropped_spans: int = 0,
+    ):
+        self.request_id = request_id
+        self.route = route
+        self.method = method
+        self.path = path
+        self.status = status
+        self.start_ns = start_ns
+        self.duration_ns = duration_ns
+        self.spans = spans
+        self.dropped_spans = dropped_spans
+
+        # Number of retention slots (slowest heap, reservoir, tail queue)
+        # holding it.
+        self.holds = 0
+        # Why the tail sampler kept it, if it did.
+        self.keep_reason: Optional[str] = None
+
+    def summary(self) -> Dict:
+        data = {
+            "request_id": self.request_id,
+            "route": self.route,
+            "method": self.method,
+            "path": self.path,
+            "status": self.status,
+            "duration_ms": round(self.duration_ns / 1e6, 3),
+            "span_count": len(self.spans),
+        }
+        if self.keep_reason is not None:
+            data["keep_reason"] = self.keep_reason
+        return data
+
+    def waterfall(self) -> Dict:
+        """The request's spans ordered by start, with offsets and depth."""
+        ordered = sorted(self.spans, key=lambda span: (span[2], -span[3]))
+
+        rows = []
+        open_ends: List[int] = []
+        for caller_id, callee_id, start, end in ordered:
+            # Spans that ended before this one started are not its parents.
+            while open_ends and open_ends[-1] <= start:
+                open_ends.pop()
+
+            rows.append({
+                "caller": name_of(caller_id) if caller_id is not None else None,
+                "callee": name_of(callee_id),
+                "depth": len(open_ends),
+                "offset_ms": round((start - self.start_ns) / 1e6, 3),
+                "duration_ms": round((end - start) / 1e6, 3),
+            })
+            open_ends.append(end)
+
+        data = self.summary()
+        data["dropped_spans"] = self.dropped_spans
+        data["spans"] = rows
+        return data
+
+
+# ------------------------------------------------------------
+# TAIL-BASED SAMPLING
+# ------------------------------------------------------------
+
+KEEP_SLOW = "slow"
+KEEP_ERROR = "error"
+KEEP_NEW_EDGE = "new_edge"
+
+
+class TailSampler:
+    """Decides, once a request has finished, whether its trace is kept."""
+
+    def __init__(
+        self,
+        percentile: float = 99.0,
+        min_samples: int = 50,
+        half_life: int = 1_000,
+        refresh_every: int = 32,
+    ):
+        if not 0.0 < percentile < 100.0:
+            raise ValueError("percentile must be in (0, 100)")
+
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.half_life = half_life
+        self.refresh_every = refresh_every
+
+        # route -> [sketch, observations, cached threshold in seconds]
+        self._routes: Dict[Optional[str], List] = {}
+        self._seen_edges: Set[Tuple[Optional[int], int]] = set()
+
+    def threshold(self, route: Optional[str]) -> Optional[float]:
+        """Current latency threshold (seconds) for `route`, if warmed up."""
+        state = self._routes.get(route)
+        return state[2] if state is not None else None
+
+    def _observe(self, route: Optional[str], duration: float) -> Optional[float]:
+        state = self._routes.get(route)
+        if state is None:
+            state = self._routes[route] = [DDSketch(), 0, None]
+
+        # Compare against the distribution before this request joins it.
+        threshold = state[2]
+
+        sketch = state[0]
+        sketch.add(duration)
+        state[1] += 1
+        observed = state[1]
+
+        if observed % self.half_life == 0:
+            # Exponential decay: halve every bin so old traffic fades out.
+            sketch.bins = {
+                index: count / 2 for index, count in sketch.bins.items()
+            }
+
+        if observed >= self.min_samples and (
+            state[2] is None or observed % self.refresh_every == 0
+        ):
+            # Requests within the sketch's relative error of the percentile
+            # are not slower than it.
+            state[2] = sketch.percentile(self.percentile) * (
+                1 + sketch.relative_accuracy
+            )
+
+        return threshold
+
+    def decide(self, trace: "RequestTrace") -> Optional[str]:
+        """The reason to keep `trace`, or None to drop it."""
+        new_edge = False
+        seen = self._seen_edges
+        for caller_id, callee_id, _, _ in trace.spans:
+            edge = (caller_id, callee_id)
+            if edge not in seen:
+                seen.add(edge)
+                new_edge = True
+
+        threshold = self._observe(trace.route, trace.duration_ns / 1e9)
+
+        if trace.status >= 500:
+            return KEEP_ERROR
+        if new_edge:
+            return KEEP_NEW_EDGE
+        if threshold is not None and trace.duration_ns / 1e9 > threshold:
+            return KEEP_SLOW
+        return None
+
+
+# ------------------------------------------------------------
+# RETENTION
+# ------------------------------------------------------------
+
+class TraceStore:
+    def __init__(
+        self,
+        slowest_per_route: int = 10,
+        reservoir_size: int = 100,
+        seed: Optional[int] = None,
+        tail_sampler: Optional[TailSampler] = None,
+        max_kept: int = 1_000,
+    ):
+        if slowest_per_route < 0 or reservoir_size < 0 or max_kept < 0:
+            raise ValueError("Retention sizes must be non-negative")
+
+        self.slowest_per_route = slowest_per_route
+        self.reservoir_size = reservoir_size
+        self.tail_sampler = tail_sampler
+        self.max_kept = max_kept
+
+        # route -> min-heap of (duration_ns, sequence, trace)
+        self._slowest: Dict[Optional[str], List[Tuple[int, int, RequestTrace]]] = {}
+        self._reservoir: List[RequestTrace] = []
+        # Traces kept by the tail sampler, oldest first.
+        self._kept: deque = deque()
+        self._by_id: Dict[str, RequestTrace] = {}
+
+        self.offered = 0
+        self._sequence = itertools.count()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _hold(self, trace: RequestTrace) -> None:
+        trace.holds += 1
+        self._by_id[trace.request_id] = trace
+
+    def _release(self, trace: RequestTrace) -> None:
+        trace.holds -= 1
+        if trace.holds == 0:
+            self._by_id.pop(trace.request_id, None)
+
+    def add(self, trace: RequestTrace) -> bool:
+        """Offer a finished request; returns whether it was retained."""
+        with self._lock:
+            self.offered += 1
+
+            if self.tail_sampler is not None and self.max_kept:
+                trace.keep_reason = self.tail_sampler.decide(trace)
+                if trace.keep_reason is not None:
+                    if len(self._kept) >= self.max_kept:
+                        self._release(self._kept.popleft())
+                    self._kept.append(trace)
+                    self._hold(trace)
+
+            heap = self._slowest.setdefault(trace.route, [])
+            entry = (trace.duration_ns, next(self._sequence), trace)
+            if len(heap) < self.slowest_per_route:
+                heapq.heappush(heap, entry)
+                self._hold(trace)
+            elif heap and entry[0] > heap[0][0]:
+                self._release(heapq.heapreplace(heap, entry)[2])
+                self._hold(trace)
+
+            # Algorithm R: every offered request is in the reservoir with
+            # probability reservoir_size / offered.
+            if len(self._reservoir) < self.reservoir_size:
+                self._reservoir.append(trace)
+                self._hold(trace)
+            elif self.reservoir_size:
+                index = self._random.randrange(self.offered)
+                if index < self.reservoir_size:
+                    self._release(self._reservoir[index])
+                    self._reservoir[index] = trace
+                    self._hold(trace)
+
+            return trace.holds > 0
+
+    def get(self, request_id: str) -> Optional[RequestTrace]:
+        with self._lock:
+            return self._by_id.get(request_id)
+
+    def slowest(self, route: Optional[str] = None) -> List[Dict]:
+        """Summaries of the retained slowest requests, slowest first."""
+        with self._lock:
+            if route is not None:
+                heaps = [self._slowest.get(route, [])]
+            else:
+                heaps = list(self._slowest.values())
+            traces = [trace for heap in heaps for _, _, trace in heap]
+
+        traces.sort(key=lambda trace: trace.duration_ns, reverse=True)
+        return [trace.summary() for trace in traces]
+
+    def kept(self) -> List[Dict]:
+        """Summaries of the traces kept by the tail sampler, newest first."""
+        with self._lock:
+            traces = list(self._kept)
+        return [trace.summary() for trace in reversed(traces)]
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._slowest.clear()
+            self._reservoir.clear()
+            self._kept.clear()
+            self._by_id.clear()
+            self.offered = 0
+
+
+# ------------------------------------------------------------
+# PROCESS-WIDE STORE
+# ------------------------------------------------------------
+
+_store = TraceStore()
+
+
+def configure_traces(
+    enabled: bool = True,
+    slowest_per_route: int = 10,
+    reservoir_size: int = 100,
+    max_spans: int = 2_000,
+    tail_percentile: Optional[float] = None,
+    max_kept: int = 1_000,
+) -> TraceStore:
+    """Enable per-request traces and replace the process-wide store.
+
+    `tail_percentile` (e.g. 99.0) turns on tail-based sampling.
+    """
+    global _store
+
+    if max_spans < 1:
+        raise ValueError("max_spans must be >= 1")
+
+    tail_sampler = (
+        TailSampler(tail_percentile) if tail_percentile is not None else None
+    )
+    _store = TraceStore(
+        slowest_per_route,
+        reservoir_size,
+        tail_sampler=tail_sampler,
+        max_kept=max_kept,
+    )
+    _config.max_spans = max_spans
+    _config.enabled = enabled
+
+    # Imported here: tracing imports this module.
+    from ses_intelligence.tracing import refresh_fast_path
+
+    refresh_fast_path()
+
+    return _store
+
+
+def traces_enabled() -> bool:
+    return _config.enabled
+
+
+def get_trace_store() -> TraceStore:
+    return _store
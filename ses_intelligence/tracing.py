@@ -1,45 +1,463 @@
 # ses_intelligence/tracing.py
+"""Function-level behavior tracing.
 
+Two modes are supported:
+
+- ``debug`` (default): every traced call is echoed to stdout as
+  ``[SES-FUNC] caller -> callee duration``.
+- ``fast``: the production path. No per-call I/O; timing uses
+  ``time.perf_counter_ns`` and the per-thread state is bound once.
+
+Select the mode with ``set_trace_mode()`` or the ``SES_TRACE_MODE``
+environment variable.
+
+Sampling: ``configure_sampling()`` makes each traced function record only a
+fraction of its calls. Recorded calls are weighted by ``1 / rate`` so graph
+counts and average durations stay unbiased. The rate adapts per function:
+once a function exceeds ``target_calls_per_second`` its rate drops to keep
+roughly that many recordings per second, while a call that would create a
+caller -> callee edge not seen before is always recorded.
+
+Coroutine functions get an async wrapper that times the awaited execution
+rather than coroutine creation. The caller stack is a context variable, so
+each asyncio task traces its own caller -> callee chain.
+
+Overhead target: in ``fast`` mode, with no optional per-call feature on
+(sampling, CPU time, memory, call paths, traces), a traced call that records
+an edge should add no more than ``FAST_PATH_OVERHEAD_TARGET_NS`` nanoseconds
+over an untraced call. Those features are summed up in one module flag that
+their ``configure_*`` functions keep current (see `refresh_fast_path`), so
+the wrapper tests a single global before taking the inlined path. Check it
+with::
+
+    python -m ses_intelligence.benchmarks.tracing_overhead
+"""
+
+import inspect
+import os
+import random
 import time
 from functools import wraps
+from ses_intelligence.behavior_graph import EDGE_KEY_SHIFT, intern_name, name_of
+from ses_intelligence.call_paths import _config as _call_paths, record_frame
+from ses_intelligence.memory import (
+    _config as _memory,
+    begin_measure,
+    end_measure,
+)
+from ses_intelligence.traces import _config as _traces, record_span
 from ses_intelligence.runtime_state import (
-    get_behavior_graph,
-    push_call,
-    pop_call,
-    get_current_caller,
+    current_call,
+    flush_thread_graph,
+    get_thread_state,
 )
 
 
-def trace_behavior(func):
-    @wraps(func)
-    def wrapper(*args, **kwargs):
+TRACE_MODE_DEBUG = "debug"
+TRACE_MODE_FAST = "fast"
 
-        # Get parent BEFORE pushing current function
-        caller = get_current_caller()
-        callee = func.__name__
+# Per-call budget of the inlined fast path, self time and sketch bin
+# included; checked by the test suite and `benchmarks.tracing_overhead`.
+FAST_PATH_OVERHEAD_TARGET_NS = 2_000
+
+_perf_counter_ns = time.perf_counter_ns
+_thread_time_ns = time.thread_time_ns
+_state = get_thread_state()
+_debug = os.environ.get("SES_TRACE_MODE", TRACE_MODE_DEBUG) != TRACE_MODE_FAST
+_random = random.random
+
+# Process-wide set of edge keys (see `behavior_graph.edge_key`) already
+# recorded. Used by the sampler so a call on a never-seen edge is always kept.
+_seen_edges = set()
+
+# Code objects of functions wrapped by `trace_behavior`; auto-instrumentation
+# skips them so a decorated function is not recorded twice.
+traced_code = set()
+
+
+def set_trace_mode(mode: str) -> None:
+    """Switch between the ``debug`` and ``fast`` tracing paths."""
+    global _debug
+
+    if mode not in (TRACE_MODE_DEBUG, TRACE_MODE_FAST):
+        raise ValueError(f"Unknown trace mode: {mode!r}")
+
+    _debug = mode == TRACE_MODE_DEBUG
+    refresh_fast_path()
+
+
+def get_trace_mode() -> str:
+    return TRACE_MODE_DEBUG if _debug else TRACE_MODE_FAST
+
+
+# Whether synchronous traced calls also measure their thread CPU time
+# (`time.thread_time_ns`). Off by default: it costs two extra clock reads
+# per call. Async calls are never CPU-timed, since other tasks run on the
+# same thread while they await.
+_cpu_time = False
+
+
+def set_cpu_time(enabled: bool = True) -> None:
+    global _cpu_time
+    _cpu_time = enabled
+    refresh_fast_path()
+
+
+def cpu_time_enabled() -> bool:
+    return _cpu_time
+
+
+# True when debug mode or any optional per-call feature is on, so the
+# synchronous wrapper checks one global instead of every feature's config.
+_slow_path = True
+
+
+def refresh_fast_path() -> None:
+    """Recompute `_slow_path`; called by every setting it depends on."""
+    global _slow_path
+    _slow_path = (
+        _debug
+        or _cpu_time
+        or _sampling.enabled
+        or _memory.enabled
+        or _call_paths.enabled
+        or _traces.enabled
+    )
+
+
+# ------------------------------------------------------------
+# SAMPLING
+# ------------------------------------------------------------
+
+class SamplingConfig:
+    """Process-wide sampling settings (see `configure_sampling`)."""
+
+    def __init__(self):
+        self.enabled = False
+        self.default_rate = 1.0
+        self.target_calls_per_second = 1000.0
+        self.min_rate = 0.001
+        self.window_ns = 1_000_000_000
+
+
+_sampling = SamplingConfig()
+refresh_fast_path()
+
+
+def configure_sampling(
+    enabled: bool = True,
+    default_rate: float = 1.0,
+    target_calls_per_second: float = 1000.0,
+    min_rate: float = 0.001,
+    window_seconds: float = 1.0,
+) -> None:
+    """Enable or tune adaptive per-function sampling.
+
+    `default_rate` is the base fraction of calls recorded for functions that
+    did not pass their own `sample_rate` to `trace_behavior`. The effective
+    rate never exceeds the base rate and never drops below `min_rate`.
+    """
+    if not 0.0 < default_rate <= 1.0:
+        raise ValueError("default_rate must be in (0, 1]")
+    if not 0.0 < min_rate <= 1.0:
+        raise ValueError("min_rate must be in (0, 1]")
+
+    _sampling.enabled = enabled
+    _sampling.default_rate = default_rate
+    _sampling.target_calls_per_second = float(target_calls_per_second)
+    _sampling.min_rate = min_rate
+    _sampling.window_ns = int(window_seconds * 1e9)
+    refresh_fast_path()
+
+
+class AdaptiveSampler:
+    """Per-function sampling rate that tracks the observed call rate.
+
+    Counters are updated without a lock; a lost increment under contention
+    only nudges the next rate estimate.
+    """
+
+    __slots__ = ("base_rate", "rate", "window_start", "window_calls")
+
+    def __init__(self, base_rate=None):
+        self.base_rate = base_rate
+        self.rate = base_rate or _sampling.default_rate
+        self.window_start = 0
+        self.window_calls = 0
+
+    def current_rate(self, now: int) -> float:
+        self.window_calls += 1
+        elapsed = now - self.window_start
+
+        if elapsed >= _sampling.window_ns:
+            base = self.base_rate or _sampling.default_rate
+            calls_per_second = self.window_calls * 1e9 / elapsed
+            target = _sampling.target_calls_per_second
 
-        graph = get_behavior_graph()
+            if calls_per_second <= target:
+                self.rate = base
+            else:
+                self.rate = max(
+                    _sampling.min_rate,
+                    min(base, target / calls_per_second),
+                )
 
-        # Push current function onto stack
-        push_call(callee)
+            self.window_start = now
+            self.window_calls = 0
 
-        start = time.time()
-        result = func(*args, **kwargs)
-        duration = time.time() - start
+        return self.rate
 
-        # Record edge if parent exists
-        if caller:
-            graph.add_call(
-                caller=caller,
-                callee=callee,
-                duration=duration
+
+# ------------------------------------------------------------
+# DECORATOR
+# ------------------------------------------------------------
+
+def _sample_weight(sampler, key, now):
+    """Return the weight to record this call with, or 0.0 to skip it."""
+    if not _sampling.enabled:
+        return 1.0
+
+    rate = sampler.current_rate(now)
+    if rate >= 1.0 or key not in _seen_edges:
+        return 1.0
+
+    if _random() >= rate:
+        return 0.0
+
+    return 1.0 / rate
+
+
+def record_call(
+    caller_id,
+    callee_id,
+    key,
+    start,
+    end,
+    weight,
+    child_ns=0,
+    frame=None,
+    cpu_ns=None,
+    memory=None,
+):
+    """Record one finished call; shared with `auto_instrument`.
+
+    `child_ns` is the time spent in traced callees. Concurrent child tasks
+    can add up to more than the call itself, so self time is clamped at 0.
+    `frame` is the call's frame, needed for call-path aggregation,
+    `cpu_ns` its thread CPU time and `memory` its ``(net, peak)`` allocated
+    bytes, when measured.
+    """
+    duration = (end - start) / 1e9
+
+    if frame is not None and _call_paths.enabled:
+        record_frame(_state.graph, frame, end - start, weight)
+    if _traces.enabled:
+        record_span(caller_id, callee_id, start, end)
+
+    # Record edge if parent exists
+    if caller_id is not None:
+        state = _state
+
+        if weight == 1.0 and _sampling.enabled:
+            _seen_edges.add(key)
+        self_duration = max(0, end - start - child_ns) / 1e9
+        state.graph.add_call_ids(
+            caller_id,
+            callee_id,
+            duration,
+            weight,
+            self_duration,
+            cpu_ns / 1e9 if cpu_ns is not None else None,
+        )
+        if memory is not None:
+            state.graph.add_memory(caller_id, callee_id, *memory)
+
+        if end >= state.next_flush_ns:
+            flush_thread_graph()
+
+    if _debug:
+        caller = name_of(caller_id) if caller_id is not None else None
+        print(f"[SES-FUNC] {caller} -> {name_of(callee_id)} {duration:.4f}s")
+
+
+def record_leaf_call(callee_id, start, end, result_rows=None, hit=None):
+    """Record a call into an untraced dependency (a SQL statement, a cache
+    operation, an outbound HTTP request) as a callee of the current traced
+    call. `hit` is the call's outcome, when it has one (a cache hit, a
+    successful request). Returns False, recording nothing, outside traced
+    code.
+    """
+    parent = current_call.get()
+    if parent is None:
+        return False
+
+    elapsed = end - start
+    parent[2] += elapsed
+    caller_id = parent[0]
+
+    state = _state
+    state.graph.add_call_ids(caller_id, callee_id, elapsed / 1e9)
+    if result_rows:
+        state.graph.add_result_rows(caller_id, callee_id, result_rows)
+    if hit is not None:
+        state.graph.add_outcome(caller_id, callee_id, hit)
+
+    if _call_paths.enabled:
+        record_frame(state.graph, [callee_id, parent, 0, None], elapsed)
+    if _traces.enabled:
+        record_span(caller_id, callee_id, start, end)
+    if _debug:
+        print(
+            f"[SES-FUNC] {name_of(caller_id)} -> {name_of(callee_id)} "
+            f"{elapsed / 1e9:.4f}s"
+        )
+
+    if end >= state.next_flush_ns:
+        flush_thread_graph()
+    return True
+
+
+def trace_behavior(func=None, *, sample_rate=None):
+    """Trace caller -> callee edges for `func`.
+
+    Usable bare (``@trace_behavior``) or with a per-function base sampling
+    rate (``@trace_behavior(sample_rate=0.1)``), which applies once sampling
+    is enabled via `configure_sampling`. Works on plain and ``async def``
+    functions.
+    """
+    if func is None:
+        return lambda f: trace_behavior(f, sample_rate=sample_rate)
+
+    if sample_rate is not None and not 0.0 < sample_rate <= 1.0:
+        raise ValueError("sample_rate must be in (0, 1]")
+
+    callee_id = intern_name(func.__name__)
+    sampler = AdaptiveSampler(sample_rate)
+
+    code = getattr(func, "__code__", None)
+    if code is not None:
+        traced_code.add(code)
+
+    if inspect.iscoroutinefunction(func):
+
+        @wraps(func)
+        async def async_wrapper(*args, **kwargs):
+
+            parent = current_call.get()
+            if parent is not None:
+                caller_id = parent[0]
+                key = (caller_id << EDGE_KEY_SHIFT) | callee_id
+            else:
+                caller_id = key = None
+
+            start = _perf_counter_ns()
+            weight = _sample_weight(sampler, key, start)
+
+            frame = [callee_id, parent, 0, None]
+            token = current_call.set(frame)
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                end = _perf_counter_ns()
+                current_call.reset(token)
+
+                if parent is not None:
+                    parent[2] += end - start
+
+                if weight:
+                    record_call(
+                        caller_id,
+                        callee_id,
+                        key,
+                        start,
+                        end,
+                        weight,
+                        frame[2],
+                        frame,
+                    )
+
+        return async_wrapper
+
+    def traced_call(*args, **kwargs):
+
+        # Get parent BEFORE pushing current function
+        parent = current_call.get()
+        if parent is not None:
+            caller_id = parent[0]
+            key = (caller_id << EDGE_KEY_SHIFT) | callee_id
+        else:
+            caller_id = key = None
+
+        start = _perf_counter_ns()
+        weight = (
+            _sample_weight(sampler, key, start)
+            if _sampling.enabled else 1.0
+        )
+
+        cpu_start = _thread_time_ns() if _cpu_time else None
+        memory_start = begin_measure() if _memory.enabled else None
+
+        # Push current function onto stack. Unsampled calls still push so
+        # nested calls see the right caller; they just skip recording.
+        frame = [callee_id, parent, 0, None]
+        token = current_call.set(frame)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            end = _perf_counter_ns()
+            cpu_ns = (
+                _thread_time_ns() - cpu_start if cpu_start is not None else None
             )
+            memory = (
+                end_measure(memory_start) if memory_start is not None else None
+            )
+            current_call.reset(token)
+
+            if parent is not None:
+                # This call is child time of the caller, recorded or not.
+                parent[2] += end - start
+
+            if weight:
+                record_call(
+                    caller_id,
+                    callee_id,
+                    key,
+                    start,
+                    end,
+                    weight,
+                    frame[2],
+                    frame,
+                    cpu_ns,
+                    memory,
+                )
 
-        pop_call()
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        if _slow_path:
+            return traced_call(*args, **kwargs)
 
-        print(f"[SES-FUNC] {caller} -> {callee} {duration:.4f}s")
+        # Common case inlined: fast mode with no optional feature on, so
+        # every call with a caller records one unweighted edge. Nested sync
+        # calls never overlap, so self time cannot go negative here.
+        parent = current_call.get()
+        frame = [callee_id, parent, 0, None]
+        start = _perf_counter_ns()
+        token = current_call.set(frame)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            end = _perf_counter_ns()
+            current_call.reset(token)
 
-        return result
+            if parent is not None:
+                elapsed = end - start
+                parent[2] += elapsed
+                state = _state
+                state.graph.add_call_ns(
+                    parent[0], callee_id, elapsed, frame[2]
+                )
+                if end >= state.next_flush_ns:
+                    flush_thread_graph()
 
     return wrapper
 
@@ -50,9 +468,19 @@ def get_edge_features():
     This function is used by the Django API layer.
     """
     # Lazy import to avoid heavy imports at Django startup.
+    from ses_intelligence.behavior_change.columnar import (
+        columnar_history_enabled,
+    )
+    from ses_intelligence.behavior_change.history import SnapshotStore
     from ses_intelligence.runtime_state import get_runtime_snapshots
     from ses_intelligence.ml.features import FeatureExtractor
 
+    if columnar_history_enabled():
+        columns = SnapshotStore.columnar()
+        if columns is not None and columns.rows:
+            extractor = FeatureExtractor.from_columns(columns)
+            return extractor.build_feature_matrix().get("edges", [])
+
     snapshots = get_runtime_snapshots()
     if not snapshots:
         return []